@@ -0,0 +1,137 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+    ユーザーIDごとに User を保持する、プロセス内の TTL 付き LRU キャッシュ
+    (トークンの user_id クレームは文字列なので、キーは str に揃える)
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else getattr(settings, 'AUTH_USER_CACHE_TTL', 60)
+
+    @property
+    def max_size(self):
+        return self._max_size if self._max_size is not None else getattr(settings, 'AUTH_USER_CACHE_SIZE', 1024)
+
+    def get(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        # 呼び出し側がリクエスト中に属性を書き換えても、キャッシュ内の User に影響しないようにする
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        user_id = str(user_id)
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, copy.copy(user))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# プロセス内で共有するキャッシュ
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication と同じ検証を行い、User をプロセス内のキャッシュから返す認証クラス
+    (キャッシュにあればデータベースに問い合わせない)
+
+    User が保存・削除されたら (無効化・パスワード変更を含む) シグナルでキャッシュから削除する。
+    他のワーカープロセスでの変更と QuerySet.update() での変更はシグナルが届かないので、
+    AUTH_USER_CACHE_TTL 秒 (デフォルト60秒) 経ってキャッシュが切れるまで反映されない。
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None:
+            user = user_cache.get(user_id)
+            if user is not None and not self._is_revoked(validated_token, user):
+                return user
+
+        # キャッシュに無い (または失効チェックに該当した) 場合はデータベースから取得する
+        # (ユーザーが存在しない・無効・パスワード変更済みのチェックは親クラスに任せる)
+        user = super().get_user(validated_token)
+        user_cache.set(user_id, user)
+        return user
+
+    async def aauthenticate(self, request):
+        """
+        authenticate の非同期版 (DRF を通らない ASGI ビュー用)
+        認証情報が無ければ None、あれば (user, validated_token) を返す
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        # トークンの検証は CPU だけで完結する
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        """
+        get_user の非同期版 (キャッシュに無い場合は非同期 ORM で取得する)
+        """
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(user_id)
+        if user is not None and not self._is_revoked(validated_token, user):
+            return user
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if self._is_revoked(validated_token, user):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        user_cache.set(user_id, user)
+        return user
+
+    def _is_revoked(self, validated_token, user):
+        """
+        CHECK_REVOKE_TOKEN が有効な場合、パスワード変更前に発行されたトークンなら True
+        """
+        if not api_settings.CHECK_REVOKE_TOKEN:
+            return False
+        return validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
@@ -0,0 +1,34 @@
+"""
+パスワードのハッシュ化を複数のプロセスで行うための関数 (accounts.provisioning から使う)
+
+spawn で起動したプロセスは、Django の初期化前にこのモジュールを読み込むので、モデルを import しないこと。
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def setup_worker():
+    # パスワードのハッシャーは設定 (PASSWORD_HASHERS) を使うので、先に初期化する
+    import django
+    django.setup()
+
+
+def hash_password(password):
+    from django.contrib.auth.hashers import make_password
+    return make_password(password)
+
+
+def hash_passwords(passwords, workers):
+    """
+    hash_password を workers 個のプロセスで並列に実行し、同じ順序のハッシュのリストを返す
+    (PBKDF2 は CPU を使い切る処理なので、スレッドではなくプロセスで分ける)
+    """
+    workers = min(workers or os.cpu_count() or 1, len(passwords))
+    if workers <= 1:
+        return [hash_password(password) for password in passwords]
+    # fork はスレッドを使うサーバーのワーカーから安全に呼べないため spawn にする
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=setup_worker,
+    ) as pool:
+        return list(pool.map(hash_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
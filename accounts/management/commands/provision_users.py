@@ -0,0 +1,58 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.provisioning import ProvisioningError, check_roster, parse_roster, provision_users
+
+
+class Command(BaseCommand):
+    help = (
+        '名簿の CSV (username 列は必須。password / email / first_name / last_name は任意) からユーザーをまとめて作成します。'
+        'パスワードのハッシュ化は複数のプロセスで並列に行います。1件でも不正な行があれば何も作成しません。'
+        'パスワードを空にした行は生成したパスワードを、--tokens を付けると JWT も --output の CSV に書き出します。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='名簿の CSV ファイル')
+        parser.add_argument('--output', '-o', default='-', help='作成したユーザーの CSV の出力先 (デフォルト: 標準出力)')
+        parser.add_argument('--tokens', action='store_true', help='JWT (access / refresh) を発行して出力する')
+        parser.add_argument('--workers', type=int, help='ハッシュ化に使うプロセス数 (デフォルト: PROVISION_HASH_WORKERS か CPU 数)')
+        parser.add_argument('--dry-run', action='store_true', help='確認だけを行い、作成しない')
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError('--workers には1以上を指定してください。')
+        try:
+            with open(options['csv_file'], encoding='utf-8', newline='') as f:
+                rows = check_roster(parse_roster(f.read()))
+        except FileNotFoundError:
+            raise CommandError(f"ファイルが見つかりません: {options['csv_file']}")
+        except ProvisioningError as e:
+            for line, message in e.errors:
+                self.stderr.write(f'{line} 行目: {message}')
+            raise CommandError(str(e))
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(rows)} 件のユーザーを作成できます (dry-run)。')
+            return
+
+        started = time.monotonic()
+        try:
+            created = provision_users(rows, issue_tokens=options['tokens'], workers=options['workers'])
+        except ProvisioningError as e:
+            raise CommandError(e.errors[0][1])
+
+        fields = ['username', 'password'] + (['access', 'refresh'] if options['tokens'] else [])
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8', newline='')
+        try:
+            writer = csv.DictWriter(output, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(created)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'{len(created)} 件のユーザーを作成しました ({time.monotonic() - started:.1f} 秒)。'
+        ))
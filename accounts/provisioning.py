@@ -0,0 +1,122 @@
+import csv
+import io
+import secrets
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .hashing import hash_passwords
+
+# 名簿の CSV の列 (username は必須。password が空なら生成する)
+ROSTER_FIELDS = ['username', 'password', 'email', 'first_name', 'last_name']
+
+# 生成するパスワードの長さ (token_urlsafe のバイト数。約12文字になる)
+GENERATED_PASSWORD_BYTES = 9
+
+
+class ProvisioningError(Exception):
+    """
+    名簿に不正な行がある (errors は [(行番号, メッセージ), ...])
+    """
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} 件のエラーがあります。')
+        self.errors = errors
+
+
+def parse_roster(text):
+    """
+    名簿の CSV (1行目はヘッダー) を [{列名: 値}, ...] にする (値の前後の空白は除く)
+    """
+    # Excel で保存した CSV の BOM は除く
+    reader = csv.DictReader(io.StringIO(text.lstrip('\ufeff')))
+    if 'username' not in (reader.fieldnames or []):
+        raise ProvisioningError([(1, 'username 列がありません。')])
+    return [
+        {field: (row.get(field) or '').strip() for field in ROSTER_FIELDS}
+        for row in reader
+    ]
+
+
+def check_roster(rows):
+    """
+    ユーザー名の形式・名簿内の重複・既存ユーザーとの重複・パスワードの強度を確認し、
+    パスワードが空の行には生成したパスワードを入れる (エラーがあれば ProvisioningError)
+    既存ユーザーとの重複は、1行ずつではなく1回のクエリでまとめて確認する
+    """
+    errors = []
+    seen = set()
+    for line, row in enumerate(rows, start=2):
+        username = row['username']
+        try:
+            if not username:
+                raise ValidationError('ユーザー名が空です。')
+            User._meta.get_field('username').run_validators(username)
+            if row['email']:
+                User._meta.get_field('email').run_validators(row['email'])
+        except ValidationError as e:
+            errors.append((line, f'{username}: {" ".join(e.messages)}'))
+            continue
+        if username in seen:
+            errors.append((line, f'{username}: 名簿の中で重複しています。'))
+        seen.add(username)
+
+    existing = set(User.objects.filter(username__in=seen).values_list('username', flat=True))
+    for line, row in enumerate(rows, start=2):
+        if row['username'] in existing:
+            errors.append((line, f"{row['username']}: このユーザー名は既に使用されています。"))
+        if not row['password']:
+            row['password'] = secrets.token_urlsafe(GENERATED_PASSWORD_BYTES)
+            row['generated'] = True
+            continue
+        try:
+            validate_password(row['password'], User(username=row['username'], email=row['email']))
+        except ValidationError as e:
+            errors.append((line, f"{row['username']}: {' '.join(e.messages)}"))
+
+    if errors:
+        raise ProvisioningError(sorted(errors))
+    return rows
+
+
+def provision_users(rows, issue_tokens=False, workers=None, batch_size=1000):
+    """
+    check_roster() 済みの行から、パスワードを並列にハッシュ化してユーザーを bulk_create で作成し、
+    [{"username", "password" (生成した場合のみ), "access", "refresh" (issue_tokens の場合のみ)}, ...] を返す
+    """
+    if workers is None:
+        workers = getattr(settings, 'PROVISION_HASH_WORKERS', 0)
+    hashes = hash_passwords([row['password'] for row in rows], workers)
+    users = [
+        User(
+            username=row['username'], password=encoded,
+            email=row['email'], first_name=row['first_name'], last_name=row['last_name'],
+        )
+        for row, encoded in zip(rows, hashes)
+    ]
+    try:
+        with transaction.atomic():
+            users = User.objects.bulk_create(users, batch_size=batch_size)
+    except IntegrityError:
+        # 確認の後に同じユーザー名が登録された場合
+        raise ProvisioningError([(0, '確認の後に同じユーザー名が登録されました。もう一度実行してください。')])
+    if issue_tokens and any(user.pk is None for user in users):
+        # INSERT で ID を返せないデータベースでは読み直す
+        by_username = User.objects.in_bulk([user.username for user in users], field_name='username')
+        users = [by_username[user.username] for user in users]
+
+    created = []
+    for row, user in zip(rows, users):
+        item = {'username': user.username}
+        if row.get('generated'):
+            item['password'] = row['password']
+        if issue_tokens:
+            refresh = RefreshToken.for_user(user)
+            item['access'] = str(refresh.access_token)
+            item['refresh'] = str(refresh)
+        created.append(item)
+    return created
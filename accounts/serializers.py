@@ -36,11 +36,11 @@ class SignUpSerializer(serializers.ModelSerializer):
         """
         バリデーション通過後にユーザーを作成する (パスワードをハッシュ化する)
         """
+        # create_user にパスワードを渡すと、ハッシュ化して1回の INSERT で保存する
+        # (作成後に set_password + save() すると UPDATE が1回増える)
         user = User.objects.create_user(
             username=validated_data['username'],
-            # validated_data['password'] をそのまま使わず、create_user でハッシュ化
+            password=validated_data['password'],
         )
-        user.set_password(validated_data['password'])
-        user.save()
 
         return user
\ No newline at end of file
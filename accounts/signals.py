@@ -0,0 +1,14 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import user_cache
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """
+    ユーザーが更新 (無効化・パスワード変更を含む)・削除されたら認証用のキャッシュから削除する
+    """
+    user_cache.delete(instance.pk)
@@ -1,3 +1,213 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import CachedJWTAuthentication, UserCache, user_cache
+from .hashing import hash_passwords
+from .provisioning import ProvisioningError, check_roster, parse_roster, provision_users
+
+ROSTER = (
+    # Excel で保存した CSV の BOM と値の前後の空白
+    '\ufeffusername,password,email,first_name,last_name\n'
+    'student01,Correct-Horse-42,s01@example.com,Taro,Yamada\n'
+    ' student02 ,,,,\n'
+)
+
+
+class ProvisioningTests(TestCase):
+    """
+    名簿の確認 (check_roster) とユーザーの一括作成 (provision_users)
+    """
+
+    def test_check_roster_reports_every_error(self):
+        User.objects.create(username='taken')
+        rows = parse_roster(
+            'username,password\n'
+            'student01,\n'
+            'student01,\n'
+            'taken,\n'
+            'bad name!,\n'
+            'student02,123\n'
+        )
+        with self.assertRaises(ProvisioningError) as raised:
+            check_roster(rows)
+        self.assertEqual([line for line, _ in raised.exception.errors], [3, 4, 5, 6])
+
+    def test_missing_username_column(self):
+        with self.assertRaises(ProvisioningError):
+            parse_roster('name,password\nstudent01,\n')
+
+    def test_provision_users(self):
+        created = provision_users(check_roster(parse_roster(ROSTER)), issue_tokens=True, workers=1)
+        self.assertEqual([item['username'] for item in created], ['student01', 'student02'])
+        # 指定したパスワードは返さず、生成したパスワードだけを返す
+        self.assertNotIn('password', created[0])
+
+        first, second = User.objects.get(username='student01'), User.objects.get(username='student02')
+        self.assertEqual((first.email, first.first_name, first.last_name), ('s01@example.com', 'Taro', 'Yamada'))
+        self.assertTrue(first.check_password('Correct-Horse-42'))
+        self.assertTrue(second.check_password(created[1]['password']))
+        self.assertEqual(str(AccessToken(created[1]['access'])['user_id']), str(second.pk))
+
+    def test_parallel_hashing(self):
+        passwords = ['first-password', 'second-password', 'third-password']
+        hashes = hash_passwords(passwords, 2)
+        self.assertTrue(all(check_password(password, encoded) for password, encoded in zip(passwords, hashes)))
+
+
+@override_settings(PROVISION_HASH_WORKERS=1)
+class ProvisionUsersEntryPointTests(TestCase):
+    """
+    manage.py provision_users と /accounts/api/provision/
+    """
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            roster = os.path.join(directory, 'roster.csv')
+            output = os.path.join(directory, 'created.csv')
+            with open(roster, 'w', encoding='utf-8') as f:
+                f.write(ROSTER)
+            call_command('provision_users', roster, '--tokens', '-o', output, stderr=io.StringIO())
+            with open(output, encoding='utf-8', newline='') as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual([row['username'] for row in rows], ['student01', 'student02'])
+        self.assertTrue(rows[0]['access'] and rows[1]['password'])
+
+        # 1件でも不正な行があれば何も作成しない
+        with tempfile.TemporaryDirectory() as directory:
+            roster = os.path.join(directory, 'roster.csv')
+            with open(roster, 'w', encoding='utf-8') as f:
+                f.write('username\nstudent03\nstudent01\n')
+            with self.assertRaises(CommandError):
+                call_command('provision_users', roster, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertFalse(User.objects.filter(username='student03').exists())
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='learner'))
+        response = client.post('/accounts/api/provision/', ROSTER.encode(), content_type='text/csv')
+        self.assertEqual(response.status_code, 403)
+
+        client.force_authenticate(User.objects.create(username='staff', is_staff=True))
+        response = client.post('/accounts/api/provision/', ROSTER.encode(), content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+
+        response = client.post('/accounts/api/provision/', ROSTER.encode(), content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['line'] for error in response.json()['errors']], [2, 3])
+
+
+class UserCacheTests(TestCase):
+    """
+    認証用の TTL 付き LRU キャッシュ (UserCache)
+    """
+
+    def test_lru_eviction(self):
+        users = {user_id: User(pk=user_id, username=f'user{user_id}') for user_id in (1, 2, 3)}
+        cache = UserCache(ttl=60, max_size=2)
+        cache.set(1, users[1])
+        cache.set('2', users[2])
+        # 使われたものは残り、最も長く使われていないものから消える
+        self.assertEqual(cache.get('1').username, 'user1')
+        cache.set(3, users[3])
+        self.assertIsNone(cache.get(2))
+        self.assertEqual([cache.get(user_id).username for user_id in (1, 3)], ['user1', 'user3'])
+
+    def test_ttl_and_copies(self):
+        cache = UserCache(ttl=60, max_size=10)
+        cache.set(1, User(pk=1, username='user1'))
+        cache.get(1).username = 'changed'
+        self.assertEqual(cache.get(1).username, 'user1')
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get(1))
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    """
+    User をキャッシュから返す JWT 認証 (CachedJWTAuthentication)
+    """
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user(username='learner', password='first-password')
+        self.authentication = CachedJWTAuthentication()
+
+    def token(self):
+        return AccessToken.for_user(self.user)
+
+    def test_cache_hit(self):
+        token = self.token()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authentication.get_user(token), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authentication.get_user(token), self.user)
+
+    def test_save_evicts(self):
+        token = self.token()
+        self.authentication.get_user(token)
+        self.user.email = 'learner@example.com'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authentication.get_user(token).email, 'learner@example.com')
+
+        # 無効化したユーザーは次のリクエストから認証できない
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(token)
+
+    def test_update_is_not_seen_until_ttl(self):
+        token = self.token()
+        self.authentication.get_user(token)
+        # シグナルの届かない変更は、キャッシュが切れるまで反映されない (AUTH_USER_CACHE_TTL)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.authentication.get_user(token), self.user)
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            with self.assertRaises(AuthenticationFailed):
+                self.authentication.get_user(token)
+
+    # simplejwt の api_settings は override_settings では各モジュールに反映されないので、直接書き換える
+    @mock.patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True)
+    def test_revoked_token(self):
+        old_token = self.token()
+        self.authentication.get_user(old_token)
+        self.user.set_password('second-password')
+        self.user.save()
+        new_token = self.token()
+        self.assertEqual(self.authentication.get_user(new_token), self.user)
+
+        # キャッシュに新しいパスワードのユーザーがあっても、変更前のトークンは通さない
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(old_token)
+        with self.assertRaises(AuthenticationFailed):
+            async_to_sync(self.authentication.aget_user)(old_token)
+
+    def test_aget_user(self):
+        token = self.token()
+        self.assertEqual(async_to_sync(self.authentication.aget_user)(token), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(self.authentication.aget_user)(token), self.user)
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            async_to_sync(self.authentication.aget_user)(token)
+        User.objects.filter(pk=self.user.pk).delete()
+        with self.assertRaises(AuthenticationFailed):
+            async_to_sync(self.authentication.aget_user)(token)
@@ -20,4 +20,7 @@ urlpatterns = [
 
      # 新規登録API (POST)
     path('api/signup/', views.SignUpAPIView.as_view(), name='signup_api'),
+
+    # 名簿からの一括登録API (POST・管理者のみ)
+    path('api/provision/', views.ProvisionUsersAPIView.as_view(), name='provision_api'),
 ]
\ No newline at end of file
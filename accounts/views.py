@@ -3,6 +3,8 @@ from django.urls import reverse_lazy
 from django.views import generic
 from rest_framework import generics, permissions
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from .provisioning import ProvisioningError, check_roster, parse_roster, provision_users
 from .serializers import SignUpSerializer
 from django.contrib.auth.models import User
 
@@ -25,4 +27,33 @@ class SignUpAPIView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = SignUpSerializer
     # 認証: 誰でも (AllowAny) アクセスできるように設定
-    permission_classes = [permissions.AllowAny]
\ No newline at end of file
+    permission_classes = [permissions.AllowAny]
+
+
+class ProvisionUsersAPIView(APIView):
+    """
+    名簿の CSV からユーザーをまとめて作成する管理者用のAPIビュー (manage.py provision_users と同じ処理)
+    CSV は multipart の file か、リクエストの本文 (Content-Type: text/csv) で送る。?tokens=1 で JWT も返す
+    (大人数の場合はハッシュ化に時間がかかるので、タイムアウトに注意するか provision_users を使う)
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({"error": "file が指定されていません。"}, status=400)
+            content = upload.read()
+        else:
+            content = request.body
+        try:
+            text = content.decode('utf-8')
+        except UnicodeDecodeError:
+            return Response({"error": "CSV は UTF-8 で送ってください。"}, status=400)
+
+        issue_tokens = request.query_params.get('tokens', '').lower() in ('1', 'true', 'yes')
+        try:
+            created = provision_users(check_roster(parse_roster(text)), issue_tokens=issue_tokens)
+        except ProvisioningError as e:
+            return Response({"errors": [{"line": line, "message": message} for line, message in e.errors]}, status=400)
+        return Response({"created": len(created), "users": created}, status=201)
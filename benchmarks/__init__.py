@@ -0,0 +1,51 @@
+"""
+性能計測用スクリプト
+
+各モジュールは `python -m benchmarks.<name>` で実行する。
+計測はテスト用データベース (test_<DB名>) を作成して行い、終了時に削除する。
+"""
+import contextlib
+import os
+import sys
+import time
+from pathlib import Path
+
+# リポジトリのルートを import パスに追加 (manage.py と同じ扱い)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def setup_django():
+    """
+    Django を初期化する (DJANGO_SETTINGS_MODULE 未指定なら config.settings)
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def bench_database(keepdb=False):
+    """
+    計測用のテストデータベースを作成し、終了時に削除するコンテキストマネージャ
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def timeit(func, repeat):
+    """
+    func を repeat 回実行し、1回あたりの平均秒数を返す
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
@@ -0,0 +1,48 @@
+"""
+適応型出題 (quiz.adaptive.select_question_ids) の所要時間
+
+    python -m benchmarks.adaptive [--questions 100000] [--answered 0 1000 10000] [--repeat 50]
+"""
+import argparse
+
+from benchmarks import bench_database, setup_django, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=100_000)
+    parser.add_argument('--answered', type=int, nargs='+', default=[0, 1_000, 10_000])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from quiz.adaptive import select_question_ids
+    from quiz.models import Question, Result, UserAbility
+    from quiz.sampling import question_sampler
+    from benchmarks.seed import seed_questions
+
+    with bench_database():
+        seed_questions(args.questions)
+        question_sampler.count()  # インデックス作成は計測に含めない
+
+        print(f"{'answered':>10} {'select':>10}")
+        for answered in args.answered:
+            user = User.objects.create(username=f'bench{answered}')
+            UserAbility.objects.create(user=user, rating=650)
+            # 能力値に近い問題から解答済みにする (未解答の候補を探す最悪ケース)
+            question_ids = (
+                Question.objects.order_by('difficulty_level')
+                .filter(difficulty_level__gte=650)
+                .values_list('id', flat=True)[:answered]
+            )
+            Result.objects.bulk_create(
+                [Result(user=user, question_id=qid, selected_answer='A') for qid in question_ids],
+                batch_size=5000,
+            )
+            elapsed = timeit(lambda: select_question_ids(user, 10), args.repeat)
+            print(f"{answered:>10} {elapsed * 1000:>8.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+同じメモリ量での同時接続性能: gunicorn (同期ワーカー) と uvicorn (ASGI + 非同期ビュー) の比較
+
+    python -m benchmarks.asgi [--sync-workers 4] [--async-workers 1] [--concurrency 10 50 100]
+                              [--duration 10] [--db-latency-ms 5]
+
+一時ファイルの SQLite にデータを投入し、それぞれのサーバーを起動して
+/api/quiz/ と /api/results/ (非同期版は /api/async/...) に同時に GET を送り続ける。
+SQLite ではネットワーク越しの待ち時間が発生しないため、--db-latency-ms で
+クエリごとに PostgreSQL への往復時間相当の待ちを入れる。
+メモリはマスタープロセスとワーカーの RSS の合計 (/proc から取得)。
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup_django
+from benchmarks.server import HOST, prepare_database, process_tree_rss, run_server, standalone_database
+
+
+def _load(port, paths, token, concurrency, duration):
+    """
+    concurrency 本のキープアライブ接続から duration 秒間リクエストを送り続け、
+    (レイテンシのリスト, エラー数) を返す
+    """
+    deadline = time.monotonic() + duration
+    headers = {'Authorization': f'Bearer {token}'}
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def client(n):
+        connection = http.client.HTTPConnection(HOST, port, timeout=30)
+        own_latencies, own_errors = [], 0
+        i = n
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.request('GET', paths[i % len(paths)], headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    own_errors += 1
+            except (OSError, http.client.HTTPException):
+                own_errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection(HOST, port, timeout=30)
+            own_latencies.append(time.perf_counter() - start)
+            i += 1
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            errors.append(own_errors)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    return latencies, sum(errors)
+
+
+def _run_profile(kind, workers, paths, token, args):
+    name = f"{kind} {'sync' if kind == 'gunicorn' else 'async'} x{workers}"
+    rows = []
+    with run_server(kind, workers, args.db_latency_ms) as (port, server):
+        _load(port, paths, token, args.concurrency[0], 1)  # ウォームアップ
+        for concurrency in args.concurrency:
+            latencies, errors = _load(port, paths, token, concurrency, args.duration)
+            latencies.sort()
+            rows.append({
+                'profile': name,
+                'concurrency': concurrency,
+                'throughput': len(latencies) / args.duration,
+                'p50_ms': statistics.median(latencies) * 1000,
+                'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+                'errors': errors,
+                'rss_mib': process_tree_rss(server.pid),
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sync-workers', type=int, default=4, help='gunicorn の同期ワーカー数')
+    parser.add_argument('--async-workers', type=int, default=1, help='uvicorn のワーカー数')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--duration', type=float, default=10, help='同時接続数ごとの計測秒数')
+    parser.add_argument('--db-latency-ms', type=float, default=5, help='クエリごとに入れる待ち時間')
+    parser.add_argument('--questions', type=int, default=5000)
+    parser.add_argument('--json', action='store_true', help='結果を JSON で出力する')
+    args = parser.parse_args()
+
+    # サーバープロセスと同じデータベースを使うため、一時ファイルの SQLite を使う
+    with standalone_database():
+        setup_django()
+        from django.contrib.auth.models import User
+        from rest_framework_simplejwt.tokens import RefreshToken
+        from quiz.grading import grade_answers, record_results
+        from quiz.models import Question
+        from benchmarks.seed import seed_questions
+
+        prepare_database()
+        seed_questions(args.questions)
+        user = User.objects.create_user('bench', password='bench-password')
+        questions = list(Question.objects.all()[:10])
+        results = record_results(user, grade_answers(
+            user, [{'question_id': question.id, 'selected_answer': 'A'} for question in questions]
+        ))
+        ids = ','.join(str(result.id) for result in results)
+        token = str(RefreshToken.for_user(user).access_token)
+
+        rows = [
+            *_run_profile('gunicorn', args.sync_workers, ['/api/quiz/', f'/api/results/?ids={ids}'], token, args),
+            *_run_profile('uvicorn', args.async_workers, ['/api/async/quiz/', f'/api/async/results/?ids={ids}'], token, args),
+        ]
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'profile':<22} {'conc':>5} {'req/s':>8} {'p50':>9} {'p95':>9} {'errors':>7} {'RSS':>9}")
+    for row in rows:
+        print(
+            f"{row['profile']:<22} {row['concurrency']:>5} {row['throughput']:>8.1f} "
+            f"{row['p50_ms']:>7.1f}ms {row['p95_ms']:>7.1f}ms {row['errors']:>7} {row['rss_mib']:>6.1f}MiB"
+        )
+
+
+if __name__ == '__main__':
+    main()
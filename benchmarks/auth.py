@@ -0,0 +1,60 @@
+"""
+認証方式ごとのクエリ数とレイテンシ: JWTAuthentication と CachedJWTAuthentication の比較
+
+    python -m benchmarks.auth [--repeat 500]
+"""
+import argparse
+
+from benchmarks import bench_database, setup_django, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from accounts.authentication import CachedJWTAuthentication
+    from quiz import views
+    from quiz.grading import grade_answers, record_results
+    from quiz.models import Question
+    from benchmarks.seed import seed_questions
+
+    with bench_database():
+        seed_questions(1000)
+        user = User.objects.create_user('bench', password='bench-password')
+        questions = list(Question.objects.all()[:10])
+        results = record_results(user, grade_answers(
+            user, [{'question_id': question.id, 'selected_answer': 'A'} for question in questions]
+        ))
+        ids = ','.join(str(result.id) for result in results)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        endpoints = [
+            ('/api/quiz/', {}, views.QuizAPIView),
+            ('/api/results/', {'ids': ids}, views.QuizResultAPIView),
+        ]
+
+        print(f"{'endpoint':<16} {'authentication':<26} {'queries':>8} {'latency':>10}")
+        for path, params, view in endpoints:
+            for authentication in (JWTAuthentication, CachedJWTAuthentication):
+                view.authentication_classes = [authentication]
+                response = client.get(path, params)  # キャッシュを温めておく
+                assert response.status_code == 200, response.content
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    client.get(path, params)
+                query_count = len(captured)
+                latency = timeit(lambda: client.get(path, params), args.repeat)
+                print(f"{path:<16} {authentication.__name__:<26} {query_count:>8} {latency * 1000:>8.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
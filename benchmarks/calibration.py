@@ -0,0 +1,61 @@
+"""
+問題の難易度・識別力の推定 (quiz.calibration) の処理時間と精度
+
+    python -m benchmarks.calibration [--users 20000 100000] [--items 5000] [--per-user 50]
+
+既知の θ・b・a から 2PL モデルで解答をシミュレーションし、推定にかかった時間と、
+真の値との相関 (b・a) を表示する。データベースは使わない。
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks import setup_django
+
+
+def simulate(users, items, per_user, rng):
+    """
+    (ユーザー, 問題, 正誤) の配列と真の b・a を返す (各ユーザーは per_user 問に1回ずつ解答する)
+    """
+    theta = rng.normal(size=users)
+    b = rng.normal(size=items)
+    a = np.clip(rng.lognormal(0, 0.3, size=items), 0.3, 3.0)
+    user_index = np.repeat(np.arange(users), per_user)
+    # ユーザーごとに重複しない問題を選ぶ (ランダムな順位の上位 per_user 問)
+    item_index = np.concatenate([
+        np.argpartition(rng.random(items), per_user)[:per_user] for _ in range(users)
+    ])
+    p = 1 / (1 + np.exp(-a[item_index] * (theta[user_index] - b[item_index])))
+    correct = (rng.random(len(p)) < p).astype(np.int8)
+    return user_index + 1, item_index + 1, correct, b, a
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[20_000, 100_000])
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--per-user', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from quiz.calibration import Responses, fit
+
+    print(f"{'responses':>10} {'model':>6} {'matrix':>8} {'fit':>8} {'iter':>5} {'corr(b)':>8} {'corr(a)':>8}")
+    for users in args.users:
+        user_ids, question_ids, correct, b, a = simulate(users, args.items, args.per_user, np.random.default_rng(users))
+        for model in ('2pl', 'rasch'):
+            started = time.perf_counter()
+            responses = Responses.from_arrays(user_ids, question_ids, correct)
+            built = time.perf_counter()
+            calibration = fit(responses, model)
+            fitted = time.perf_counter()
+            corr_a = f'{np.corrcoef(calibration.discrimination, a)[0, 1]:.3f}' if model == '2pl' else '-'
+            print(
+                f'{len(correct):>10} {model:>6} {built - started:>7.2f}s {fitted - built:>7.2f}s '
+                f'{calibration.iterations:>5} {np.corrcoef(calibration.difficulty, b)[0, 1]:>8.3f} {corr_a:>8}'
+            )
+
+
+if __name__ == '__main__':
+    main()
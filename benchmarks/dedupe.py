@@ -0,0 +1,92 @@
+"""
+ほぼ同じ問題の検出 (quiz.dedupe) の処理時間と検出率
+
+    python -m benchmarks.dedupe [--sizes 10000 100000 500000] [--duplicates 0.01] [--threshold 0.8]
+
+ランダムな英文の問題を作り、--duplicates の割合で句読点・大文字小文字・1語を変えたコピーを混ぜる。
+署名の作成・候補ペアの抽出・クラスタ化の時間と、次の2つを表示する。データベースは使わない。
+    recall : 実際の類似度 (シングルの Jaccard 係数) がしきい値以上のコピーのうち、同じクラスタになった割合
+    false  : 検出したペアのうち、実際の類似度がしきい値未満のものの数
+"""
+import argparse
+import random
+import time
+
+from benchmarks import setup_django
+
+
+def make_questions(size, duplicates, rng):
+    """
+    (問題のリスト, [(元の番号, コピーの番号), ...]) を返す
+    """
+    words = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(2, 9))) for _ in range(20000)]
+    questions = []
+    for _ in range(size):
+        sentence = ' '.join(rng.choices(words, k=rng.randint(10, 18)))
+        questions.append([f'{sentence.capitalize()} ____.', *rng.sample(words, 4)])
+
+    planted = []
+    for copy in rng.sample(range(size), int(size * duplicates)):
+        original = rng.randrange(size)
+        if original == copy:
+            continue
+        tokens = questions[original][0].split()
+        tokens[rng.randrange(len(tokens))] = rng.choice(words)
+        questions[copy] = [' '.join(tokens).upper().replace('.', '!'), *questions[original][1:]]
+        planted.append((original, copy))
+    return questions, planted
+
+
+def jaccard(a, b, shingle_size):
+    """
+    2つの文字列のシングルの集合の Jaccard 係数 (正確な値)
+    """
+    a = {a[n:n + shingle_size] for n in range(max(len(a) - shingle_size + 1, 1))}
+    b = {b[n:n + shingle_size] for n in range(max(len(b) - shingle_size + 1, 1))}
+    return len(a & b) / len(a | b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--duplicates', type=float, default=0.01, help='ほぼ同じコピーにする問題の割合')
+    parser.add_argument('--threshold', type=float, default=0.8)
+    parser.add_argument('--num-perm', type=int, default=128)
+    args = parser.parse_args()
+
+    setup_django()
+    from quiz.dedupe import SHINGLE_SIZE, choose_bands, cluster_pairs, dedupe_text, minhash_signatures, similar_pairs
+
+    print(f"bands: {choose_bands(args.threshold, args.num_perm)} x {args.num_perm // choose_bands(args.threshold, args.num_perm)}")
+    print(f"{'questions':>10} {'normalize':>10} {'minhash':>9} {'pairs':>9} {'cluster':>9} {'total':>9} {'recall':>7} {'false':>6}")
+    for size in args.sizes:
+        questions, planted = make_questions(size, args.duplicates, random.Random(size))
+
+        started = time.perf_counter()
+        texts = [dedupe_text(*question) for question in questions]
+        normalized = time.perf_counter()
+        signatures = minhash_signatures(texts, args.num_perm)
+        signed = time.perf_counter()
+        i, j, _ = similar_pairs(signatures, args.threshold)
+        paired = time.perf_counter()
+        clusters = cluster_pairs(size, i, j)
+        clustered = time.perf_counter()
+
+        cluster_of = {member: n for n, members in enumerate(clusters) for member in members}
+        similar = [
+            (original, copy) for original, copy in planted
+            if jaccard(texts[original], texts[copy], SHINGLE_SIZE) >= args.threshold
+        ]
+        found = sum(1 for original, copy in similar if copy in cluster_of and cluster_of.get(original) == cluster_of[copy])
+        false = sum(
+            1 for x, y in zip(i.tolist(), j.tolist())
+            if jaccard(texts[x], texts[y], SHINGLE_SIZE) < args.threshold
+        )
+        print(
+            f"{size:>10} {normalized - started:>9.2f}s {signed - normalized:>8.2f}s {paired - signed:>8.2f}s "
+            f"{clustered - paired:>8.2f}s {clustered - started:>8.2f}s {found / max(len(similar), 1):>7.1%} {false:>6}"
+        )
+
+
+if __name__ == '__main__':
+    main()
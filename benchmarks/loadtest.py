@@ -0,0 +1,267 @@
+"""
+クイズAPIの負荷試験: 学習者のセッションを同時に再生し、エンドポイントごとの性能を記録する
+
+    python -m benchmarks.loadtest [--concurrency 20] [--duration 30] [--server gunicorn --workers 4]
+                                  [--questions 5000 --users 200 --results-per-user 50]
+                                  [--output run.json] [--baseline baseline.json --tolerance 0.2]
+
+1人の学習者 (1スレッド) は次のセッションを繰り返す。
+    POST /api/token/ → (GET /api/quiz/ → POST /api/quiz/submit/ → GET /api/results/) × --quizzes-per-session
+--server uvicorn の場合は /api/async/ 以下の非同期版を使う。
+
+データはデフォルトで一時ファイルの SQLite に投入する。--database-url で PostgreSQL などを指定した場合は
+そのデータベースに migrate と投入を行う (ユーザー名が --user-prefix で始まるユーザーは事前に削除する)。
+クエリ数はサーバーが返す X-Bench-Queries ヘッダーの値 (benchmarks.server)。
+
+--output に JSON で結果を書き出す。--baseline に以前の結果を指定すると比較し、
+p95 の悪化・スループットの低下が --tolerance を超えるか、クエリ数が増えていれば終了コード 1 で終わる。
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup_django
+from benchmarks.server import HOST, QUERY_COUNT_HEADER, prepare_database, process_tree_rss, run_server, standalone_database
+
+PASSWORD = 'loadtest-password'
+ENDPOINTS = ('token', 'quiz', 'submit', 'results')
+
+
+def percentile(sorted_values, q):
+    """
+    昇順のリストの q パーセンタイル (最近傍法)
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(len(sorted_values) * q / 100))
+    return sorted_values[rank - 1]
+
+
+class Learner:
+    """
+    1人の学習者として、キープアライブ接続でセッションを再生する
+    """
+
+    def __init__(self, port, username, paths, quizzes_per_session, rng):
+        self.port = port
+        self.username = username
+        self.paths = paths
+        self.quizzes_per_session = quizzes_per_session
+        self.rng = rng
+        self.samples = defaultdict(list)  # endpoint -> [(秒, クエリ数, 成功したか)]
+        self.connection = http.client.HTTPConnection(HOST, port, timeout=60)
+
+    def request(self, endpoint, method, path, body=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=None if body is None else json.dumps(body), headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(HOST, self.port, timeout=60)
+            self.samples[endpoint].append((time.perf_counter() - start, None, False))
+            return None
+        elapsed = time.perf_counter() - start
+        queries = response.getheader(QUERY_COUNT_HEADER)
+        ok = 200 <= response.status < 300
+        self.samples[endpoint].append((elapsed, int(queries) if queries is not None else None, ok))
+        return json.loads(content) if ok else None
+
+    def run_session(self):
+        tokens = self.request('token', 'POST', '/api/token/', {'username': self.username, 'password': PASSWORD})
+        if not tokens:
+            return
+        access = tokens['access']
+        for _ in range(self.quizzes_per_session):
+            questions = self.request('quiz', 'GET', self.paths['quiz'], token=access)
+            if not questions:
+                continue
+            answers = [
+                {'question_id': question['id'], 'selected_answer': self.rng.choice('ABCD')}
+                for question in questions
+            ]
+            submitted = self.request('submit', 'POST', self.paths['submit'], answers, token=access)
+            if not submitted:
+                continue
+            ids = ','.join(str(result_id) for result_id in submitted['result_ids'])
+            self.request('results', 'GET', f"{self.paths['results']}?ids={ids}", token=access)
+
+    def close(self):
+        self.connection.close()
+
+
+def replay(port, usernames, paths, args):
+    """
+    --concurrency 人の学習者で --duration 秒間セッションを繰り返し、エンドポイントごとの計測値を返す
+    """
+    deadline = time.monotonic() + args.duration
+    samples = defaultdict(list)
+    lock = threading.Lock()
+
+    def learner_loop(n):
+        learner = Learner(port, usernames[n % len(usernames)], paths, args.quizzes_per_session, random.Random(n))
+        while time.monotonic() < deadline:
+            learner.run_session()
+        learner.close()
+        with lock:
+            for endpoint, values in learner.samples.items():
+                samples[endpoint].extend(values)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(learner_loop, range(args.concurrency)))
+    return samples, time.monotonic() - start
+
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for endpoint in ENDPOINTS:
+        values = samples.get(endpoint, [])
+        latencies = sorted(elapsed_seconds * 1000 for elapsed_seconds, _, _ in values)
+        queries = [count for _, count, ok in values if ok and count is not None]
+        endpoints[endpoint] = {
+            'requests': len(values),
+            'errors': sum(1 for _, _, ok in values if not ok),
+            'throughput': len(values) / elapsed,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'queries_mean': sum(queries) / len(queries) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+    return endpoints
+
+
+def compare(current, baseline, tolerance):
+    """
+    ベースラインと比べて悪化したエンドポイントのメッセージのリストを返す
+    """
+    regressions = []
+    for endpoint, base in baseline['endpoints'].items():
+        now = current['endpoints'].get(endpoint)
+        if not now or not base['requests']:
+            continue
+        if now['p95_ms'] is not None and now['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {base['p95_ms']:.1f}ms -> {now['p95_ms']:.1f}ms")
+        if now['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {base['throughput']:.1f} -> {now['throughput']:.1f} req/s")
+        # クエリ数はデータ量や負荷に左右されないので、増えたら悪化とみなす
+        if base['queries_max'] is not None and (now['queries_max'] or 0) > base['queries_max']:
+            regressions.append(f"{endpoint}: queries {base['queries_max']} -> {now['queries_max']}")
+        if now['errors'] > base['errors']:
+            regressions.append(f"{endpoint}: errors {base['errors']} -> {now['errors']}")
+    return regressions
+
+
+def seed(args):
+    from django.contrib.auth.models import User
+    from quiz.models import Question
+    from benchmarks.seed import seed_questions, seed_results, seed_users
+
+    prepare_database()
+    User.objects.filter(username__startswith=args.user_prefix).delete()
+    missing = args.questions - Question.objects.count()
+    if missing > 0:
+        seed_questions(missing, start=Question.objects.count())
+    usernames = seed_users(args.users, PASSWORD, prefix=args.user_prefix)
+    seed_results(usernames, args.results_per_user)
+    return usernames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=['gunicorn', 'uvicorn'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=20, help='同時に操作する学習者の数')
+    parser.add_argument('--duration', type=float, default=30, help='計測秒数')
+    parser.add_argument('--quizzes-per-session', type=int, default=10, help='1回のログインで解くクイズの数')
+    parser.add_argument('--questions', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--results-per-user', type=int, default=50)
+    parser.add_argument('--user-prefix', default='loadtest-')
+    parser.add_argument('--database-url', help='投入先のデータベース (未指定なら一時ファイルの SQLite)')
+    parser.add_argument('--db-latency-ms', type=float, default=0, help='クエリごとに入れる待ち時間')
+    parser.add_argument('--output', help='結果を書き出す JSON ファイル')
+    parser.add_argument('--baseline', help='比較するベースラインの JSON ファイル')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='p95・スループットの許容する悪化率')
+    args = parser.parse_args()
+
+    if args.server == 'uvicorn':
+        paths = {'quiz': '/api/async/quiz/', 'submit': '/api/async/quiz/submit/', 'results': '/api/async/results/'}
+    else:
+        paths = {'quiz': '/api/quiz/', 'submit': '/api/quiz/submit/', 'results': '/api/results/'}
+
+    with standalone_database(args.database_url):
+        setup_django()
+        import django
+        from django.db import connection
+
+        usernames = seed(args)
+        vendor = connection.vendor
+        connection.close()
+
+        with run_server(args.server, args.workers, args.db_latency_ms) as (port, server):
+            samples, elapsed = replay(port, usernames, paths, args)
+            rss = process_tree_rss(server.pid)
+
+    report = {
+        'meta': {
+            'server': args.server,
+            'workers': args.workers,
+            'concurrency': args.concurrency,
+            'duration': elapsed,
+            'quizzes_per_session': args.quizzes_per_session,
+            'questions': args.questions,
+            'users': args.users,
+            'results_per_user': args.results_per_user,
+            'database': vendor if args.database_url else f'{vendor} (temporary)',
+            'db_latency_ms': args.db_latency_ms,
+            'rss_mib': rss,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'cpu_count': os.cpu_count(),
+        },
+        'endpoints': summarize(samples, elapsed),
+    }
+
+    print(f"{'endpoint':<10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8}")
+    for endpoint, row in report['endpoints'].items():
+        if not row['requests']:
+            continue
+        queries = '-' if row['queries_mean'] is None else f"{row['queries_mean']:.1f}"
+        print(
+            f"{endpoint:<10} {row['requests']:>9} {row['errors']:>7} {row['throughput']:>8.1f} "
+            f"{row['p50_ms']:>7.1f}ms {row['p95_ms']:>7.1f}ms {row['p99_ms']:>7.1f}ms {queries:>8}"
+        )
+    print(f"RSS: {rss:.1f}MiB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print('ベースラインより悪化しました:', file=sys.stderr)
+            for message in regressions:
+                print(f'  {message}', file=sys.stderr)
+            sys.exit(1)
+        print('ベースラインとの比較: 問題なし')
+
+
+if __name__ == '__main__':
+    main()
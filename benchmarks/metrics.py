@@ -0,0 +1,62 @@
+"""
+MetricsMiddleware のオーバーヘッド: ミドルウェアあり・なしでの1リクエストあたりの時間の差
+
+    python -m benchmarks.metrics [--repeat 20000] [--queries 0 1 5 20]
+
+ビューは何もしないか、SELECT 1 を --queries 回実行するだけにして、
+ミドルウェアと execute_wrapper の分だけが差として出るようにする。
+あわせて /metrics の出力 (集計の合算とテキスト化) にかかる時間も計測する。
+"""
+import argparse
+
+from benchmarks import bench_database, setup_django, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20000)
+    parser.add_argument('--queries', type=int, nargs='+', default=[0, 1, 5, 20])
+    parser.add_argument('--views', type=int, default=30, help='/metrics の計測で使うビューの数')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from django.urls import resolve
+    from monitoring.metrics import MetricsRegistry, merge, registry, render
+    from monitoring.middleware import MetricsMiddleware
+
+    request = RequestFactory().get('/api/quiz/')
+    request.resolver_match = resolve('/api/quiz/')
+
+    with bench_database():
+        print(f"{'queries':>8} {'without':>10} {'with':>10} {'overhead':>10}")
+        for query_count in args.queries:
+            def view(request):
+                with connection.cursor() as cursor:
+                    for _ in range(query_count):
+                        cursor.execute('SELECT 1')
+                return HttpResponse()
+
+            middleware = MetricsMiddleware(view)
+            registry.reset()
+            without = timeit(lambda: view(request), args.repeat)
+            with_metrics = timeit(lambda: middleware(request), args.repeat)
+            print(
+                f"{query_count:>8} {without * 1e6:>8.2f}µs {with_metrics * 1e6:>8.2f}µs "
+                f"{(with_metrics - without) * 1e6:>8.2f}µs"
+            )
+
+    # 4ワーカー分のスナップショットを合算して出力する時間
+    worker = MetricsRegistry()
+    for n in range(args.views):
+        for status in (200, 400, 401):
+            worker.observe(f'view_{n}', 'GET', status, 0.01 * (n % 7), n % 5, 0.001)
+    snapshots = [worker.snapshot()] * 4
+    elapsed = timeit(lambda: render(*merge(snapshots)), 200)
+    print(f"/metrics ({args.views} views x 4 workers): {elapsed * 1000:.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
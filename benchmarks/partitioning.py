@@ -0,0 +1,172 @@
+"""
+解答ログ (AnswerLog) の保存方式の比較: 単一テーブルと月ごとのパーティションテーブル
+
+    python -m benchmarks.partitioning [--rows 10000000] [--months 24] [--users 100000] [--repeat 1000]
+
+PostgreSQL 専用。計測用のテストデータベースに、同じ列・インデックスのテーブルを2つ作る
+(bench_answerlog_single / bench_answerlog_partitioned)。generate_series で --rows 件を
+--months か月に解答日時の順で投入し、それぞれ次を計測する。
+    insert  : 解答送信1回分 (10行) の INSERT
+    recent  : 1ユーザーの直近30日の解答 ((user_id, answered_at) のインデックス)
+    rollup  : 1か月分の (ユーザー, 問題) ごとの集計 (archive_answers の集約と同じ GROUP BY)
+    archive : 最も古い月の削除 (単一テーブルは DELETE、パーティションは DETACH + DROP)
+
+100M 行で計測する場合は --rows 100000000 を指定する (ディスクを 2 テーブルで約 20GB 使い、投入に時間がかかる)。
+"""
+import argparse
+import random
+import time
+
+from benchmarks import bench_database, setup_django
+from benchmarks.loadtest import percentile
+
+SINGLE = 'bench_answerlog_single'
+PARTITIONED = 'bench_answerlog_partitioned'
+COLUMNS = '''
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    user_id integer NOT NULL,
+    question_id bigint NOT NULL,
+    selected_answer varchar(1) NOT NULL,
+    is_correct boolean NOT NULL,
+    answered_at timestamp with time zone NOT NULL
+'''
+LOAD_BATCH = 1_000_000
+
+
+def create_tables(cursor, months):
+    from quiz.partitions import month_range
+
+    cursor.execute(f'CREATE TABLE {SINGLE} ({COLUMNS}, PRIMARY KEY (id))')
+    cursor.execute(f'CREATE TABLE {PARTITIONED} ({COLUMNS}, PRIMARY KEY (id, answered_at)) PARTITION BY RANGE (answered_at)')
+    for month in months:
+        start, end = month_range(month)
+        cursor.execute(
+            f'CREATE TABLE {PARTITIONED}_p{month:%Y_%m} PARTITION OF {PARTITIONED} FOR VALUES FROM (%s) TO (%s)',
+            [start, end],
+        )
+    cursor.execute(f'CREATE TABLE {PARTITIONED}_default PARTITION OF {PARTITIONED} DEFAULT')
+    for table in (SINGLE, PARTITIONED):
+        cursor.execute(f'CREATE INDEX {table}_user_answered ON {table} (user_id, answered_at)')
+
+
+def load(cursor, table, rows, users, questions, start, end):
+    """
+    rows 件を start〜end に均等な解答日時で (古い順に) 投入する
+    """
+    for lo in range(0, rows, LOAD_BATCH):
+        hi = min(rows, lo + LOAD_BATCH)
+        cursor.execute(
+            f'''
+            INSERT INTO {table} (user_id, question_id, selected_answer, is_correct, answered_at)
+            SELECT (random() * %s)::int + 1, (random() * %s)::bigint + 1, 'A', random() < 0.6,
+                   %s::timestamptz + (%s::timestamptz - %s::timestamptz) * (g::float8 / %s)
+            FROM generate_series(%s, %s) AS g
+            ''',
+            [users - 1, questions - 1, start, end, start, rows, lo, hi - 1],
+        )
+    cursor.execute(f'VACUUM ANALYZE {table}')
+
+
+def measure(func, repeat):
+    """
+    func を repeat 回実行し、1回ごとの時間 (ミリ秒) の (p50, p95) を返す
+    """
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return percentile(latencies, 50), percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--questions', type=int, default=50_000)
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils import timezone
+    from quiz.partitions import add_months, month_range, month_start
+
+    with bench_database() as connection:
+        if connection.vendor != 'postgresql':
+            parser.exit(1, 'PostgreSQL でのみ計測できます (DATABASE_URL を PostgreSQL にしてください)。\n')
+
+        current = month_start(timezone.now())
+        months = [add_months(current, offset) for offset in range(-(args.months - 1), 1)]
+        start, _ = month_range(months[0])
+        end = timezone.now()
+        rng = random.Random(0)
+
+        with connection.cursor() as cursor:
+            create_tables(cursor, months)
+            for table in (SINGLE, PARTITIONED):
+                began = time.perf_counter()
+                load(cursor, table, args.rows, args.users, args.questions, start, end)
+                print(f'{table}: {args.rows:,} 行を投入 ({time.perf_counter() - began:.1f}s)')
+
+            def insert(table):
+                user_id = rng.randrange(1, args.users + 1)
+                values = ', '.join(['(%s, %s, %s, %s, now())'] * 10)
+                params = []
+                for _ in range(10):
+                    params += [user_id, rng.randrange(1, args.questions + 1), 'B', rng.random() < 0.6]
+                cursor.execute(
+                    f'INSERT INTO {table} (user_id, question_id, selected_answer, is_correct, answered_at) VALUES {values}',
+                    params,
+                )
+
+            def recent(table):
+                cursor.execute(
+                    f"SELECT question_id, is_correct, answered_at FROM {table}"
+                    f" WHERE user_id = %s AND answered_at >= now() - interval '30 days' ORDER BY answered_at DESC",
+                    [rng.randrange(1, args.users + 1)],
+                )
+                cursor.fetchall()
+
+            rollup_month = months[len(months) // 2]
+
+            def rollup(table):
+                month_start_at, month_end_at = month_range(rollup_month)
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM (SELECT user_id, question_id, COUNT(*) FROM {table}'
+                    f' WHERE answered_at >= %s AND answered_at < %s GROUP BY user_id, question_id) AS grouped',
+                    [month_start_at, month_end_at],
+                )
+                cursor.fetchone()
+
+            _, oldest_end = month_range(months[0])
+
+            def archive(table):
+                if table == SINGLE:
+                    cursor.execute(f'DELETE FROM {table} WHERE answered_at < %s', [oldest_end])
+                else:
+                    name = f'{PARTITIONED}_p{months[0]:%Y_%m}'
+                    cursor.execute(f'ALTER TABLE {PARTITIONED} DETACH PARTITION {name}')
+                    cursor.execute(f'DROP TABLE {name}')
+
+            print(f"{'':<10} {'single p50':>12} {'p95':>10} {'partitioned p50':>16} {'p95':>10}")
+            for name, func, repeat in (
+                ('insert', insert, args.repeat),
+                ('recent', recent, args.repeat),
+                ('rollup', rollup, 3),
+                ('archive', archive, 1),
+            ):
+                single = measure(lambda: func(SINGLE), repeat)
+                partitioned = measure(lambda: func(PARTITIONED), repeat)
+                print(
+                    f'{name:<10} {single[0]:>10.2f}ms {single[1]:>8.2f}ms '
+                    f'{partitioned[0]:>14.2f}ms {partitioned[1]:>8.2f}ms'
+                )
+
+            for table in (SINGLE, PARTITIONED):
+                cursor.execute(f'DROP TABLE {table}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Part 7 (長文) のクイズ・採点結果のレスポンスサイズとクエリ数: 長文を問題文にコピーする場合と Passage で共有する場合の比較
+
+    python -m benchmarks.passages [--passages 300] [--per-passage 4] [--passage-chars 1500] [--quiz-passages 3]
+
+--per-passage 問ずつ長文を共有する Part 7 の問題を2通りの形で投入する。
+    inline  : 長文を各設問の question_text の先頭にコピーする (Passage を使わない従来の形)
+    passage : Passage に1回だけ保存し、Question.passage から参照する (?passages=1 で長文を1回だけ返す)
+--quiz-passages 個の長文の設問をまとめた1回分 (Part 7 の1セット) について、
+/api/quiz/ と同じ出題用の JSON と /api/results/ の JSON のサイズ (gzip 後も) と、
+キャッシュが空の場合・作成済みの場合のクエリ数を表示する。
+"""
+import argparse
+import gzip
+import random
+
+from benchmarks import bench_database, setup_django
+
+
+def seed_part7(passages, per_passage, chars, rng):
+    """
+    同じ内容の Part 7 の問題を inline と passage の2通りで作成し、長文ごとの問題IDのリストを返す
+    """
+    from quiz.models import Passage, Question, question_content_hash
+
+    # gzip で極端に縮まないよう、ランダムな単語で長文を作る
+    words = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(2, 10))) for _ in range(3000)]
+    groups = {'inline': [], 'passage': []}
+    for n in range(passages):
+        text = ' '.join(rng.choice(words) for _ in range(chars // 7))[:chars]
+        passage = Passage.objects.create(title=f'Passage {n}', passage_text=text)
+        for style in ('inline', 'passage'):
+            questions = [
+                Question(
+                    question_text=(f'{text}\n\n' if style == 'inline' else '') + f'Question {n}-{k} about the passage?',
+                    passage=passage if style == 'passage' else None,
+                    option_a='To confirm an order', option_b='To request a refund',
+                    option_c='To announce a meeting', option_d='To change a schedule',
+                    correct_answer=rng.choice('ABCD'), explanation='The first paragraph says so. ' * 5,
+                    part='PART7',
+                )
+                for k in range(per_passage)
+            ]
+            for question in questions:
+                question.content_hash = question_content_hash(question.question_text, question.passage_id)
+            groups[style].append([question.pk for question in Question.objects.bulk_create(questions)])
+    return groups
+
+
+def measure(fetch):
+    """
+    fetch() のレスポンス (bytes) の (サイズ, gzip 後のサイズ, キャッシュが空のクエリ数, 作成済みのクエリ数) を返す
+    """
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    cache.clear()
+    with CaptureQueriesContext(connection) as cold:
+        fetch()
+    with CaptureQueriesContext(connection) as warm:
+        body = fetch()
+    return len(body), len(gzip.compress(body)), len(cold), len(warm)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--passages', type=int, default=300)
+    parser.add_argument('--per-passage', type=int, default=4, help='1つの長文を共有する設問の数 (2〜5)')
+    parser.add_argument('--passage-chars', type=int, default=1500)
+    parser.add_argument('--quiz-passages', type=int, default=3, help='1回のクイズに含める長文の数')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from quiz.models import Passage, Question, Result
+    from quiz.payloads import questions_payload, results_payload
+
+    with bench_database():
+        rng = random.Random(0)
+        groups = seed_part7(args.passages, args.per_passage, args.passage_chars, rng)
+        user = User.objects.create(username='passages-bench')
+        picked = rng.sample(range(args.passages), args.quiz_passages)
+
+        for style in ('inline', 'passage'):
+            texts = Question.objects.filter(pk__in=sum(groups[style], [])).values_list('question_text', flat=True)
+            stored = sum(len(text) for text in texts)
+            if style == 'passage':
+                stored += sum(len(text) for text in Passage.objects.values_list('passage_text', flat=True))
+            print(f'{style}: 問題文・長文の合計 {stored:,} 文字')
+
+        print(f"{'style':<8} {'response':<8} {'bytes':>8} {'gzip':>7} {'queries(cold)':>14} {'queries(warm)':>14}")
+        for style, passages in (('inline', False), ('passage', True)):
+            question_ids = [question_id for n in picked for question_id in groups[style][n]]
+            results = Result.objects.bulk_create([
+                Result(user=user, question_id=question_id, selected_answer='A', is_correct=False)
+                for question_id in question_ids
+            ])
+            rows = list(Result.objects.filter(pk__in=[result.pk for result in results]).values(
+                'id', 'user_id', 'question_id', 'selected_answer', 'is_correct', 'answered_at'
+            ))
+            for name, fetch in (
+                ('quiz', lambda: questions_payload(question_ids, passages=passages)),
+                ('results', lambda: results_payload(rows, passages=passages)),
+            ):
+                size, compressed, cold, warm = measure(fetch)
+                print(f'{style:<8} {name:<8} {size:>8} {compressed:>7} {cold:>14} {warm:>14}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+QuizAPIView の問題抽出: ORDER BY RANDOM() と QuestionSampler の比較
+
+    python -m benchmarks.sampler [--sizes 10000 100000 1000000] [--repeat 50]
+"""
+import argparse
+
+from benchmarks import bench_database, setup_django, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from quiz.models import Question
+    from quiz.sampling import QuestionSampler
+    from benchmarks.seed import seed_questions
+
+    with bench_database():
+        print(f"{'questions':>10} {'order_by(?)':>14} {'sampler':>10} {'range':>10} {'rebuild':>10}")
+        seeded = 0
+        for size in sorted(args.sizes):
+            seed_questions(size - seeded, start=seeded)
+            seeded = size
+
+            sampler = QuestionSampler()
+            order_by_random = timeit(lambda: list(Question.objects.order_by('?')[:10]), args.repeat)
+            rebuild = timeit(lambda: (sampler.invalidate(), sampler.count()), 1)
+            sampled = timeit(lambda: sampler.sample(10), args.repeat)
+            ranged = timeit(
+                lambda: sampler.sample(10, part='PART5', min_difficulty=500, max_difficulty=700),
+                args.repeat,
+            )
+            print(
+                f"{size:>10} {order_by_random * 1000:>12.2f}ms {sampled * 1000:>8.2f}ms "
+                f"{ranged * 1000:>8.2f}ms {rebuild * 1000:>8.1f}ms"
+            )
+
+
+if __name__ == '__main__':
+    main()
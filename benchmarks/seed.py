@@ -0,0 +1,72 @@
+"""
+計測用のダミーデータを投入する関数群
+"""
+import random
+
+from django.db import transaction
+
+PARTS = ('PART5', 'PART7')
+
+
+def seed_questions(count, batch_size=5000, start=0):
+    """
+    ダミーの Question を count 件作成する
+    """
+    from quiz.models import Question
+
+    rng = random.Random(start)
+    with transaction.atomic():
+        for offset in range(start, start + count, batch_size):
+            Question.objects.bulk_create([
+                Question(
+                    question_text=f"Benchmark question {n} ------- sample text.",
+                    option_a='alpha', option_b='beta', option_c='gamma', option_d='delta',
+                    correct_answer=rng.choice('ABCD'),
+                    explanation='Benchmark explanation.',
+                    part=rng.choice(PARTS),
+                    difficulty_level=rng.randrange(300, 990, 5),
+                )
+                for n in range(offset, min(offset + batch_size, start + count))
+            ], batch_size=batch_size)
+
+
+def seed_users(count, password, prefix='bench-'):
+    """
+    ダミーのユーザーを count 件作成し、ユーザー名のリストを返す
+    (パスワードのハッシュ化は1回だけ行い、全員で同じハッシュを使う)
+    """
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+
+    encoded = make_password(password)
+    usernames = [f'{prefix}{n}' for n in range(count)]
+    User.objects.bulk_create([User(username=username, password=encoded) for username in usernames], batch_size=1000)
+    return usernames
+
+
+def seed_results(usernames, per_user, seed=0, batch_size=5000):
+    """
+    各ユーザーにランダムな問題への解答を per_user 件ずつ作成し、成績集計を作り直す
+    """
+    from django.contrib.auth.models import User
+    import io
+    from django.core.management import call_command
+    from quiz.models import Question, Result
+
+    rng = random.Random(seed)
+    questions = list(Question.objects.values_list('id', 'correct_answer'))
+    per_user = min(per_user, len(questions))
+    results = []
+    with transaction.atomic():
+        for user_id in User.objects.filter(username__in=usernames).values_list('id', flat=True):
+            for question_id, correct_answer in rng.sample(questions, per_user):
+                selected_answer = rng.choice('ABCD')
+                results.append(Result(
+                    user_id=user_id, question_id=question_id,
+                    selected_answer=selected_answer, is_correct=(selected_answer == correct_answer),
+                ))
+            if len(results) >= batch_size:
+                Result.objects.bulk_create(results, batch_size=batch_size)
+                results = []
+        Result.objects.bulk_create(results, batch_size=batch_size)
+    call_command('rebuild_user_stats', stdout=io.StringIO())
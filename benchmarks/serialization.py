@@ -0,0 +1,51 @@
+"""
+1リクエストあたりのシリアライズ時間: DRF シリアライザと作成済み JSON の連結の比較
+(QuizAPIView: 10問、QuizResultAPIView: 10件。データベースの取得時間は含まない)
+
+    python -m benchmarks.serialization [--repeat 2000]
+"""
+import argparse
+
+from benchmarks import bench_database, setup_django, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from rest_framework.renderers import JSONRenderer
+    from quiz.models import Question, Result
+    from quiz.payloads import questions_payload, results_payload
+    from quiz.serializers import QuestionSerializer, ResultSerializer
+    from benchmarks.seed import seed_questions
+
+    renderer = JSONRenderer()
+    with bench_database():
+        seed_questions(10)
+        questions = list(Question.objects.all())
+        question_ids = [question.id for question in questions]
+        user = User.objects.create(username='bench')
+        Result.objects.bulk_create([Result(user=user, question=question, selected_answer='A') for question in questions])
+        results = list(Result.objects.select_related('question'))
+        rows = list(Result.objects.values('id', 'user_id', 'question_id', 'selected_answer', 'is_correct', 'answered_at'))
+
+        # キャッシュを温めておく
+        questions_payload(question_ids)
+        results_payload(rows)
+
+        cases = [
+            ('QuizAPIView', 'serializer', lambda: renderer.render(QuestionSerializer(questions, many=True).data)),
+            ('QuizAPIView', 'fragments', lambda: questions_payload(question_ids)),
+            ('QuizResultAPIView', 'serializer', lambda: renderer.render(ResultSerializer(results, many=True).data)),
+            ('QuizResultAPIView', 'fragments', lambda: results_payload(rows)),
+        ]
+        print(f"{'view':<20} {'method':<12} {'per request':>12}")
+        for view, method, func in cases:
+            print(f"{view:<20} {method:<12} {timeit(func, args.repeat) * 1e6:>10.1f}us")
+
+
+if __name__ == '__main__':
+    main()
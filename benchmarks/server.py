@@ -0,0 +1,214 @@
+"""
+実際のサーバー (gunicorn / uvicorn) を起動して計測するスクリプト用の共通処理
+
+サーバープロセスは benchmarks.server:wsgi_app() / asgi_app() を読み込む。
+どちらもレスポンスヘッダー X-Bench-Queries にそのリクエストで実行したクエリ数を付け、
+BENCH_DB_LATENCY_MS が指定されていればクエリごとに待ちを入れる。
+"""
+import contextlib
+import contextvars
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import setup_django
+
+ROOT = Path(__file__).resolve().parent.parent
+HOST = '127.0.0.1'
+QUERY_COUNT_HEADER = 'X-Bench-Queries'
+
+# リクエストごとのクエリ数 ([件数] のリスト。sync_to_async のスレッドにも同じものが引き継がれる)
+_query_counter = contextvars.ContextVar('bench_query_counter', default=None)
+
+
+def _install_wrappers():
+    """
+    すべてのDB接続にクエリ数の計測と (指定されていれば) 待ちを入れる
+    """
+    from django.db.backends.signals import connection_created
+
+    latency = float(os.environ.get('BENCH_DB_LATENCY_MS') or 0) / 1000
+
+    def wrapper(execute, sql, params, many, context):
+        counter = _query_counter.get()
+        if counter is not None:
+            counter[0] += 1
+        if latency:
+            time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def on_connection_created(sender, connection, **kwargs):
+        # 再接続のたびに同じ DatabaseWrapper で呼ばれるので、二重に登録しない
+        # (接続はリクエストの途中で作られるので、先頭に入れる。末尾に入れると MetricsMiddleware の
+        #  execute_wrapper() の終了時に pop() でこちらが外され、2回目以降のリクエストが数えられない)
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, wrapper)
+
+    connection_created.connect(on_connection_created, weak=False)
+
+
+def wsgi_app():
+    """
+    gunicorn 用のアプリケーション (benchmarks.server:wsgi_app())
+    """
+    setup_django()
+    _install_wrappers()
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+
+    def counting_application(environ, start_response):
+        counter = [0]
+        token = _query_counter.set(counter)
+
+        def counting_start_response(status, headers, exc_info=None):
+            return start_response(status, [*headers, (QUERY_COUNT_HEADER, str(counter[0]))], exc_info)
+
+        try:
+            return application(environ, counting_start_response)
+        finally:
+            _query_counter.reset(token)
+
+    return counting_application
+
+
+def asgi_app():
+    """
+    uvicorn 用のアプリケーション (benchmarks.server:asgi_app)
+    """
+    setup_django()
+    _install_wrappers()
+    from django.core.asgi import get_asgi_application
+    application = get_asgi_application()
+    header = QUERY_COUNT_HEADER.lower().encode()
+
+    async def counting_application(scope, receive, send):
+        if scope['type'] != 'http':
+            return await application(scope, receive, send)
+        counter = [0]
+        _query_counter.set(counter)
+
+        async def counting_send(message):
+            if message['type'] == 'http.response.start':
+                message = {**message, 'headers': [*message.get('headers', []), (header, str(counter[0]).encode())]}
+            await send(message)
+
+        await application(scope, receive, counting_send)
+
+    return counting_application
+
+
+@contextlib.contextmanager
+def standalone_database(url=None):
+    """
+    サーバープロセスと共有するデータベースを DATABASE_URL に設定する
+    (url が無ければ一時ファイルの SQLite を作り、終了時に削除する)
+    setup_django() より前に呼び出すこと
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        # 複数のワーカーから同時に書き込むため、ロック待ちを長めにして書き込みトランザクションは最初にロックを取る
+        os.environ['DATABASE_URL'] = url or (
+            f"sqlite:///{Path(workdir) / 'bench.sqlite3'}?transaction_mode=IMMEDIATE&timeout=30"
+        )
+        os.environ['DEBUG'] = 'False'
+        yield os.environ['DATABASE_URL']
+
+
+def prepare_database():
+    """
+    マイグレーションを適用する (SQLite の場合は読み込みと書き込みが並行できる WAL モードにする)
+    """
+    from django.core.management import call_command
+    from django.db import connection
+
+    call_command('migrate', verbosity=0)
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((HOST, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'サーバーが起動しませんでした (port {port})')
+
+
+def process_tree_rss(pid):
+    """
+    pid とその子プロセスの RSS の合計 (MiB)
+    """
+    children = {}
+    for entry in Path('/proc').iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / 'stat').read_text()
+        except OSError:
+            continue
+        # comm に空白が含まれる場合があるので ')' の後ろから読む
+        ppid = int(stat.rsplit(')', 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            for line in Path(f'/proc/{current}/status').read_text().splitlines():
+                if line.startswith('VmRSS:'):
+                    total += int(line.split()[1])
+        except OSError:
+            pass
+        stack.extend(children.get(current, []))
+    return total / 1024
+
+
+def server_command(kind, workers, port):
+    """
+    kind は 'gunicorn' (同期ワーカー) か 'uvicorn' (ASGI)
+    """
+    if kind == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', 'benchmarks.server:wsgi_app()',
+                '-w', str(workers), '-b', f'{HOST}:{port}']
+    if kind == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', 'benchmarks.server:asgi_app', '--factory',
+                '--workers', str(workers), '--host', HOST, '--port', str(port), '--no-access-log']
+    raise ValueError(f'不明なサーバーの種類です: {kind}')
+
+
+@contextlib.contextmanager
+def run_server(kind, workers, db_latency_ms=0):
+    """
+    サーバーを起動し、待ち受けを始めたら (port, Popen) を返す。終了時に停止する
+    """
+    port = free_port()
+    env = {
+        **os.environ,
+        'PYTHONPATH': str(ROOT),
+        'BENCH_DB_LATENCY_MS': str(db_latency_ms),
+        # ASGI では永続接続を使わない (config/settings.py の DB_CONN_MAX_AGE)
+        **({'DB_CONN_MAX_AGE': '0'} if kind == 'uvicorn' else {}),
+    }
+    server = subprocess.Popen(
+        server_command(kind, workers, port), cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        yield port, server
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
@@ -0,0 +1,157 @@
+"""
+授業の終了時のような解答送信の集中: リクエストごとに保存する場合と、スプールに追記してまとめて保存する場合の比較
+
+    python -m benchmarks.submit_burst [--learners 200] [--rounds 5] [--workers 4]
+                                      [--flush-size 200 --flush-interval 0.5] [--database-url ...]
+
+--learners 人が同時に (Barrier で揃えて) /api/quiz/submit/ に10問の解答を送ることを --rounds 回繰り返す。
+同じデータベースに対して、gunicorn を2回起動して計測する。
+    direct : 従来どおりリクエストごとに1トランザクションで保存する
+    spool  : SUBMIT_SPOOL_DIR を設定し、各ワーカーのスレッドが FLUSH_SIZE 件ずつまとめて保存する
+spool は全件が保存される (SubmissionReceipt が送信数に達する) まで待ち、その時間も表示する。
+トランザクション数は、direct は成功したリクエスト数、spool は SubmissionReceipt の保存日時の種類の数。
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup_django
+from benchmarks.loadtest import percentile
+from benchmarks.server import HOST, QUERY_COUNT_HEADER, prepare_database, run_server, standalone_database
+
+QUIZ_SIZE = 10
+
+
+def burst(port, tokens, questions, rounds, seed):
+    """
+    全員が同時に解答を送信することを rounds 回繰り返し、(レイテンシ (ミリ秒) のリスト, クエリ数のリスト, エラー数) を返す
+    """
+    barrier = threading.Barrier(len(tokens))
+
+    def learner(n):
+        rng = random.Random(seed * 100003 + n)
+        connection = http.client.HTTPConnection(HOST, port, timeout=120)
+        headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {tokens[n]}'}
+        latencies, queries, errors = [], [], 0
+        for _ in range(rounds):
+            answers = [
+                {'question_id': question_id, 'selected_answer': rng.choice('ABCD')}
+                for question_id in rng.sample(questions, QUIZ_SIZE)
+            ]
+            barrier.wait()
+            start = time.perf_counter()
+            try:
+                connection.request('POST', '/api/quiz/submit/', body=json.dumps(answers), headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(HOST, port, timeout=120)
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not 200 <= response.status < 300:
+                errors += 1
+            count = response.getheader(QUERY_COUNT_HEADER)
+            if count is not None:
+                queries.append(int(count))
+        connection.close()
+        return latencies, queries, errors
+
+    latencies, queries, errors = [], [], 0
+    with ThreadPoolExecutor(max_workers=len(tokens)) as pool:
+        for learner_latencies, learner_queries, learner_errors in pool.map(learner, range(len(tokens))):
+            latencies += learner_latencies
+            queries += learner_queries
+            errors += learner_errors
+    latencies.sort()
+    return latencies, queries, errors
+
+
+def wait_for_receipts(expected, timeout):
+    """
+    SubmissionReceipt が expected 件になるまで待ち、(待った秒数, トランザクション数) を返す
+    """
+    from django.db import connection
+    from quiz.models import SubmissionReceipt
+
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if SubmissionReceipt.objects.count() >= expected:
+            break
+        time.sleep(0.05)
+    waited = time.perf_counter() - start
+    transactions = SubmissionReceipt.objects.values('applied_at').distinct().count()
+    connection.close()
+    return waited, transactions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--learners', type=int, default=200, help='同時に送信する学習者の数')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--questions', type=int, default=5000)
+    parser.add_argument('--flush-size', type=int, default=200)
+    parser.add_argument('--flush-interval', type=float, default=0.5)
+    parser.add_argument('--database-url', help='投入先のデータベース (未指定なら一時ファイルの SQLite)')
+    parser.add_argument('--db-latency-ms', type=float, default=0, help='クエリごとに入れる待ち時間')
+    parser.add_argument('--user-prefix', default='burst-')
+    args = parser.parse_args()
+
+    with standalone_database(args.database_url), tempfile.TemporaryDirectory() as spool_dir:
+        setup_django()
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from rest_framework_simplejwt.tokens import AccessToken
+        from benchmarks.seed import seed_questions, seed_users
+        from quiz.models import Question, SubmissionReceipt
+
+        prepare_database()
+        User.objects.filter(username__startswith=args.user_prefix).delete()
+        SubmissionReceipt.objects.all().delete()
+        missing = args.questions - Question.objects.count()
+        if missing > 0:
+            seed_questions(missing, start=Question.objects.count())
+        seed_users(args.learners, 'burst-password', prefix=args.user_prefix)
+        users = User.objects.filter(username__startswith=args.user_prefix).order_by('id')
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        questions = list(Question.objects.values_list('id', flat=True))
+        connection.close()
+
+        rows = []
+        for mode in ('direct', 'spool'):
+            if mode == 'spool':
+                os.environ.update({
+                    'SUBMIT_SPOOL_DIR': spool_dir,
+                    'SUBMIT_SPOOL_FLUSH_SIZE': str(args.flush_size),
+                    'SUBMIT_SPOOL_FLUSH_INTERVAL': str(args.flush_interval),
+                })
+            with run_server('gunicorn', args.workers, args.db_latency_ms) as (port, _):
+                started = time.perf_counter()
+                latencies, queries, errors = burst(port, tokens, questions, args.rounds, seed=len(rows))
+                elapsed = time.perf_counter() - started
+                if mode == 'spool':
+                    waited, transactions = wait_for_receipts(len(latencies) - errors, timeout=300)
+                else:
+                    waited, transactions = 0.0, len(latencies) - errors
+            rows.append((mode, latencies, queries, errors, elapsed, waited, transactions))
+
+    print(f"{'mode':<8} {'requests':>9} {'errors':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8} {'tx':>6} {'drain':>8}")
+    for mode, latencies, queries, errors, elapsed, waited, transactions in rows:
+        mean_queries = f'{sum(queries) / len(queries):.1f}' if queries else '-'
+        print(
+            f'{mode:<8} {len(latencies):>9} {errors:>7} {percentile(latencies, 50):>7.1f}ms '
+            f'{percentile(latencies, 95):>7.1f}ms {percentile(latencies, 99):>7.1f}ms '
+            f'{mean_queries:>8} {transactions:>6} {waited:>7.2f}s'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+読み取り専用のレプリカへのクエリの振り分け (DATABASE_REPLICA_URLS を設定した場合)
+
+レプリカから読むのは、read_from_replica を付けたビュー (クイズ取得・採点結果の取得) と、
+管理画面の GET / HEAD (ReplicaRoutingMiddleware) の間だけ。それ以外の読み取りと全ての書き込みはプライマリ (default) に送る。
+レプリカは1リクエストの間は同じものを使い、DATABASE_REPLICA_WEIGHTS の重みでランダムに選ぶ。
+
+レプリカは遅れて反映されるので、解答を送信したユーザー (pin_to_primary) と管理画面で変更したユーザーは、
+DATABASE_REPLICA_STICKY_SECONDS 秒の間はレプリカを使わずにプライマリから読む (自分の書き込みが見えるようにする)。
+共有のキャッシュを作る読み取り (quiz.payloads・quiz.sampling) は、範囲内でも .using(DEFAULT_DB_ALIAS) でプライマリから読む。
+"""
+import contextvars
+import functools
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import NoReverseMatch, reverse
+
+# レプリカの接続名の接頭辞 (settings で replica1, replica2, ... として登録する)
+REPLICA_PREFIX = 'replica'
+
+# 読み取りに使う接続名 (None ならプライマリ)
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def replica_aliases():
+    """
+    登録されているレプリカの接続名のリスト
+    """
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+
+def choose_replica():
+    """
+    重み付きでランダムにレプリカを1つ選ぶ (レプリカが無ければ None)
+    """
+    aliases = replica_aliases()
+    if not aliases:
+        return None
+    weights = getattr(settings, 'DATABASE_REPLICA_WEIGHTS', None) or None
+    return random.choices(aliases, weights=weights)[0]
+
+
+def _sticky_key(user_id):
+    return f'db:sticky:{user_id}'
+
+
+def _sticky_seconds():
+    return getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 10)
+
+
+def pin_to_primary(user):
+    """
+    書き込んだユーザーの読み取りを、DATABASE_REPLICA_STICKY_SECONDS 秒の間プライマリに向ける
+    (キャッシュに記録する。他のワーカーのリクエストに効くのは、CACHE_URL で共有のキャッシュを設定した場合だけ)
+    """
+    if user.is_authenticated and replica_aliases():
+        cache.set(_sticky_key(user.pk), True, _sticky_seconds())
+
+
+async def apin_to_primary(user):
+    """
+    pin_to_primary の非同期版
+    """
+    if user.is_authenticated and replica_aliases():
+        await cache.aset(_sticky_key(user.pk), True, _sticky_seconds())
+
+
+def _replica_for(user):
+    if not replica_aliases() or (user.is_authenticated and cache.get(_sticky_key(user.pk))):
+        return None
+    return choose_replica()
+
+
+async def _areplica_for(user):
+    if not replica_aliases() or (user.is_authenticated and await cache.aget(_sticky_key(user.pk))):
+        return None
+    return choose_replica()
+
+
+def read_from_replica(method):
+    """
+    ビューのメソッド (同期・非同期) の中の読み取りをレプリカに向けるデコレーター
+    (DRF のビューでは認証が済んだ後に呼ばれるので、request.user で固定中かどうかを確認できる)
+    """
+    if iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(self, request, *args, **kwargs):
+            # sync_to_async で実行される ORM のスレッドにもコンテキストが引き継がれる
+            token = _read_alias.set(await _areplica_for(request.user))
+            try:
+                return await method(self, request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        token = _read_alias.set(_replica_for(request.user))
+        try:
+            return method(self, request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+class ReplicaRoutingMiddleware:
+    """
+    管理画面の GET / HEAD をレプリカから読み込み、管理画面での変更 (POST など) の後は
+    DATABASE_REPLICA_STICKY_SECONDS 秒の間、そのユーザーの読み取りをプライマリに向けるミドルウェア
+    (request.user を使うので AuthenticationMiddleware より後に置く。ASGI でもスレッドを挟まないよう同期・非同期の両方に対応する)
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._admin_prefix = None
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _is_admin(self, request):
+        # process_view は非同期ではスレッドを挟むので使わず、パスの接頭辞で判定する
+        if self._admin_prefix is None:
+            try:
+                self._admin_prefix = reverse('admin:index')
+            except NoReverseMatch:
+                self._admin_prefix = ''
+        return bool(self._admin_prefix) and request.path_info.startswith(self._admin_prefix)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_aliases() or not self._is_admin(request):
+            return self.get_response(request)
+        if request.method not in ('GET', 'HEAD'):
+            response = self.get_response(request)
+            pin_to_primary(request.user)
+            return response
+        token = _read_alias.set(_replica_for(request.user))
+        try:
+            return self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+
+    async def __acall__(self, request):
+        if not replica_aliases() or not self._is_admin(request):
+            return await self.get_response(request)
+        user = await request.auser()
+        if request.method not in ('GET', 'HEAD'):
+            response = await self.get_response(request)
+            await apin_to_primary(user)
+            return response
+        token = _read_alias.set(await _areplica_for(user))
+        try:
+            return await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """
+    読み取りは read_from_replica / ReplicaRoutingMiddleware で選んだレプリカ (無ければプライマリ)、書き込みはプライマリに送るルーター
+    """
+
+    def db_for_read(self, model, **hints):
+        # 明示的に default を返す (レプリカから読んだインスタンスの関連も、範囲外ではプライマリから読む)
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # レプリカはプライマリと同じデータなので、どの接続のインスタンスどうしでも関連付けてよい
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # マイグレーションはプライマリにだけ適用する (レプリカには複製で反映される)
+        return not db.startswith(REPLICA_PREFIX)
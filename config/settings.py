@@ -12,8 +12,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -56,12 +57,17 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'quiz.apps.QuizConfig',
     'accounts.apps.AccountsConfig',
+    'monitoring.apps.MonitoringConfig',
     'rest_framework',
     'corsheaders',
     'rest_framework_simplejwt',
 ]
 
 MIDDLEWARE = [
+    # リクエスト全体の時間を計測するため先頭に置く (monitoring.middleware)
+    'monitoring.middleware.MetricsMiddleware',
+    # PROFILING_ENABLED が False の場合は読み込まれない
+    'monitoring.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -69,6 +75,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # 管理画面の閲覧をレプリカに振り分ける (config.db_router。request.user を使うので認証の後に置く)
+    'config.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -100,10 +108,43 @@ DATABASES = {
     'default': dj_database_url.config(
         # .env ファイルの DB_... 設定をフォールバックとして使用
         default=f"postgres://{config('DB_USER')}:{config('DB_PASSWORD')}@{config('DB_HOST')}:{config('DB_PORT')}/{config('DB_NAME')}",
-        conn_max_age=600
+        # ASGI (uvicorn) で動かす場合は 0 にする (ASGI ではリクエストごとに接続が作られ、永続接続は再利用されないため)
+        conn_max_age=config('DB_CONN_MAX_AGE', default=600, cast=int)
     )
 }
 
+# 読み取り専用のレプリカ (config.db_router)。カンマ区切りの URL を replica1, replica2, ... として登録し、
+# クイズ取得・採点結果の取得・管理画面の閲覧の読み取りだけをレプリカに送る (書き込みは常に default)
+DATABASE_REPLICA_URLS = config('DATABASE_REPLICA_URLS', default='', cast=Csv())
+# レプリカを選ぶ重み (URL と同じ順・同じ数。空なら均等)
+DATABASE_REPLICA_WEIGHTS = config('DATABASE_REPLICA_WEIGHTS', default='', cast=Csv(int))
+if DATABASE_REPLICA_WEIGHTS and len(DATABASE_REPLICA_WEIGHTS) != len(DATABASE_REPLICA_URLS):
+    raise ImproperlyConfigured('DATABASE_REPLICA_WEIGHTS の数が DATABASE_REPLICA_URLS と一致しません。')
+# 解答を送信した (管理画面で変更した) ユーザーの読み取りを、この秒数だけプライマリに向ける (レプリカの遅延対策)
+DATABASE_REPLICA_STICKY_SECONDS = config('DATABASE_REPLICA_STICKY_SECONDS', default=10, cast=int)
+for number, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    DATABASES[f'replica{number}'] = {
+        **dj_database_url.parse(url, conn_max_age=DATABASES['default']['CONN_MAX_AGE']),
+        # テストではレプリカ用のデータベースを作らず、default をそのまま使う
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['config.db_router.ReplicaRouter']
+
+# Django のキャッシュ (問題・長文の JSON、問題バンクのバージョン、レプリカの読み取りの固定など)
+# CACHE_URL (redis://...) を設定すると全てのワーカーで共有する Redis を使う (空ならプロセスごとのメモリ)
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+# レプリカの読み取りの固定 (pin_to_primary) はキャッシュに記録するので、プロセスごとのメモリでは
+# 別のワーカーへのリクエストが遅れたレプリカを読んでしまう (1プロセスで動かす開発時 (DEBUG) だけは許可する)
+if DATABASE_REPLICA_URLS and not CACHE_URL and not DEBUG:
+    raise ImproperlyConfigured('DATABASE_REPLICA_URLS を使う場合は、CACHE_URL に全てのワーカーで共有するキャッシュを設定してください。')
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -201,7 +242,9 @@ if DEBUG:
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication と同じ検証を行い、User はプロセス内のキャッシュから返す
+        # (キャッシュを使わない場合は 'rest_framework_simplejwt.authentication.JWTAuthentication')
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
          # デフォルトでは認証が必要（APIView ごとに変更可能）
@@ -212,4 +255,65 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60), # アクセストークンは60分有効
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),   # リフレッシュトークンは1日有効
-}
\ No newline at end of file
+}
+
+# 認証用ユーザーキャッシュ (accounts.authentication.CachedJWTAuthentication)
+# User の保存・削除はシグナル (post_save / post_delete) で同じプロセスのキャッシュから消す。
+# シグナルの届かない変更 (他のワーカーでの変更、QuerySet.update() での無効化・パスワード変更) は反映されず、
+# 最大 TTL 秒の間は変更前のユーザーで認証が通る (すぐに止める必要がある場合は TTL を短くする)
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=60, cast=int)
+AUTH_USER_CACHE_SIZE = config('AUTH_USER_CACHE_SIZE', default=1024, cast=int)
+
+# ランキング (quiz.leaderboard / /api/leaderboard/)
+# 上位の並びはプロセスごとのスナップショットで、最大 LEADERBOARD_SNAPSHOT_MAX_AGE 秒遅れて反映される
+LEADERBOARD_SNAPSHOT_MAX_AGE = config('LEADERBOARD_SNAPSHOT_MAX_AGE', default=60, cast=int)
+# 正答率のランキングに載るのに必要な解答数
+LEADERBOARD_MIN_ANSWERED = config('LEADERBOARD_MIN_ANSWERED', default=20, cast=int)
+
+# オフライン用の問題パック (quiz.packs / /api/quiz/pack/)
+# 問題の変更はシグナルで即座に反映され、bulk_update などシグナルの無い変更も最大 QUIZ_PACK_MAX_AGE 秒で反映される
+QUIZ_PACK_MAX_AGE = config('QUIZ_PACK_MAX_AGE', default=600, cast=int)
+# ?since= の差分に使う過去のバージョンのダイジェストをキャッシュに残す秒数 (過ぎたら全件を返す)
+QUIZ_PACK_DELTA_TTL = config('QUIZ_PACK_DELTA_TTL', default=7 * 24 * 3600, cast=int)
+
+# 解答の保存を遅らせるモード (quiz.spool)
+# SUBMIT_SPOOL_DIR を設定すると、/api/quiz/submit/ はメモリ上の正解で採点してこのディレクトリに追記し、すぐに 202 を返す
+# (サーバーごとのローカルディスクを指定する。空なら従来どおりリクエストごとに保存する)
+SUBMIT_SPOOL_DIR = config('SUBMIT_SPOOL_DIR', default='')
+# 1トランザクションで保存する最大の送信数と、追記から保存までの最大の待ち時間 (秒)
+SUBMIT_SPOOL_FLUSH_SIZE = config('SUBMIT_SPOOL_FLUSH_SIZE', default=200, cast=int)
+SUBMIT_SPOOL_FLUSH_INTERVAL = config('SUBMIT_SPOOL_FLUSH_INTERVAL', default=1.0, cast=float)
+# 応答の前に fsync する (False にするとOSのクラッシュで直前の送信が失われることがある)
+SUBMIT_SPOOL_FSYNC = config('SUBMIT_SPOOL_FSYNC', default=True, cast=bool)
+# 各ワーカーのスレッドで保存する (False の場合は manage.py drain_submissions --loop を別に動かす)
+SUBMIT_SPOOL_DRAIN_IN_PROCESS = config('SUBMIT_SPOOL_DRAIN_IN_PROCESS', default=True, cast=bool)
+# 保存にこの回数失敗したファイルは .failed にして、以降は保存しない (内容を確認して対処する)
+SUBMIT_SPOOL_MAX_ATTEMPTS = config('SUBMIT_SPOOL_MAX_ATTEMPTS', default=3, cast=int)
+
+# 名簿からのユーザーの一括登録 (accounts.provisioning / manage.py provision_users)
+# パスワードのハッシュ化に使うプロセス数 (0 なら CPU 数)
+PROVISION_HASH_WORKERS = config('PROVISION_HASH_WORKERS', default=0, cast=int)
+
+# 管理画面の一覧 (quiz.paginators.EstimatedCountPaginator)
+# PostgreSQL の推定件数がこの値以上なら、正確な COUNT(*) を行わずに推定値でページ分けする
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=100000, cast=int)
+
+# リクエストの計測 (monitoring.middleware.MetricsMiddleware / /metrics)
+# gunicorn で複数ワーカーを動かす場合は METRICS_DIR にワーカー間で共有するディレクトリを指定する
+# (各ワーカーが METRICS_FLUSH_INTERVAL 秒ごとに集計を書き出し、/metrics で合算する。終了したワーカーのファイルは
+# 合算したワーカーが取り込んで削除する。pid で判定するのでサーバーごとのディレクトリにし、デプロイ時に空にすること)
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5.0, cast=float)
+# /metrics へのアクセスに使う Authorization: Bearer <METRICS_TOKEN> (未設定なら管理者のログインでのみ閲覧できる)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# リクエストのプロファイル (monitoring.middleware.ProfilingMiddleware / /admin/profiles/)
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+# N 件に1件をプロファイルする (0 なら X-Profile ヘッダーの付いたリクエストだけ)
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0, cast=int)
+# スタックを取得する間隔 (秒)
+PROFILING_SAMPLE_INTERVAL = config('PROFILING_SAMPLE_INTERVAL', default=0.005, cast=float)
+# X-Profile ヘッダーの値 (manage.py profiling_token) の有効期限 (秒)
+PROFILING_TOKEN_MAX_AGE = config('PROFILING_TOKEN_MAX_AGE', default=3600, cast=int)
+# 複数ワーカーの結果を合算する場合に、ワーカー間で共有するディレクトリ
+PROFILING_DIR = config('PROFILING_DIR', default='')
@@ -16,12 +16,18 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from monitoring.views import metrics_view
+from quiz.views import export_view
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
 
 urlpatterns = [
+    # プロファイル結果 (管理者のみ, monitoring)
+    path('admin/profiles/', include('monitoring.urls')),
+    # 問題・解答履歴の書き出し (管理者のみ, quiz.export)
+    path('admin/export/<str:kind>/', export_view, name='export_data'),
     path('admin/', admin.site.urls),
     # トップページ ('') へのアクセスが来たら、
     # quizアプリ内の urls.py を見に行くよう設定
@@ -31,4 +37,6 @@ urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     # JWT トークンリフレッシュ API
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    # Prometheus 形式のメトリクス (monitoring)
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from monitoring.middleware import PROFILE_HEADER
+from monitoring.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = 'リクエストをプロファイルさせるための署名付きヘッダーの値を表示します (PROFILING_TOKEN_MAX_AGE 秒有効)。'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{PROFILE_HEADER}: {make_token()}')
@@ -0,0 +1,282 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+# レイテンシのヒストグラムの区切り (秒, Prometheus クライアントのデフォルトと同じ)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ビューごとの集計値のリストの並び (この後ろに各バケットの件数が続く)
+COUNT, DURATION, DB_QUERIES, DB_DURATION = range(4)
+_BUCKETS_START = 4
+
+PREFIX = 'eigoquest'
+
+
+def _new_row():
+    return [0, 0.0, 0, 0.0] + [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+class MetricsRegistry:
+    """
+    プロセス内のリクエスト集計
+
+    (view, method) ごとの件数・合計時間・クエリ数・DB時間・レイテンシのヒストグラムと、
+    (view, method, status) ごとの件数を持つ。
+    METRICS_DIR が設定されていれば、バックグラウンドのスレッドが METRICS_FLUSH_INTERVAL 秒ごとに
+    プロセスごとの JSON ファイル ({pid}-{ランダムなID}.json) に書き出し、/metrics ではディレクトリ内の全ファイルを合算して返す
+    (gunicorn の複数ワーカー用。pid は再利用されるので、終了したワーカーのファイルを上書きしないよう ID を付ける)。
+    合算するときに、終了したプロセスのファイルは自分の集計に取り込んでから削除する (カウンタを減らさずにファイルを増やさない)。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._statuses = {}
+        self._dirty = False
+        # 書き出し用のスレッド (None: 未確認, False: METRICS_DIR 未設定のため不要)
+        self._flusher = None
+        # 書き出すファイルの名前に使う (pid, ID)
+        self._instance = None
+
+    @property
+    def directory(self):
+        directory = getattr(settings, 'METRICS_DIR', '')
+        return Path(directory) if directory else None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0)
+
+    def observe(self, view, method, status, duration, db_queries, db_duration):
+        """
+        1リクエスト分を記録する (リクエストごとに呼ばれるので、辞書の更新だけにしておく)
+        """
+        bucket = _BUCKETS_START + bisect.bisect_left(LATENCY_BUCKETS, duration)
+        with self._lock:
+            row = self._views.get((view, method))
+            if row is None:
+                row = self._views[(view, method)] = _new_row()
+            row[COUNT] += 1
+            row[DURATION] += duration
+            row[DB_QUERIES] += db_queries
+            row[DB_DURATION] += db_duration
+            row[bucket] += 1
+            key = (view, method, status)
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+            self._dirty = True
+
+        if self._flusher is None:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        """
+        最初のリクエストで (fork 後のワーカーの中で) 書き出し用のスレッドを起動する
+        """
+        with self._lock:
+            if self._flusher is not None:
+                return
+            if self.directory is None:
+                self._flusher = False
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True)
+        self._flusher.start()
+        # ワーカーの終了時にも書き出す
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            with self._lock:
+                dirty = self._dirty
+            if dirty:
+                self.flush()
+
+    def snapshot(self):
+        """
+        現在の集計を JSON に変換できる形で返す
+        """
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        return {
+            'views': [[view, method, *row] for (view, method), row in self._views.items()],
+            'statuses': [[*key, count] for key, count in self._statuses.items()],
+        }
+
+    def _file_name(self):
+        # fork した子プロセス (gunicorn の preload など) では親と別の ID にする
+        pid = os.getpid()
+        if self._instance is None or self._instance[0] != pid:
+            self._instance = (pid, uuid.uuid4().hex[:12])
+        return f'{pid}-{self._instance[1]}.json'
+
+    def flush(self):
+        """
+        集計を METRICS_DIR/{pid}-{ID}.json に書き出す (書き込み途中のファイルを読まれないよう置き換える)
+        """
+        directory = self.directory
+        if directory is None:
+            return
+        # 集計の取り出しと _dirty の解除を同じロックの中で行う (間に記録されたリクエストを書き漏らさない)
+        with self._lock:
+            self._dirty = False
+            snapshot = self._snapshot()
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / self._file_name()
+        temporary = directory / f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        temporary.write_text(json.dumps(snapshot))
+        os.replace(temporary, path)
+
+    def collect(self):
+        """
+        全ワーカーの集計を合算して返す
+        (終了したワーカーの集計も、取り込んだプロセスのファイルに含まれるので減らない)
+        """
+        directory = self.directory
+        if directory is None:
+            return merge([self.snapshot()])
+        self.flush()
+        self._absorb_dead(directory)
+        snapshots = []
+        for path in directory.glob('*.json'):
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue  # 削除された・壊れたファイルは無視する
+        return merge(snapshots)
+
+    def _absorb_dead(self, directory):
+        """
+        終了したプロセスのファイルを自分の集計に加えて書き出し、削除する
+        (pid で判定するので、METRICS_DIR は1台のサーバーの中だけで使う)
+        """
+        own = self._file_name()
+        claimed = []
+        for path in directory.glob('*.json'):
+            pid = _file_pid(path)
+            if path.name == own or pid is None or _pid_alive(pid):
+                continue
+            # 同時に合算した他のプロセスと二重に取り込まないよう、rename できたものだけを取り込む
+            claim = directory / f'.{path.name}.{os.getpid()}.claim'
+            try:
+                path.rename(claim)
+                snapshot = json.loads(claim.read_text())
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError):
+                claim.unlink(missing_ok=True)
+                continue
+            claimed.append((claim, snapshot))
+        if not claimed:
+            return
+        views, statuses = merge(snapshot for _, snapshot in claimed)
+        with self._lock:
+            for key, row in views.items():
+                total = self._views.setdefault(key, _new_row())
+                for i, value in enumerate(row):
+                    total[i] += value
+            for key, count in statuses.items():
+                self._statuses[key] = self._statuses.get(key, 0) + count
+        # 取り込んだ集計を書き出してから元のファイルを消す
+        self.flush()
+        for claim, _ in claimed:
+            claim.unlink(missing_ok=True)
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._statuses.clear()
+
+
+def _file_pid(path):
+    """
+    {pid}-{ID}.json の pid (読めなければ None)
+    """
+    try:
+        return int(path.name.split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid):
+    """
+    同じホストでそのプロセスが動いていれば True
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # 他のユーザーのプロセス
+    return True
+
+
+def merge(snapshots):
+    """
+    snapshot() の結果を合算し、({(view, method): row}, {(view, method, status): count}) を返す
+    """
+    views, statuses = {}, {}
+    for snapshot in snapshots:
+        for view, method, *row in snapshot['views']:
+            total = views.setdefault((view, method), _new_row())
+            for i, value in enumerate(row):
+                total[i] += value
+        for *key, count in snapshot['statuses']:
+            key = tuple(key)
+            statuses[key] = statuses.get(key, 0) + count
+    return views, statuses
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def render(views, statuses):
+    """
+    合算した集計を Prometheus のテキスト形式 (text/plain; version=0.0.4) にする
+    """
+    lines = [
+        f'# HELP {PREFIX}_http_requests_total Total HTTP requests by view, method and status.',
+        f'# TYPE {PREFIX}_http_requests_total counter',
+    ]
+    for (view, method, status), count in sorted(statuses.items()):
+        lines.append(f'{PREFIX}_http_requests_total{_labels(view=view, method=method, status=status)} {count}')
+
+    lines += [
+        f'# HELP {PREFIX}_http_request_duration_seconds Request latency by view and method.',
+        f'# TYPE {PREFIX}_http_request_duration_seconds histogram',
+    ]
+    for (view, method), row in sorted(views.items()):
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), row[_BUCKETS_START:]):
+            cumulative += count
+            lines.append(
+                f'{PREFIX}_http_request_duration_seconds_bucket{_labels(view=view, method=method, le=bound)} {cumulative}'
+            )
+        lines.append(f'{PREFIX}_http_request_duration_seconds_sum{_labels(view=view, method=method)} {row[DURATION]}')
+        lines.append(f'{PREFIX}_http_request_duration_seconds_count{_labels(view=view, method=method)} {row[COUNT]}')
+
+    for name, index, help_text in (
+        ('db_queries_total', DB_QUERIES, 'Database queries executed by view and method.'),
+        ('db_query_duration_seconds_total', DB_DURATION, 'Time spent in database queries by view and method.'),
+    ):
+        lines += [f'# HELP {PREFIX}_{name} {help_text}', f'# TYPE {PREFIX}_{name} counter']
+        for (view, method), row in sorted(views.items()):
+            lines.append(f'{PREFIX}_{name}{_labels(view=view, method=method)} {row[index]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,153 @@
+import cProfile
+import contextlib
+import itertools
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import registry
+from .profiling import StackSampler, profile_store, verify_token
+
+# URL が解決できなかったリクエスト (404 など) のラベル
+UNMATCHED_VIEW = '<unmatched>'
+
+# プロファイルを要求するヘッダー (値は monitoring.profiling.make_token() で作成)
+PROFILE_HEADER = 'X-Profile'
+
+
+class QueryTimer:
+    """
+    connections[alias].execute_wrapper に渡して、クエリ数とクエリの実行時間を数える
+    """
+    __slots__ = ('count', 'duration')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def query_timing(timer):
+    """
+    全ての接続 (default と読み取り用のレプリカ) のクエリを timer で数えるコンテキストマネージャー
+    """
+    stack = contextlib.ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(timer))
+    return stack
+
+
+class MetricsMiddleware:
+    """
+    URL 名 (view_name) ごとのリクエスト数・レイテンシ・クエリ数・DB時間を記録するミドルウェア
+    集計は monitoring.metrics.registry に溜め、/metrics で Prometheus 形式で返す
+    (ASGI の非同期ビューでもスレッドを挟まずに動くよう、同期・非同期の両方に対応する)
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with query_timing(timer):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        # 非同期 ORM のクエリを実行するスレッドでも同じ接続オブジェクトが使われる
+        with query_timing(timer):
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, timer)
+        return response
+
+    def record(self, request, response, duration, timer):
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match else UNMATCHED_VIEW,
+            request.method,
+            response.status_code,
+            duration,
+            timer.count,
+            timer.duration,
+        )
+
+
+class ProfilingMiddleware:
+    """
+    一部のリクエストだけを cProfile とスタックのサンプリングでプロファイルし、ビューごとに合算するミドルウェア
+
+    対象: PROFILING_SAMPLE_RATE 件に1件 (0 なら無効)、または X-Profile ヘッダーに
+    有効な署名付きの値 (manage.py profiling_token で作成) が付いたリクエスト。
+    結果は管理者用の /admin/profiles/ からダウンロードする。
+    PROFILING_ENABLED が False の場合は MiddlewareNotUsed でミドルウェアごと外れるので、コストはかからない。
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        self.interval = getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005)
+        self._counter = itertools.count(1)
+        # cProfile (Python 3.12 以降は sys.monitoring) は同時に1つしか有効にできないため、
+        # プロファイル中に来た別のリクエストは対象外にする
+        self._busy = threading.Lock()
+
+    def _should_profile(self, request):
+        if self.sample_rate and next(self._counter) % self.sample_rate == 0:
+            return True
+        token = request.headers.get(PROFILE_HEADER)
+        return bool(token) and verify_token(token)
+
+    def __call__(self, request):
+        if not self._should_profile(request) or not self._busy.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            profile = cProfile.Profile()
+            sampler = StackSampler(threading.get_ident(), ProfilingMiddleware.__call__.__code__, self.interval)
+            sampler.start()
+            try:
+                profile.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profile.disable()
+            finally:
+                stacks = sampler.stop()
+        finally:
+            self._busy.release()
+
+        profile_store.record(_view_label(request), profile, stacks)
+        return response
+
+
+def _view_label(request):
+    """
+    ビュークラス名 (QuizAPIView など)。関数ビューなら関数名
+    """
+    match = request.resolver_match
+    if match is None:
+        return UNMATCHED_VIEW
+    view_class = getattr(match.func, 'view_class', None)
+    return view_class.__name__ if view_class else match.func.__name__
@@ -0,0 +1,186 @@
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+
+# 署名付きヘッダーの値を作るときの salt (SECRET_KEY と組み合わせて使う)
+TOKEN_SALT = 'monitoring.profiling'
+TOKEN_VALUE = 'profile'
+
+PSTATS = 'pstats'
+COLLAPSED = 'collapsed'
+
+_SAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def make_token():
+    """
+    プロファイル対象にするリクエストの X-Profile ヘッダーに付ける署名付きの値を返す
+    """
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(TOKEN_VALUE)
+
+
+def verify_token(value):
+    """
+    ヘッダーの値が有効期限内の署名付きの値なら True
+    """
+    try:
+        signed = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            value, max_age=getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+        )
+    except signing.BadSignature:
+        return False
+    return signed == TOKEN_VALUE
+
+
+def frame_name(frame):
+    """
+    collapsed stack 用のフレーム名 (モジュール名:関数の修飾名)
+    """
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    """
+    プロファイル中のリクエストを処理しているスレッドのスタックを一定間隔で取得する
+    root_code のフレーム (ProfilingMiddleware.__call__) より上は含めない
+    """
+
+    def __init__(self, thread_id, root_code, interval):
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None and frame.f_code is not self.root_code:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+
+class ProfileStore:
+    """
+    ビューごとに cProfile の統計と collapsed stack の件数を合算して持つ
+
+    PROFILING_DIR が設定されていれば、プロファイルのたびにプロセスごとのファイル
+    ({pid}.{ビュー名}.pstats / .collapsed) に書き出し、ダウンロード時に全プロセス分を合算する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}  # view -> pstats.Stats
+        self._stacks = {}  # view -> Counter
+
+    @property
+    def directory(self):
+        directory = getattr(settings, 'PROFILING_DIR', '')
+        return Path(directory) if directory else None
+
+    def record(self, view, profile, stacks):
+        with self._lock:
+            if view in self._stats:
+                self._stats[view].add(profile)
+            else:
+                self._stats[view] = pstats.Stats(profile)
+            self._stacks.setdefault(view, Counter()).update(stacks)
+            if self.directory is not None:
+                self._write(view)
+
+    def _write(self, view):
+        directory = self.directory
+        directory.mkdir(parents=True, exist_ok=True)
+        base = f'{os.getpid()}.{_SAFE_NAME.sub("_", view)}'
+        for extension, data in (
+            (PSTATS, marshal.dumps(self._stats[view].stats)),
+            (COLLAPSED, _collapsed_text(self._stacks[view]).encode()),
+        ):
+            temporary = directory / f'.{base}.{extension}.tmp'
+            temporary.write_bytes(data)
+            os.replace(temporary, directory / f'{base}.{extension}')
+
+    def _files(self, view, extension):
+        directory = self.directory
+        if directory is None:
+            return []
+        return sorted(directory.glob(f'*.{_SAFE_NAME.sub("_", view)}.{extension}'))
+
+    def views(self):
+        """
+        プロファイル済みのビュー名のリスト (全プロセス分)
+        """
+        names = set(self._stats)
+        directory = self.directory
+        if directory is not None and directory.exists():
+            for path in directory.glob(f'*.{PSTATS}'):
+                names.add(path.name.split('.', 1)[1].rsplit('.', 1)[0])
+        return sorted(names)
+
+    def pstats_bytes(self, view):
+        """
+        合算した統計を pstats 形式 (pstats.Stats(ファイル名) で読み込める marshal データ) で返す
+        """
+        paths = self._files(view, PSTATS)
+        if paths:
+            stats = pstats.Stats(*map(str, paths))
+        else:
+            with self._lock:
+                stats = self._stats.get(view)
+            if stats is None:
+                return None
+        return marshal.dumps(stats.stats)
+
+    def collapsed_text(self, view):
+        """
+        合算した collapsed stack (flamegraph.pl / speedscope に渡せる形式) を返す
+        """
+        paths = self._files(view, COLLAPSED)
+        if not paths:
+            with self._lock:
+                stacks = self._stacks.get(view)
+            return None if stacks is None else _collapsed_text(stacks)
+        stacks = Counter()
+        for path in paths:
+            for line in path.read_text().splitlines():
+                stack, _, count = line.rpartition(' ')
+                if stack:
+                    stacks[stack] += int(count)
+        return _collapsed_text(stacks)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._stacks.clear()
+        directory = self.directory
+        if directory is not None and directory.exists():
+            for path in list(directory.glob(f'*.{PSTATS}')) + list(directory.glob(f'*.{COLLAPSED}')):
+                path.unlink(missing_ok=True)
+
+
+def _collapsed_text(stacks):
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+profile_store = ProfileStore()
@@ -0,0 +1,165 @@
+import marshal
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .metrics import MetricsRegistry
+from .middleware import PROFILE_HEADER, ProfilingMiddleware
+from .profiling import TOKEN_SALT, TOKEN_VALUE, make_token, profile_store, verify_token
+
+
+class MetricsViewTests(TestCase):
+    """
+    /metrics の認証 (METRICS_TOKEN か管理者のログイン)
+    """
+
+    @override_settings(METRICS_TOKEN='')
+    def test_requires_staff_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(User.objects.create(username='learner'))
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_bearer_token(self):
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'eigoquest_', response.content)
+
+
+class MetricsRegistryTests(TestCase):
+    """
+    METRICS_DIR へのプロセスごとの書き出しと合算
+    """
+
+    def test_registries_in_same_pid_do_not_overwrite(self):
+        # pid が再利用された場合と同じく、同じ pid の別のレジストリは別のファイルに書き出す
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            first, second = MetricsRegistry(), MetricsRegistry()
+            # 書き出し用のスレッドは起動せず、flush() を直接呼ぶ
+            first._flusher = second._flusher = False
+            first.observe('quiz:quiz_api', 'GET', 200, 0.01, 1, 0.001)
+            second.observe('quiz:quiz_api', 'GET', 200, 0.02, 2, 0.002)
+            first.flush()
+            second.flush()
+            self.assertEqual(len(os.listdir(directory)), 2)
+            views, _ = second.collect()
+            self.assertEqual(views[('quiz:quiz_api', 'GET')][0], 2)
+
+    def test_files_of_exited_processes_are_absorbed(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            exited = MetricsRegistry()
+            exited._flusher = False
+            for _ in range(3):
+                exited.observe('quiz:quiz_api', 'GET', 200, 0.1, 1, 0.001)
+            dead = os.path.join(directory, f'{process.pid}-dead.json')
+            with open(dead, 'w') as f:
+                json.dump(exited.snapshot(), f)
+            # 動いているプロセス (自分と同じ pid の別のレジストリ) のファイルは残す
+            other = MetricsRegistry()
+            other._flusher = False
+            other.observe('quiz:quiz_api', 'GET', 200, 0.01, 1, 0.001)
+            other.flush()
+            registry = MetricsRegistry()
+            registry._flusher = False
+            registry.observe('quiz:quiz_api', 'GET', 200, 0.02, 2, 0.002)
+
+            views, statuses = registry.collect()
+            self.assertFalse(os.path.exists(dead))
+            self.assertEqual(sorted(os.listdir(directory)), sorted([other._file_name(), registry._file_name()]))
+            self.assertEqual(views[('quiz:quiz_api', 'GET')][0], 5)
+            self.assertEqual(statuses[('quiz:quiz_api', 'GET', 200)], 5)
+            # 取り込んだ分はカウンタから減らない
+            views, _ = registry.collect()
+            self.assertEqual(views[('quiz:quiz_api', 'GET')][0], 5)
+
+    def test_flush_clears_dirty(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            registry = MetricsRegistry()
+            registry._flusher = False
+            registry.observe('quiz:quiz_api', 'GET', 200, 0.01, 1, 0.001)
+            self.assertTrue(registry._dirty)
+            registry.flush()
+            self.assertFalse(registry._dirty)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0, PROFILING_DIR='')
+class ProfilingTests(TestCase):
+    """
+    X-Profile ヘッダーの署名・対象のリクエストの選び方・/admin/profiles/ のダウンロード
+    """
+
+    def setUp(self):
+        profile_store.reset()
+        self.addCleanup(profile_store.reset)
+        self.factory = RequestFactory()
+
+    def test_verify_token(self):
+        token = make_token()
+        self.assertTrue(verify_token(token))
+        # 改ざん・別の salt での署名・署名の無い値は通さない
+        self.assertFalse(verify_token(token + 'x'))
+        self.assertFalse(verify_token(token.replace(TOKEN_VALUE, 'profilf', 1)))
+        self.assertFalse(verify_token(signing.TimestampSigner(salt='other').sign(TOKEN_VALUE)))
+        self.assertFalse(verify_token(TOKEN_VALUE))
+        self.assertFalse(verify_token(signing.TimestampSigner(salt=TOKEN_SALT).sign('other')))
+
+    @override_settings(PROFILING_TOKEN_MAX_AGE=60)
+    def test_expired_token(self):
+        token = make_token()
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertFalse(verify_token(token))
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: None)
+
+    def test_sampling(self):
+        with override_settings(PROFILING_SAMPLE_RATE=3):
+            middleware = ProfilingMiddleware(lambda request: None)
+        request = self.factory.get('/')
+        self.assertEqual([middleware._should_profile(request) for _ in range(6)], [False, False, True] * 2)
+
+        # 0 なら有効な X-Profile ヘッダーの付いたリクエストだけ
+        middleware = ProfilingMiddleware(lambda request: None)
+        self.assertFalse(middleware._should_profile(request))
+        self.assertFalse(middleware._should_profile(self.factory.get('/', headers={PROFILE_HEADER: 'profile'})))
+        self.assertTrue(middleware._should_profile(self.factory.get('/', headers={PROFILE_HEADER: make_token()})))
+
+    def test_profile_and_download(self):
+        user = User.objects.create(username='learner')
+        auth = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+        self.client.get('/api/quiz/', headers=auth)
+        self.assertEqual(profile_store.views(), [])
+        self.client.get('/api/quiz/', headers={**auth, PROFILE_HEADER: make_token()})
+        self.assertEqual(profile_store.views(), ['QuizAPIView'])
+
+        # ダウンロードは管理者のみ (他はログイン画面へ)
+        for path in ('/admin/profiles/QuizAPIView.pstats', '/admin/profiles/QuizAPIView.collapsed'):
+            self.assertEqual(self.client.get(path).status_code, 302)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/admin/profiles/QuizAPIView.pstats').status_code, 302)
+
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        response = self.client.get('/admin/profiles/QuizAPIView.pstats')
+        self.assertEqual(response.status_code, 200)
+        stats = marshal.loads(response.content)
+        self.assertTrue(any(function == 'get' for _, _, function in stats))
+        self.assertEqual(self.client.get('/admin/profiles/QuizAPIView.collapsed').status_code, 200)
+        self.assertEqual(self.client.get('/admin/profiles/QuizAPIView.txt').status_code, 404)
+        self.assertEqual(self.client.get('/admin/profiles/ResultsView.pstats').status_code, 404)
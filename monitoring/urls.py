@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'monitoring'
+
+urlpatterns = [
+    # プロファイル結果の一覧とダウンロード (管理者のみ)
+    path('', views.profile_index, name='profile_index'),
+    path('reset/', views.profile_reset, name='profile_reset'),
+    path('<str:view>.<str:format>', views.profile_download, name='profile_download'),
+]
@@ -0,0 +1,72 @@
+import hmac
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.http import require_POST
+
+from .metrics import registry, render as render_metrics
+from .profiling import COLLAPSED, PSTATS, profile_store
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _has_token(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return False
+    expected = f'Bearer {token}'.encode()
+    return hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected)
+
+
+def metrics_view(request):
+    """
+    全ワーカーの集計を Prometheus のテキスト形式で返す
+    Authorization: Bearer <METRICS_TOKEN> (Prometheus などから) か、ログイン中の管理者のみ
+    (METRICS_TOKEN が未設定なら管理者のみ。ビューごとのレイテンシ・クエリ数を公開しないため)
+    """
+    if not _has_token(request) and not (request.user.is_active and request.user.is_staff):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(render_metrics(*registry.collect()), content_type=CONTENT_TYPE)
+
+
+@staff_member_required
+def profile_index(request):
+    """
+    プロファイル済みのビューの一覧 (管理者のみ)
+    """
+    return render(request, 'monitoring/profiles.html', {
+        **admin.site.each_context(request),
+        'enabled': getattr(settings, 'PROFILING_ENABLED', False),
+        'sample_rate': getattr(settings, 'PROFILING_SAMPLE_RATE', 0),
+        'views': profile_store.views(),
+    })
+
+
+@staff_member_required
+def profile_download(request, view, format):
+    """
+    ビューごとに合算したプロファイルを pstats (.pstats) か collapsed stack (.collapsed) でダウンロードする
+    """
+    if format == PSTATS:
+        data, content_type = profile_store.pstats_bytes(view), 'application/octet-stream'
+    elif format == COLLAPSED:
+        data, content_type = profile_store.collapsed_text(view), 'text/plain; charset=utf-8'
+    else:
+        raise Http404
+    if data is None:
+        raise Http404
+    response = HttpResponse(data, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{view}.{format}"'
+    return response
+
+
+@staff_member_required
+@require_POST
+def profile_reset(request):
+    profile_store.reset()
+    return redirect('monitoring:profile_index')
@@ -1,15 +1,29 @@
 # quiz/admin.py
 from django.contrib import admin
-from .models import Question, Result  # 1. Question モデルをインポート
+from django.db.models.functions import Substr
+from .models import LeaderboardEntry, Passage, Question, Result, ReviewItem, UserAbility  # 1. Question モデルをインポート
+from .admin_filters import AutocompleteFilter, autocomplete_filter_media
+from .paginators import EstimatedCountPaginator
 
 # 2. (推奨) 管理画面での表示をカスタマイズするクラスを作成
 class QuestionAdmin(admin.ModelAdmin):
     # 一覧画面に表示するフィールド
-    list_display = ('id', 'part', 'question_text_short', 'difficulty_level', 'created_at')
+    list_display = ('id', 'part', 'question_text_short', 'difficulty_level', 'discrimination', 'created_at')
+    # 識別力は calibrate_questions で設定するので表示のみ
+    readonly_fields = ('discrimination',)
     # 絞り込み（フィルター）に使うフィールド
     list_filter = ('part', 'difficulty_level')
     # 検索ボックスで検索対象にするフィールド
     search_fields = ('question_text', 'explanation')
+    # 長文は全件を選択肢に並べず、IDで指定する
+    raw_id_fields = ('passage',)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            # 一覧に表示しない解説は読み込まない (問題文は __str__ でも使うので読み込む)
+            queryset = queryset.defer('explanation')
+        return queryset
 
     # question_textが長すぎるので、一覧用に短い版を定義
     def question_text_short(self, obj):
@@ -20,10 +34,76 @@ class QuestionAdmin(admin.ModelAdmin):
 admin.site.register(Question, QuestionAdmin)
 
 
+class PassageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'title', 'passage_text_short', 'updated_at')
+    search_fields = ('title', 'passage_text')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            # 一覧では本文を読み込まず、先頭の41文字だけを取得する
+            queryset = queryset.defer('passage_text').annotate(passage_text_head=Substr('passage_text', 1, 41))
+        return queryset
+
+    def passage_text_short(self, obj):
+        text = getattr(obj, 'passage_text_head', None) or obj.passage_text
+        return text[:40] + '...' if len(text) > 40 else text
+    passage_text_short.short_description = "本文"
+
+admin.site.register(Passage, PassageAdmin)
+
+
 class ResultAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'question', 'selected_answer', 'is_correct', 'answered_at')
-    list_filter = ('user', 'is_correct', 'answered_at')
+    # ユーザー・問題は全件を選択肢に並べず、オートコンプリートで選ぶ
+    list_filter = (('user', AutocompleteFilter), ('question', AutocompleteFilter), 'is_correct', 'answered_at')
     search_fields = ('user__username', 'question__question_text') # 連携先のフィールドも検索可能
+    # 一覧の user / question の表示で1行ごとにクエリが発行されないようにする
+    list_select_related = ('user', 'question')
+    autocomplete_fields = ('user', 'question')
+    # 件数が多いときは COUNT(*) の代わりに統計情報の推定値を使い、絞り込み前の全件数も数えない
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # 一覧の問題の表示 (__str__) に使わない解説は JOIN しても読み込まない
+        return super().get_queryset(request).defer('question__explanation')
+
+    @property
+    def media(self):
+        return super().media + autocomplete_filter_media(Result._meta.get_field('user'), self.admin_site)
 
 # 3. Result モデルを管理画面に登録
-admin.site.register(Result, ResultAdmin)
\ No newline at end of file
+admin.site.register(Result, ResultAdmin)
+
+
+class UserAbilityAdmin(admin.ModelAdmin):
+    list_display = ('user', 'rating', 'answered_count', 'updated_at')
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+
+admin.site.register(UserAbility, UserAbilityAdmin)
+
+
+class ReviewItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'question', 'repetitions', 'interval', 'ease', 'next_due', 'last_reviewed_at')
+    search_fields = ('user__username',)
+    list_select_related = ('user', 'question')
+    raw_id_fields = ('user', 'question')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('question__explanation')
+
+admin.site.register(ReviewItem, ReviewItemAdmin)
+
+
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ('board', 'user', 'correct', 'answered', 'updated_at')
+    list_filter = ('board',)
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+
+admin.site.register(LeaderboardEntry, LeaderboardEntryAdmin)
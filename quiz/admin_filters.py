@@ -0,0 +1,47 @@
+from django.contrib import admin
+from django.contrib.admin.utils import get_last_value_from_parameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.forms import Media, ModelChoiceField
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    ForeignKey の絞り込みを、選択肢を全件並べる代わりに管理画面のオートコンプリートで選ばせるフィルター
+    (関連先の ModelAdmin に search_fields が必要。ModelAdmin の media に autocomplete_filter_media() を加えること)
+    """
+    template = 'admin/quiz/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = get_last_value_from_parameters(params, self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.title = getattr(field, 'verbose_name', field_path)
+        self.admin_site = model_admin.admin_site
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        # 選択中の値の表示用に関連先を主キー検索で1件だけ読み込む (選択肢の一覧は Ajax で取得する)
+        field = ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(self.field, self.admin_site, attrs={
+                'data-width': '100%',
+                'data-lookup': self.lookup_kwarg,
+            }),
+        )
+        yield {
+            'selected': self.lookup_val is not None,
+            'widget': field.widget.render(f'autocomplete-filter-{self.field_path}', self.lookup_val),
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+        }
+
+
+def autocomplete_filter_media(field, admin_site):
+    """
+    AutocompleteFilter を使う一覧画面で読み込む JavaScript と CSS
+    """
+    return AutocompleteSelect(field, admin_site).media + Media(js=['quiz/admin/autocomplete_filter.js'])
@@ -0,0 +1,26 @@
+from .bank import RefreshingSnapshot
+from .models import Question
+
+
+class AnswerKey(RefreshingSnapshot):
+    """
+    全問題の正解 ({問題ID: 'A'〜'D'}) をメモリ上に保持し、DBに問い合わせずに採点するためのクラス
+
+    QuestionSampler と同様に、問題バンクのバージョン (quiz.bank) が変わるか、
+    QUIZ_ANSWER_KEY_MAX_AGE 秒が経過したら作り直す。
+    """
+
+    max_age_setting = 'QUIZ_ANSWER_KEY_MAX_AGE'
+
+    def _build(self):
+        return dict(Question.objects.values_list('id', 'correct_answer').iterator(chunk_size=10000))
+
+    def lookup(self, question_ids):
+        """
+        {問題ID: 正解} を返す (存在しない問題は含めない)
+        """
+        answers = self._ensure_fresh()
+        return {question_id: answers[question_id] for question_id in question_ids if question_id in answers}
+
+
+answer_key = AnswerKey()
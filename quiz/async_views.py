@@ -0,0 +1,149 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import Case, When
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+
+from accounts.authentication import CachedJWTAuthentication
+from config.db_router import apin_to_primary, read_from_replica
+
+from .adaptive import select_question_ids
+from .grading import agrade_answers, record_results
+from .models import Result
+from .payloads import aquestions_payload, aresults_payload, json_array
+from .sampling import question_sampler
+from .spool import spool_answers, spool_enabled
+from .views import QUIZ_SIZE, _is_truthy, parse_quiz_params, spooled_payload
+
+
+def _json_response(data, status=200, **kwargs):
+    """
+    DRF の JSONRenderer と同じ形式 (コンパクト・UTF-8) の JsonResponse を返す
+    """
+    return JsonResponse(
+        data, status=status, safe=False,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+        **kwargs,
+    )
+
+
+class AsyncAPIView(View):
+    """
+    ASGI (uvicorn) で動かす非同期APIビューの基底クラス
+    DRF の APIView は同期のみのため、JWT 認証 (IsAuthenticated 相当) をここで行う
+    """
+    authentication_class = CachedJWTAuthentication
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # JWT 認証なので APIView と同様に CSRF チェックは行わない
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        authenticator = self.authentication_class()
+        try:
+            user_auth = await authenticator.aauthenticate(request)
+            if user_auth is None:
+                raise exceptions.NotAuthenticated()
+        except exceptions.APIException as e:
+            detail = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+            return _json_response(
+                detail, status=401,
+                headers={'WWW-Authenticate': authenticator.authenticate_header(request)},
+            )
+        request.user, request.auth = user_auth
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncQuizView(AsyncAPIView):
+    """
+    QuizAPIView の非同期版 (クエリパラメータとレスポンスは同じ)
+    """
+
+    @read_from_replica
+    async def get(self, request, *args, **kwargs):
+        try:
+            mode, filters = parse_quiz_params(request.GET)
+        except ValueError as e:
+            return _json_response({"error": str(e)}, status=400)
+
+        if mode == 'adaptive':
+            # NumPy の計算と解答済みチェックはまとめてスレッドで実行する
+            question_ids = await sync_to_async(select_question_ids)(request.user, QUIZ_SIZE, **filters)
+        else:
+            question_ids = await question_sampler.asample_ids(QUIZ_SIZE, **filters)
+
+        payload = await aquestions_payload(question_ids, passages=_is_truthy(request.GET.get('passages')))
+        return HttpResponse(payload, content_type='application/json')
+
+
+class AsyncQuizSubmitView(AsyncAPIView):
+    """
+    QuizSubmitAPIView の非同期版 (?graded=1 と SUBMIT_SPOOL_DIR にも対応)
+    """
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            answers_data = json.loads(request.body)
+        except ValueError:
+            answers_data = None
+        if not isinstance(answers_data, list):
+            return _json_response({"error": "不正なデータ形式です。"}, status=400)
+
+        user = request.user
+        passages = _is_truthy(request.GET.get('passages'))
+        await apin_to_primary(user)
+        if spool_enabled():
+            # 正解表の作り直しとファイルへの追記 (fsync) はスレッドで行う
+            submission_id, results = await sync_to_async(spool_answers)(user, answers_data)
+            body = spooled_payload(submission_id, await aresults_payload(results, passages=passages))
+            return HttpResponse(body, content_type='application/json', status=202)
+
+        results = await agrade_answers(user, answers_data)
+
+        # transaction.atomic は非同期コンテキストで使えないため、保存処理は1回のスレッド呼び出しで行う
+        results = await sync_to_async(record_results)(user, results)
+        result_ids = [result.id for result in results]
+
+        if _is_truthy(request.GET.get('graded')):
+            payload = await aresults_payload(
+                results, questions={result.question_id: result.question for result in results}, passages=passages,
+            )
+            body = b'{"result_ids":' + json_array(str(result_id).encode() for result_id in result_ids) + b',"results":' + payload + b'}'
+            return HttpResponse(body, content_type='application/json', status=201)
+
+        return _json_response({"result_ids": result_ids}, status=201)
+
+
+class AsyncQuizResultView(AsyncAPIView):
+    """
+    QuizResultAPIView の非同期版
+    """
+
+    @read_from_replica
+    async def get(self, request, *args, **kwargs):
+        result_ids_str = request.GET.get('ids', '')
+        if not result_ids_str:
+            return _json_response({"error": "結果IDが指定されていません。"}, status=400)
+
+        try:
+            result_ids = [int(id_str) for id_str in result_ids_str.split(',')]
+        except ValueError:
+            return _json_response({"error": "結果IDの形式が不正です。"}, status=400)
+
+        preserved_order = Case(
+            *[When(id=id_val, then=pos) for pos, id_val in enumerate(result_ids)]
+        )
+        results = Result.objects.filter(
+            id__in=result_ids,
+            user=request.user,
+        ).order_by(preserved_order).values(
+            'id', 'user_id', 'question_id', 'selected_answer', 'is_correct', 'answered_at'
+        )
+        rows = [row async for row in results]
+
+        payload = await aresults_payload(rows, passages=_is_truthy(request.GET.get('passages')))
+        return HttpResponse(payload, content_type='application/json')
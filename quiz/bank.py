@@ -0,0 +1,119 @@
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+# 問題バンクのバージョンを保持するキャッシュキー
+BANK_VERSION_KEY = 'quiz:bank_version'
+
+
+def get_bank_version():
+    """
+    現在の問題バンクのバージョン (ランダムなトークン) を返す
+    (キャッシュに無ければ新しく発行する)
+    """
+    version = cache.get(BANK_VERSION_KEY)
+    if version is None:
+        # 他のワーカーが同時に発行した場合はそちらを優先 (add は上書きしない)
+        cache.add(BANK_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(BANK_VERSION_KEY)
+    return version
+
+
+async def aget_bank_version():
+    """
+    get_bank_version の非同期版 (ASGI のビューから使う)
+    """
+    version = await cache.aget(BANK_VERSION_KEY)
+    if version is None:
+        await cache.aadd(BANK_VERSION_KEY, uuid.uuid4().hex, None)
+        version = await cache.aget(BANK_VERSION_KEY)
+    return version
+
+
+def bump_bank_version():
+    """
+    問題バンクが変更されたことを通知する
+    (バージョンを使っている各キャッシュはこれで無効になる)
+    """
+    # カウンタではなく毎回新しいトークンにすることで、
+    # キャッシュが消えた後に古いバージョンと衝突しないようにする
+    cache.set(BANK_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+class RefreshingSnapshot:
+    """
+    問題バンクから作ったデータをプロセス内に保持し、問題バンクのバージョンが変わるか
+    max_age 秒が経過したら作り直す基底クラス (QuestionSampler・AnswerKey・QuestionPacks)
+
+    サブクラスは _build() で新しいデータを作って返し、max_age の設定名 (max_age_setting) と
+    デフォルト値 (default_max_age) を指定する。作り直しは1スレッドだけが行い、
+    参照の入れ替えだけで切り替える (読み込み中のスレッドは古いデータを使い続ける)。
+    """
+    max_age_setting = None
+    default_max_age = 300
+
+    def __init__(self, max_age=None):
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._version = None
+        self._built_at = 0.0
+        self._data = self._empty()
+
+    @property
+    def max_age(self):
+        if self._max_age is not None:
+            return self._max_age
+        return getattr(settings, self.max_age_setting, self.default_max_age)
+
+    def _empty(self):
+        """
+        最初に作るまでのデータ
+        """
+        return {}
+
+    def _build(self):
+        """
+        問題バンクから新しいデータを作って返す (作り直し中は self._data が前のデータ)
+        """
+        raise NotImplementedError
+
+    def _is_stale(self, version):
+        return (
+            self._version != version
+            or time.monotonic() - self._built_at > self.max_age
+        )
+
+    def _ensure_fresh(self):
+        version = get_bank_version()
+        if not self._is_stale(version):
+            return self._data
+        return self._refresh(version)
+
+    async def _aensure_fresh(self):
+        version = await aget_bank_version()
+        if not self._is_stale(version):
+            return self._data
+        # 作り直しはまれにしか起きないので、同期の ORM をスレッドで実行する
+        return await sync_to_async(self._refresh)(version)
+
+    def _refresh(self, version):
+        with self._lock:
+            # ロック待ちの間に他のスレッドが作り直していれば何もしない
+            if self._is_stale(version):
+                self._rebuild(version)
+        return self._data
+
+    def _rebuild(self, version):
+        self._data = self._build()
+        self._version = version
+        self._built_at = time.monotonic()
+
+    def invalidate(self):
+        """
+        次回の取得時に作り直させる
+        """
+        self._version = None
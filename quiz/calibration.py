@@ -0,0 +1,258 @@
+"""
+解答履歴 (Result) から問題の難易度・識別力を推定する処理 (項目反応理論の 2PL / Rasch モデル)
+
+正答確率を P(正解) = 1 / (1 + exp(-a (θ - b))) とし (θ: ユーザーの能力、b: 難易度、a: 識別力。Rasch は a = 1)、
+ユーザー × 問題の解答を疎行列に入れて、θ・b・a を交互にニュートン法で更新する (正則化付きの同時最尤推定)。
+θ は毎回平均0に揃え、尺度は θ の正則化 (標準正規分布) で決める。
+
+b はロジットの尺度なので、Elo の尺度 (quiz.adaptive) に合わせて difficulty_level = 600 + b × 400 / ln10 に換算する
+(解答しているユーザーの平均的な能力を 600 とみなす)。
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from scipy import sparse
+from scipy.special import expit
+
+from .adaptive import ELO_SCALE, INITIAL_RATING
+from .bank import bump_bank_version
+from .models import Question, Result
+from .payloads import invalidate_fragments
+from .stats import regroup_user_stats
+from .utils import chunked
+
+# 推定した難易度を書き戻す問題の最低解答数 (少ない問題は推定が不安定なので元の値のまま)
+MIN_RESPONSES = 30
+# difficulty_level の範囲 (TOEIC のスコアの範囲)
+MIN_DIFFICULTY = 10
+MAX_DIFFICULTY = 990
+# 正則化 (事前分布の標準偏差)。θ ~ N(0, 1)、b ~ N(0, 2)、a ~ N(1, 0.5)
+THETA_SD = 1.0
+B_SD = 2.0
+A_SD = 0.5
+# 識別力の範囲
+MIN_DISCRIMINATION = 0.2
+MAX_DISCRIMINATION = 4.0
+# 1回の更新の上限 (ロジット)
+MAX_STEP = 1.0
+
+# 選択率がこれ未満の誤答の選択肢は「ほぼ選ばれない」とする
+MIN_DISTRACTOR_RATE = 0.05
+
+
+class Responses(namedtuple('Responses', ['user_ids', 'question_ids', 'matrix'])):
+    """
+    解答のユーザー × 問題の疎行列 (CSR。値は正解なら1、不正解なら0 を明示的に持つ)
+    user_ids / question_ids は行・列の番号に対応する ID
+    """
+
+    @classmethod
+    def from_arrays(cls, users, questions, correct):
+        user_ids, rows = np.unique(users, return_inverse=True)
+        question_ids, cols = np.unique(questions, return_inverse=True)
+        # 行・列の順に並べて CSR を直接作る (coo から変換すると値が0の要素が消えるため)
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(user_ids)), out=indptr[1:])
+        matrix = sparse.csr_matrix(
+            (np.asarray(correct, dtype=np.float64)[order], cols[order], indptr),
+            shape=(len(user_ids), len(question_ids)),
+        )
+        return cls(user_ids, question_ids, matrix)
+
+    @property
+    def rows(self):
+        return np.repeat(np.arange(self.matrix.shape[0]), np.diff(self.matrix.indptr))
+
+    @property
+    def cols(self):
+        return self.matrix.indices
+
+    @property
+    def correct(self):
+        return self.matrix.data
+
+    def counts(self):
+        """
+        問題ごとの解答数
+        """
+        return np.bincount(self.cols, minlength=self.matrix.shape[1])
+
+
+def load_responses(queryset=None, chunk_size=100000):
+    """
+    Result の (ユーザー, 問題, 正誤) を少しずつ読み込み (PostgreSQL ではサーバーサイドカーソル)、Responses を返す
+    """
+    if queryset is None:
+        queryset = Result.objects.all()
+    rows = queryset.order_by().values_list('user_id', 'question_id', 'is_correct').iterator(chunk_size=chunk_size)
+    users, questions, correct = [], [], []
+    for chunk in chunked(rows, chunk_size):
+        array = np.array(chunk, dtype=np.int64)
+        users.append(array[:, 0])
+        questions.append(array[:, 1])
+        correct.append(array[:, 2].astype(np.int8))
+    if not users:
+        return Responses.from_arrays(np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int8))
+    return Responses.from_arrays(np.concatenate(users), np.concatenate(questions), np.concatenate(correct))
+
+
+class Calibration(namedtuple('Calibration', ['question_ids', 'difficulty', 'discrimination', 'counts', 'iterations'])):
+    """
+    推定結果 (difficulty・discrimination はロジットの尺度の b・a)
+    """
+
+    def difficulty_levels(self):
+        """
+        difficulty_level (Elo の尺度の整数) に換算した難易度
+        """
+        levels = np.rint(INITIAL_RATING + self.difficulty * ELO_SCALE / math.log(10))
+        return np.clip(levels, MIN_DIFFICULTY, MAX_DIFFICULTY).astype(np.int64)
+
+
+def fit(responses, model='2pl', iterations=100, tolerance=1e-3):
+    """
+    Responses から各問題の難易度 b と識別力 a を推定して Calibration を返す
+    """
+    matrix = responses.matrix
+    n_users, n_items = matrix.shape
+    rows, cols, correct = responses.rows, responses.cols, responses.correct
+    counts = responses.counts()
+
+    def row_sums(values):
+        # ユーザーごとの合計 (疎行列 × ベクトル)
+        return sparse.csr_matrix((values, matrix.indices, matrix.indptr), shape=matrix.shape) @ np.ones(n_items)
+
+    def col_sums(values):
+        # 問題ごとの合計
+        return sparse.csr_matrix((values, matrix.indices, matrix.indptr), shape=matrix.shape).T @ np.ones(n_users)
+
+    # 初期値: 正答率から求めた難易度、能力0、識別力1
+    rate = (col_sums(correct) + 0.5) / (counts + 1.0)
+    b = -np.log(rate / (1 - rate))
+    a = np.ones(n_items)
+    theta = np.zeros(n_users)
+
+    done = 0
+    for done in range(1, iterations + 1):
+        previous = b.copy()
+
+        # θ の更新
+        slope = a[cols]
+        p = expit(slope * (theta[rows] - b[cols]))
+        gradient = row_sums(slope * (correct - p)) - theta / THETA_SD ** 2
+        hessian = row_sums(slope ** 2 * p * (1 - p)) + 1 / THETA_SD ** 2
+        theta += np.clip(gradient / hessian, -MAX_STEP, MAX_STEP)
+
+        # b の更新
+        p = expit(slope * (theta[rows] - b[cols]))
+        gradient = -col_sums(slope * (correct - p)) - b / B_SD ** 2
+        hessian = col_sums(slope ** 2 * p * (1 - p)) + 1 / B_SD ** 2
+        b += np.clip(gradient / hessian, -MAX_STEP, MAX_STEP)
+
+        # a の更新 (2PL のみ)
+        if model == '2pl':
+            distance = theta[rows] - b[cols]
+            p = expit(a[cols] * distance)
+            gradient = col_sums(distance * (correct - p)) - (a - 1) / A_SD ** 2
+            hessian = col_sums(distance ** 2 * p * (1 - p)) + 1 / A_SD ** 2
+            a = np.clip(a + np.clip(gradient / hessian, -MAX_STEP, MAX_STEP), MIN_DISCRIMINATION, MAX_DISCRIMINATION)
+
+        # 原点を揃える (θ の平均を0にし、b も同じだけずらすので確率は変わらない。尺度は θ の正則化で決まる)
+        mean = theta.mean()
+        theta -= mean
+        b -= mean
+
+        if np.abs(b - previous).max(initial=0) < tolerance:
+            break
+
+    return Calibration(responses.question_ids, b, a, counts, done)
+
+
+def save_calibration(calibration, min_responses=MIN_RESPONSES, batch_size=1000):
+    """
+    解答数が min_responses 以上の問題の difficulty_level・discrimination を bulk_update で書き戻し、更新した件数を返す
+    """
+    levels = calibration.difficulty_levels()
+    targets = {
+        int(question_id): (int(level), round(float(discrimination), 3))
+        for question_id, level, discrimination, count in zip(
+            calibration.question_ids, levels, calibration.discrimination, calibration.counts,
+        )
+        if count >= min_responses
+    }
+
+    updated = []
+    now = timezone.now()
+    for batch in chunked(targets, batch_size):
+        to_update = []
+        # 難易度帯が変わる問題 (解答済みのユーザーの成績集計の件数を移し替える)
+        regrouped = {}
+        for question in Question.objects.filter(pk__in=batch).only('id', 'part', 'difficulty_level', 'discrimination'):
+            level, discrimination = targets[question.pk]
+            if question.difficulty_level == level and question.discrimination == discrimination:
+                continue
+            if question.difficulty_level != level:
+                regrouped[question.pk] = ((question.part, question.difficulty_level), (question.part, level))
+            question.difficulty_level = level
+            question.discrimination = discrimination
+            # bulk_update は auto_now を設定しないので手動で更新する
+            question.updated_at = now
+            to_update.append(question)
+        with transaction.atomic():
+            Question.objects.bulk_update(to_update, ['difficulty_level', 'discrimination', 'updated_at'])
+            regroup_user_stats(regrouped)
+        updated += [question.pk for question in to_update]
+
+    if updated:
+        # bulk_update はシグナルを送らないので、抽出用のインデックスや作成済みの JSON をここで無効化する
+        invalidate_fragments(updated)
+        bump_bank_version()
+    return len(updated)
+
+
+def distractor_rates(queryset=None):
+    """
+    問題ごとの選択肢の選択率を1回の GROUP BY で集計し、
+    {問題ID: {'correct_answer': 正解, 'total': 解答数, 'rates': {'A': 選択率, ...}}} を返す
+    """
+    if queryset is None:
+        queryset = Result.objects.all()
+    rows = (
+        queryset.values('question_id', 'question__correct_answer', 'selected_answer')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    report = {}
+    for row in rows:
+        item = report.setdefault(row['question_id'], {
+            'correct_answer': row['question__correct_answer'],
+            'total': 0,
+            'counts': dict.fromkeys('ABCD', 0),
+        })
+        item['counts'][row['selected_answer']] = row['count']
+        item['total'] += row['count']
+    for item in report.values():
+        counts = item.pop('counts')
+        item['rates'] = {option: count / item['total'] for option, count in counts.items()}
+    return report
+
+
+def distractor_issues(item, min_rate=MIN_DISTRACTOR_RATE):
+    """
+    distractor_rates() の1問分から、見直しが必要な点のリストを返す
+    """
+    correct = item['correct_answer']
+    issues = []
+    for option, rate in item['rates'].items():
+        if option == correct:
+            continue
+        if rate > item['rates'][correct]:
+            issues.append(f'{option} が正解 ({correct}) より多く選ばれています')
+        elif rate < min_rate:
+            issues.append(f'{option} がほとんど選ばれていません')
+    return issues
@@ -0,0 +1,194 @@
+"""
+言い換え・句読点違いの問題 (ほぼ同じ問題) を MinHash + LSH で見つける処理
+
+問題文と選択肢を正規化して文字の k-gram (シングル) に分け、NumPy でまとめて MinHash の署名を作る。
+署名をバンドに分けて同じバンドを持つ問題どうしだけを候補にし (全ペアの比較をしない)、
+署名から推定した類似度 (Jaccard 係数) がしきい値以上のペアを union-find でクラスタにまとめる。
+"""
+import re
+import unicodedata
+
+import numpy as np
+
+# シングルの文字数
+SHINGLE_SIZE = 5
+# MinHash の署名の長さ (ハッシュ関数の数)
+NUM_PERM = 128
+# 類似度のしきい値のデフォルト
+DEFAULT_THRESHOLD = 0.8
+# 1回にまとめて署名を作る問題数 (メモリ使用量の上限になる)
+BATCH_SIZE = 20000
+# 比較に使う Question のフィールド (正解・解説・難易度は比較しない)
+QUESTION_FIELDS = ['question_text', 'option_a', 'option_b', 'option_c', 'option_d']
+
+_NON_WORD = re.compile(r'[\W_]+')
+# シングルのハッシュ (多項式ローリングハッシュ) の基数
+_BASE = np.uint32(0x01000193)
+
+
+def normalize(text):
+    """
+    NFKC・小文字化し、記号を除いて空白を1つにする (句読点・表記の揺れを無視するため)
+    """
+    return _NON_WORD.sub(' ', unicodedata.normalize('NFKC', text or '').lower()).strip()
+
+
+def dedupe_text(question_text, *options):
+    """
+    比較に使う文字列 (問題文と選択肢をつなげたもの)
+    """
+    return ' | '.join(normalize(value) for value in (question_text, *options))
+
+
+def _mix(values):
+    # 似た文字列のハッシュが近い値にならないよう、ビットを混ぜる (murmur3 の fmix32)
+    values ^= values >> np.uint32(16)
+    values *= np.uint32(0x85EBCA6B)
+    values ^= values >> np.uint32(13)
+    values *= np.uint32(0xC2B2AE35)
+    values ^= values >> np.uint32(16)
+    return values
+
+
+def _shingle_hashes(texts, shingle_size):
+    """
+    texts のすべてのシングルのハッシュを1つの配列で返し、各テキストの先頭の位置も返す
+    (テキストをつなげた配列に対してローリングハッシュを一度に計算し、テキストをまたぐものを除く)
+    """
+    # シングルより短いテキストも1つはシングルを持つように空白で埋める
+    texts = [text.ljust(shingle_size) for text in texts]
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32)
+
+    count = len(codes) - shingle_size + 1
+    hashes = codes[:count].copy()
+    for offset in range(1, shingle_size):
+        hashes *= _BASE
+        hashes += codes[offset:offset + count]
+
+    # 各位置から始まるシングルが同じテキストに収まっているものだけを残す
+    ends = np.cumsum(lengths)
+    valid = np.arange(count) + shingle_size <= np.repeat(ends, lengths)[:count]
+    per_text = lengths - shingle_size + 1
+    starts = np.concatenate(([0], np.cumsum(per_text)[:-1]))
+    return _mix(hashes[valid]), starts
+
+
+def minhash_signatures(texts, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, batch_size=BATCH_SIZE, seed=1):
+    """
+    各テキストの MinHash の署名 ((テキスト数, num_perm) の uint32 の配列) を返す
+    ハッシュ関数は h(x) = a * x + b (mod 2^32、a は奇数なので 32 ビットの置換になる)
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64).astype(np.uint32) | np.uint32(1)
+    b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64).astype(np.uint32)
+
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    permuted = None
+    for lo in range(0, len(texts), batch_size):
+        hashes, starts = _shingle_hashes(texts[lo:lo + batch_size], shingle_size)
+        if permuted is None or len(permuted) < len(hashes):
+            permuted = np.empty(len(hashes), dtype=np.uint32)
+        buffer = permuted[:len(hashes)]
+        for column in range(num_perm):
+            np.multiply(hashes, a[column], out=buffer)
+            buffer += b[column]
+            # テキストごとの区間の最小値
+            signatures[lo:lo + len(starts), column] = np.minimum.reduceat(buffer, starts)
+    return signatures
+
+
+def choose_bands(threshold, num_perm=NUM_PERM):
+    """
+    署名を分けるバンド数 (1バンドの行数は num_perm // バンド数)
+    候補になる類似度の目安 (1/b)^(1/r) がしきい値より十分低くなる中で、最も行数の多い分け方にする
+    (しきい値以上のペアの見逃しを抑えつつ、候補の数を減らす)
+    """
+    best = num_perm
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold - 0.15:
+            best = bands
+    return best
+
+
+def candidate_pairs(signatures, bands):
+    """
+    いずれかのバンドが一致する問題のペア (i < j の2つの配列) を返す
+    同じバンドのグループ内では並び順で隣どうしだけを組にするので、ペアの数は問題数 × バンド数以下になる
+    (クラスタは union-find でつながるので、隣どうしで十分)
+    """
+    count, num_perm = signatures.shape
+    rows = num_perm // bands
+    multipliers = np.random.default_rng(0).integers(1, 2 ** 63, size=rows, dtype=np.uint64) | np.uint64(1)
+    left, right = [], []
+    for band in range(bands):
+        block = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys = (block * multipliers).sum(axis=1)
+        order = np.argsort(keys, kind='stable')
+        same = keys[order[1:]] == keys[order[:-1]]
+        left.append(order[:-1][same])
+        right.append(order[1:][same])
+    if not left:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    i, j = np.concatenate(left), np.concatenate(right)
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    pairs = np.unique(i * count + j)
+    return pairs // count, pairs % count
+
+
+def similar_pairs(signatures, threshold=DEFAULT_THRESHOLD, bands=None, chunk_size=100000):
+    """
+    推定した類似度がしきい値以上のペアを (i, j, 類似度) の3つの配列で返す
+    """
+    i, j = candidate_pairs(signatures, bands or choose_bands(threshold, signatures.shape[1]))
+    similarities = np.empty(len(i), dtype=np.float32)
+    for lo in range(0, len(i), chunk_size):
+        hi = lo + chunk_size
+        similarities[lo:hi] = (signatures[i[lo:hi]] == signatures[j[lo:hi]]).mean(axis=1)
+    keep = similarities >= threshold
+    return i[keep], j[keep], similarities[keep]
+
+
+def cluster_pairs(count, i, j):
+    """
+    ペアを union-find でまとめ、2件以上のクラスタを (要素の番号の昇順のリスト) のリストで返す
+    """
+    parent = list(range(count))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for x, y in zip(i.tolist(), j.tolist()):
+        root_x, root_y = find(x), find(y)
+        if root_x != root_y:
+            # 番号の小さい方を根にする (クラスタの代表は先頭の要素)
+            parent[max(root_x, root_y)] = min(root_x, root_y)
+
+    clusters = {}
+    for x in sorted({*i.tolist(), *j.tolist()}):
+        clusters.setdefault(find(x), []).append(x)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def find_duplicates(texts, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM):
+    """
+    dedupe_text() の文字列のリストから、ほぼ同じもののクラスタ (番号のリスト) と、類似度のペアを返す
+    """
+    signatures = minhash_signatures(texts, num_perm)
+    i, j, similarities = similar_pairs(signatures, threshold)
+    return cluster_pairs(len(texts), i, j), (i, j, similarities)
+
+
+def question_dedupe_text(question):
+    """
+    Question (または同じ名前のキーを持つ dict) の比較用の文字列
+    """
+    if isinstance(question, dict):
+        return dedupe_text(*(question.get(field) for field in QUESTION_FIELDS))
+    return dedupe_text(*(getattr(question, field) for field in QUESTION_FIELDS))
@@ -0,0 +1,115 @@
+import csv
+import datetime
+import io
+import json
+import zlib
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .management.commands.import_questions import EXPECTED_HEADERS, PASSAGE_HEADERS
+from .models import Question, Result
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+
+# 出力する列 (columns は別名を付けて出力する列) と --since で比較する日時の列
+# (問題の列は import_questions の CSV ヘッダーを含むので、書き出した CSV はそのまま取り込める)
+EXPORTS = {
+    'questions': {
+        'model': Question,
+        'fields': ['id', *EXPECTED_HEADERS, 'created_at', 'updated_at'],
+        # 長文はIDを passage_key にする (同じ長文の設問が同じグループになる)
+        'columns': dict(zip(PASSAGE_HEADERS, [F('passage_id'), F('passage__title'), F('passage__passage_text')])),
+        'since': 'updated_at',
+    },
+    'results': {
+        'model': Result,
+        'fields': ['id', 'user_id', 'user__username', 'question_id', 'selected_answer', 'is_correct', 'answered_at'],
+        'since': 'answered_at',
+    },
+}
+
+# 1回に書き出す (yield する) 行数
+ROWS_PER_WRITE = 500
+
+
+def parse_since(value):
+    """
+    --since / ?since= の値 (ISO 8601 の日時か日付) を aware な日時にする (不正なら ValueError)
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'日時の形式が不正です: {value}')
+        parsed = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_rows(kind, since=None, chunk_size=2000):
+    """
+    (列名のリスト, 行のタプルのイテレータ) を返す
+    PostgreSQL ではサーバーサイドカーソルで chunk_size 件ずつ読み込むので、件数に関係なくメモリ使用量は一定
+    """
+    spec = EXPORTS[kind]
+    queryset = spec['model'].objects.all()
+    if since is not None:
+        queryset = queryset.filter(**{f"{spec['since']}__gte": since})
+    columns = spec.get('columns', {})
+    rows = queryset.annotate(**columns).order_by('pk').values_list(*spec['fields'], *columns).iterator(chunk_size=chunk_size)
+    return [*spec['fields'], *columns], rows
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, (datetime.datetime, datetime.date)) else value
+
+
+def _csv_chunks(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_plain(value) for value in row])
+        if count % ROWS_PER_WRITE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _jsonl_chunks(fields, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(fields, map(_plain, row))), ensure_ascii=False) + '\n')
+        if len(lines) == ROWS_PER_WRITE:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines)
+
+
+def _gzip_chunks(chunks):
+    # wbits=31 で gzip 形式 (ヘッダー付き) になる
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(kind, format='csv', compress=False, since=None, chunk_size=2000):
+    """
+    書き出す内容を bytes の断片として順に返す (ファイルへの書き込みと StreamingHttpResponse の両方で使う)
+    """
+    fields, rows = export_rows(kind, since, chunk_size)
+    chunks = _csv_chunks(fields, rows) if format == 'csv' else _jsonl_chunks(fields, rows)
+    encoded = (chunk.encode('utf-8') for chunk in chunks if chunk)
+    return _gzip_chunks(encoded) if compress else encoded
+
+
+def export_filename(kind, format='csv', compress=False):
+    return f"{kind}-{timezone.localtime():%Y%m%d-%H%M%S}.{format}{'.gz' if compress else ''}"
@@ -0,0 +1,217 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .adaptive import update_ability
+from .answer_key import answer_key
+from .leaderboard import update_leaderboards
+from .models import Question, Result, SubmissionReceipt
+from .partitions import record_answer_log
+from .review import update_review_schedule
+from .stats import previous_outcomes, update_user_stats
+
+
+# 選択肢として受け付ける値 ('A'〜'D')
+VALID_ANSWERS = frozenset(choice for choice, _ in Question.ANSWER_CHOICES)
+
+
+def _valid_question_id(question_id):
+    # bool は int のサブクラスなので除く (True が問題ID 1 として扱われないように)
+    return isinstance(question_id, int) and not isinstance(question_id, bool)
+
+
+def _valid_answer(selected_answer):
+    # 文字列以外 (dict など) や 'AB' のような値は受け付けない
+    return isinstance(selected_answer, str) and selected_answer in VALID_ANSWERS
+
+
+def _valid_answers(answers_data):
+    """
+    解答データのうち、問題IDと選択肢の形式が正しいものを (問題ID, 選択肢) として解答順に返す
+    (形式の正しくない解答は保存時に DataError になり、スプールでは後の送信の保存まで止めてしまうので、ここで除く)
+    """
+    for answer_data in answers_data:
+        if not isinstance(answer_data, dict):
+            continue
+        question_id = answer_data.get('question_id')
+        selected_answer = answer_data.get('selected_answer')
+        if _valid_question_id(question_id) and _valid_answer(selected_answer):
+            yield question_id, selected_answer
+
+
+def _answer_question_ids(answers_data):
+    return [question_id for question_id, _ in _valid_answers(answers_data)]
+
+
+def _build_results(user, answers_data, questions):
+    """
+    解答データと {question_id: Question} から未保存の Result を解答順に作る
+    """
+    results = []
+    for question_id, selected_answer in _valid_answers(answers_data):
+        question = questions.get(question_id)
+        if not question:
+            continue  # 存在しない問題はスキップ
+
+        results.append(
+            Result(
+                user=user,
+                question=question,
+                selected_answer=selected_answer,
+                is_correct=(selected_answer == question.correct_answer),
+            )
+        )
+    return results
+
+
+def grade_answers(user, answers_data):
+    """
+    解答データを採点し、未保存の Result を解答順のリストで返す
+    answers_data = [{"question_id": 5, "selected_answer": "A"}, ...]
+    """
+    # 関連する Question を一括で取得 (効率化)
+    questions = Question.objects.in_bulk(_answer_question_ids(answers_data))
+    return _build_results(user, answers_data, questions)
+
+
+async def agrade_answers(user, answers_data):
+    """
+    grade_answers の非同期版
+    """
+    questions = await Question.objects.ain_bulk(_answer_question_ids(answers_data))
+    return _build_results(user, answers_data, questions)
+
+
+def grade_with_key(user, answers_data, now=None):
+    """
+    grade_answers と同じ採点を、メモリ上の正解 (quiz.answer_key) だけで行う (DBに問い合わせない)
+    返す Result には question (インスタンス) は設定されず、question_id だけを持つ
+    """
+    correct_answers = answer_key.lookup(_answer_question_ids(answers_data))
+    now = now or timezone.now()
+    results = []
+    for question_id, selected_answer in _valid_answers(answers_data):
+        correct_answer = correct_answers.get(question_id)
+        if correct_answer is None:
+            continue  # 存在しない問題はスキップ
+
+        results.append(
+            Result(
+                user=user,
+                question_id=question_id,
+                selected_answer=selected_answer,
+                is_correct=(selected_answer == correct_answer),
+                answered_at=now,
+            )
+        )
+    return results
+
+
+def save_results(results):
+    """
+    採点済みの Result を1回の INSERT ... ON CONFLICT でまとめて保存し、
+    引数と同じ順序・同じ長さのリストで返す (各要素には id が設定される)
+
+    (user, question) が既に存在する場合は最新の解答で上書きする。
+    同じ問題が複数回含まれている場合は最後の解答を採用する。
+    """
+    # ON CONFLICT は同じ行を1文の中で2回更新できないため、(user, question) ごとに1件にまとめる
+    latest = {}
+    for result in results:
+        latest[(result.user_id, result.question_id)] = result
+
+    saved = Result.objects.bulk_create(
+        latest.values(),
+        update_conflicts=True,
+        unique_fields=['user', 'question'],
+        # answered_at も最新の解答日時に更新する
+        update_fields=['selected_answer', 'is_correct', 'answered_at'],
+    )
+    by_key = {(result.user_id, result.question_id): result for result in saved}
+    return [by_key[(result.user_id, result.question_id)] for result in results]
+
+
+def _update_user_state(user, saved, previous, now=None):
+    """
+    保存した Result から能力値・成績集計・復習スケジュール・ランキングを更新する
+    (now を指定すると、その日時に解答したものとして連続学習日数・週間ランキングなどを更新する)
+    """
+    # update_ability は UserAbility の行をロックするので、同じユーザーの以降の更新は直列に実行される
+    update_ability(user, saved)
+    update_user_stats(user, saved, previous, today=timezone.localdate(now) if now else None)
+    update_review_schedule(user, saved, now)
+    update_leaderboards(user, saved, previous, now)
+
+
+def record_results(user, results):
+    """
+    採点済みの Result を保存し、解答ログの追記と能力値・成績集計・復習スケジュール・ランキングの更新も
+    同じトランザクションで行う
+    (解答数に関係なくクエリ数は一定)
+    """
+    with transaction.atomic():
+        previous = previous_outcomes(user, results)
+        saved = save_results(results)
+        record_answer_log(saved)
+        _update_user_state(user, saved, previous)
+    return saved
+
+
+def record_submissions(submissions):
+    """
+    スプール (quiz.spool) に溜めた複数ユーザーの解答送信を1回のトランザクションで保存し、保存した送信の数を返す
+    Result と AnswerLog は全員分をそれぞれ1回の INSERT で保存する (ユーザーごとの集計の更新は record_results と同じ)
+
+    保存した送信は SubmissionReceipt に記録し、記録済みの送信は飛ばす。
+    そのため同じ送信を何度保存しようとしても結果は変わらない (スプールの再実行・二重の取り出しに対応する)。
+    """
+    with transaction.atomic():
+        applied = set(SubmissionReceipt.objects.filter(
+            id__in=[submission.id for submission in submissions]
+        ).values_list('id', flat=True))
+        pending = sorted(
+            (submission for submission in submissions if submission.id not in applied),
+            key=lambda submission: submission.submitted_at,
+        )
+        if not pending:
+            return 0
+
+        users = User.objects.in_bulk({submission.user_id for submission in pending})
+        questions = Question.objects.in_bulk({
+            question_id for submission in pending for question_id, _, _ in submission.answers
+        })
+        # ユーザーごとに送信順に並べる (同じ問題への解答は後の送信が優先される)
+        by_user = {}
+        for submission in pending:
+            user = users.get(submission.user_id)
+            if user is None:
+                continue  # 退会したユーザー
+            for question_id, selected_answer, is_correct in submission.answers:
+                question = questions.get(question_id)
+                if question is None:
+                    continue  # 送信後に削除された問題
+                by_user.setdefault(user, []).append(Result(
+                    user=user, question=question, selected_answer=selected_answer,
+                    is_correct=is_correct, answered_at=submission.submitted_at,
+                ))
+
+        previous = {user: previous_outcomes(user, results) for user, results in by_user.items()}
+        all_results = [result for results in by_user.values() for result in results]
+        saved = save_results(all_results)
+        # 解答ログには (最新の解答だけを持つ Result と違い) 各送信の解答を残す
+        record_answer_log(all_results)
+        offset = 0
+        for user, results in by_user.items():
+            user_saved = saved[offset:offset + len(results)]
+            offset += len(results)
+            _update_user_state(user, user_saved, previous[user], now=results[-1].answered_at)
+
+        applied_at = timezone.now()
+        SubmissionReceipt.objects.bulk_create([
+            SubmissionReceipt(
+                id=submission.id, user_id=submission.user_id,
+                submitted_at=submission.submitted_at, applied_at=applied_at,
+            )
+            for submission in pending
+        ])
+    return len(pending)
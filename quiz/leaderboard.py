@@ -0,0 +1,209 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import LeaderboardEntry
+
+GLOBAL_BOARD = 'global'
+METRICS = ('correct', 'accuracy')
+
+_WEEK_BOARD = re.compile(r'^\d{4}-W\d{2}$')
+
+
+def week_board(value=None):
+    """
+    日時 (省略時は現在) が属する ISO週のランキング名 ('2026-W42')
+    """
+    year, week, _ = timezone.localtime(value).isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+def is_board(board):
+    return board == GLOBAL_BOARD or bool(_WEEK_BOARD.match(board))
+
+
+def min_answered():
+    """
+    正答率のランキングに載るのに必要な解答数
+    """
+    return getattr(settings, 'LEADERBOARD_MIN_ANSWERED', 20)
+
+
+def leaderboard_deltas(results, previous, now=None):
+    """
+    Result の保存によって各ランキングの (解答数, 正解数) がいくつ増減するかを返す
+    previous は quiz.stats.previous_outcomes() の戻り値 (保存前の状態)
+
+    解き直した問題は、前回の解答が今週なら今週の正解数だけが変わり、先週以前なら今週の解答として加える。
+    終わった週のランキングは変えない (全期間のランキングは正解数だけが変わる)。
+    """
+    current = week_board(now)
+    deltas = defaultdict(lambda: [0, 0])
+    # 同じ問題への重複した解答は最後のものだけが保存される
+    latest = {result.question_id: result for result in results}
+    for question_id, result in latest.items():
+        correct = int(result.is_correct)
+        was = previous.get(question_id)
+        if not was:
+            for board in (GLOBAL_BOARD, current):
+                deltas[board][0] += 1
+                deltas[board][1] += correct
+            continue
+
+        was_correct = int(was.is_correct)
+        deltas[GLOBAL_BOARD][1] += correct - was_correct
+        if week_board(was.answered_at) == current:
+            deltas[current][1] += correct - was_correct
+        else:
+            deltas[current][0] += 1
+            deltas[current][1] += correct
+
+    return {board: tuple(delta) for board, delta in deltas.items() if any(delta)}
+
+
+def update_leaderboards(user, results, previous, now=None):
+    """
+    LeaderboardEntry を F() による加算で更新する (行が無ければ先に作成する)
+    呼び出し側のトランザクション内で実行すること
+    """
+    if not results:
+        return
+    now = now or timezone.now()
+    deltas = leaderboard_deltas(results, previous, now)
+    if not deltas:
+        return
+
+    # 行が無ければ作成
+    LeaderboardEntry.objects.bulk_create(
+        [LeaderboardEntry(board=board, user=user) for board in deltas],
+        ignore_conflicts=True,
+    )
+    for board, (answered, correct) in deltas.items():
+        # rebuild_leaderboard の前など、集計がずれていても負の値にはしない
+        LeaderboardEntry.objects.filter(board=board, user=user).update(
+            answered=Greatest(F('answered') + answered, 0),
+            correct=Greatest(F('correct') + correct, 0),
+            updated_at=now,
+        )
+
+
+def accuracy(correct, answered):
+    return correct / answered if answered else 0.0
+
+
+class _Ranking:
+    """
+    1つのランキング・指標の並び
+    (keys[i] はスコアの符号を反転した値の昇順。rows[i] が (user_id, username, correct, answered))
+    """
+    __slots__ = ('keys', 'rows')
+
+    def __init__(self, rows, score):
+        rows = sorted(rows, key=lambda row: (-score(row[2], row[3]), -row[3], row[0]))
+        self.rows = rows
+        self.keys = [-score(row[2], row[3]) for row in rows]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def rank_of(self, score):
+        """
+        score の順位 (同点は同順位。自分より高いスコアの人数 + 1) を二分探索で返す
+        """
+        return bisect_left(self.keys, -score) + 1
+
+    def top(self, limit):
+        return [
+            (self.rank_of(-self.keys[i]), row)
+            for i, row in enumerate(self.rows[:limit])
+        ]
+
+
+class Leaderboard:
+    """
+    ランキングの上位と順位を返すクラス
+
+    ランキングごとに LeaderboardEntry をスコア順に並べたスナップショットをメモリ上に保持し、
+    上位 N 件はスライス、順位は二分探索 (O(log n)) で求める。
+    スナップショットは LEADERBOARD_SNAPSHOT_MAX_AGE 秒が経過したら作り直す
+    (上位の並びはその分遅れるが、自分のスコアは毎回 LeaderboardEntry から読むので最新になる)。
+    """
+
+    def __init__(self, max_age=None):
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._snapshots = {}  # board -> (作成時刻, {metric: _Ranking})
+
+    @property
+    def max_age(self):
+        if self._max_age is not None:
+            return self._max_age
+        return getattr(settings, 'LEADERBOARD_SNAPSHOT_MAX_AGE', 60)
+
+    def _is_stale(self, snapshot):
+        return snapshot is None or time.monotonic() - snapshot[0] > self.max_age
+
+    def _rankings(self, board):
+        snapshot = self._snapshots.get(board)
+        if not self._is_stale(snapshot):
+            return snapshot[1]
+        with self._lock:
+            # ロック待ちの間に他のスレッドが作り直していれば何もしない
+            snapshot = self._snapshots.get(board)
+            if self._is_stale(snapshot):
+                snapshot = self._snapshots[board] = (time.monotonic(), self._build(board))
+                # 参照されなくなった古い週のスナップショットは捨てる
+                for key, (built_at, _) in list(self._snapshots.items()):
+                    if time.monotonic() - built_at > self.max_age:
+                        del self._snapshots[key]
+        return snapshot[1]
+
+    def _build(self, board):
+        rows = list(
+            LeaderboardEntry.objects.filter(board=board, answered__gt=0)
+            .values_list('user_id', 'user__username', 'correct', 'answered')
+            .iterator(chunk_size=10000)
+        )
+        threshold = min_answered()
+        return {
+            'correct': _Ranking(rows, lambda correct, answered: correct),
+            'accuracy': _Ranking([row for row in rows if row[3] >= threshold], accuracy),
+        }
+
+    def invalidate(self):
+        """
+        次回の取得時にスナップショットを作り直させる
+        """
+        self._snapshots = {}
+
+    def top(self, board, metric='correct', limit=10):
+        """
+        上位 limit 件の [(順位, (user_id, username, correct, answered))] を返す
+        """
+        return self._rankings(board)[metric].top(limit)
+
+    def total(self, board, metric='correct'):
+        """
+        ランキングに載っているユーザー数
+        """
+        return len(self._rankings(board)[metric])
+
+    def rank(self, board, metric, correct, answered):
+        """
+        (correct, answered) のスコアの順位 (ランキングの対象外なら None)
+        """
+        if not answered or (metric == 'accuracy' and answered < min_answered()):
+            return None
+        score = correct if metric == 'correct' else accuracy(correct, answered)
+        return self._rankings(board)[metric].rank_of(score)
+
+
+# プロセス内で共有するランキング
+leaderboard = Leaderboard()
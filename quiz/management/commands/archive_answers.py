@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.models import AnswerArchive
+from quiz.partitions import closed_months, detach_month, ensure_partitions, export_month, rollup_month
+
+
+class Command(BaseCommand):
+    help = (
+        '解答ログ (AnswerLog) の月のパーティションを先に作成し、古い月を AnswerRollup に集約します。'
+        '--export で圧縮ファイルに書き出し、--detach で AnswerLog から切り離します (cron などで定期的に実行する想定)。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=2, help='何か月先までパーティションを作成するか (デフォルト: 2)')
+        parser.add_argument('--keep-months', type=int, default=3, help='集約せずに残す直近の月数 (今月を含む。デフォルト: 3)')
+        parser.add_argument('--export', metavar='DIR', help='集約した月を DIR に gzip 圧縮の CSV で書き出す')
+        parser.add_argument('--detach', action='store_true', help='集約した月を AnswerLog から切り離す')
+        parser.add_argument('--drop', action='store_true', help='切り離したパーティションを削除する (PostgreSQL)')
+        parser.add_argument('--dry-run', action='store_true', help='対象の月を表示するだけで何もしない')
+
+    def handle(self, *args, **options):
+        if options['keep_months'] < 1:
+            raise CommandError('--keep-months には1以上を指定してください。')
+        if options['drop'] and not options['detach']:
+            raise CommandError('--drop は --detach と一緒に指定してください。')
+
+        months = closed_months(options['keep_months'])
+        if options['dry_run']:
+            for month in months:
+                self.stdout.write(f'{month:%Y-%m}')
+            self.stdout.write(f'{len(months)} か月が対象です (dry-run)。')
+            return
+
+        for name in ensure_partitions(options['months_ahead']):
+            self.stdout.write(f'パーティションを作成しました: {name}')
+
+        for month in months:
+            rolled_up = rollup_month(month)
+            archive = AnswerArchive.objects.get(month=month)
+            if rolled_up:
+                self.stdout.write(f'{month:%Y-%m}: {archive.rows} 件を集約しました。')
+
+            if options['export'] and not archive.exported_to:
+                path = export_month(month, options['export'])
+                self.stdout.write(f'{month:%Y-%m}: {path} に書き出しました。')
+
+            if options['detach']:
+                name = detach_month(month, drop=options['drop'])
+                if name is None:
+                    self.stdout.write(f'{month:%Y-%m}: AnswerLog から削除しました。')
+                else:
+                    action = '削除しました' if options['drop'] else '切り離しました'
+                    self.stdout.write(f'{month:%Y-%m}: パーティション {name} を{action}。')
+
+        self.stdout.write(self.style.SUCCESS(f'{len(months)} か月分の解答ログを処理しました。'))
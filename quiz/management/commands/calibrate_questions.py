@@ -0,0 +1,87 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.calibration import (
+    MIN_DISTRACTOR_RATE, MIN_RESPONSES, distractor_issues, distractor_rates, fit, load_responses, save_calibration,
+)
+from quiz.models import Question, Result
+
+
+class Command(BaseCommand):
+    help = (
+        '解答履歴 (Result) から問題の難易度 (difficulty_level) と識別力を推定して書き戻します。'
+        '--distractors で誤答の選択肢の選択率も確認します (cron などで定期的に実行する想定)。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['2pl', 'rasch'], default='2pl', help='2pl は識別力も推定する。rasch は識別力を1に固定する (デフォルト: 2pl)')
+        parser.add_argument('--part', choices=[choice for choice, _ in Question.PART_CHOICES], help='このパートの問題だけを推定する')
+        parser.add_argument('--min-responses', type=int, default=MIN_RESPONSES, help=f'書き戻す問題の最低解答数 (デフォルト: {MIN_RESPONSES})')
+        parser.add_argument('--iterations', type=int, default=100, help='反復回数の上限 (デフォルト: 100)')
+        parser.add_argument('--chunk-size', type=int, default=100000, help='Result を読み込む件数の単位 (デフォルト: 100000)')
+        parser.add_argument('--distractors', action='store_true', help='誤答の選択肢の選択率を集計し、見直しが必要な問題を表示する')
+        parser.add_argument('--min-rate', type=float, default=MIN_DISTRACTOR_RATE, help=f'これ未満の選択率の誤答を「ほぼ選ばれない」とする (デフォルト: {MIN_DISTRACTOR_RATE})')
+        parser.add_argument('--dry-run', action='store_true', help='推定だけ行い、書き戻さない')
+
+    def handle(self, *args, **options):
+        if options['min_responses'] < 1:
+            raise CommandError('--min-responses には1以上を指定してください。')
+        if options['iterations'] < 1:
+            raise CommandError('--iterations には1以上を指定してください。')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size には1以上を指定してください。')
+
+        results = Result.objects.all()
+        if options['part']:
+            results = results.filter(question__part=options['part'])
+
+        started = time.monotonic()
+        responses = load_responses(results, options['chunk_size'])
+        loaded = time.monotonic()
+        self.stdout.write(
+            f'{responses.matrix.nnz} 件の解答を読み込みました '
+            f'(ユーザー {responses.matrix.shape[0]} 人・問題 {responses.matrix.shape[1]} 問、{loaded - started:.2f} 秒)。'
+        )
+        if not responses.matrix.nnz:
+            self.stdout.write(self.style.WARNING('解答がありません。'))
+            return
+
+        calibration = fit(responses, options['model'], options['iterations'])
+        fitted = time.monotonic()
+        eligible = int((calibration.counts >= options['min_responses']).sum())
+        self.stdout.write(f'{calibration.iterations} 回の反復で推定しました ({fitted - loaded:.2f} 秒)。解答数が足りる問題: {eligible} 問')
+
+        if options['verbosity'] >= 2:
+            levels = calibration.difficulty_levels()
+            for question_id, level, discrimination, count in zip(
+                calibration.question_ids, levels, calibration.discrimination, calibration.counts,
+            ):
+                self.stdout.write(f'  [{question_id}] 難易度 {level} 識別力 {discrimination:.2f} ({count} 件)')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'[dry-run] {eligible} 問が書き戻しの対象です。'))
+        else:
+            updated = save_calibration(calibration, options['min_responses'])
+            self.stdout.write(self.style.SUCCESS(f'{updated} 問の難易度・識別力を更新しました。'))
+
+        if options['distractors']:
+            self.report_distractors(results, options['min_responses'], options['min_rate'])
+
+    def report_distractors(self, results, min_responses, min_rate):
+        """
+        解答数が min_responses 以上で、見直しが必要な選択肢がある問題を表示する
+        """
+        flagged = 0
+        for question_id, item in sorted(distractor_rates(results).items()):
+            if item['total'] < min_responses:
+                continue
+            issues = distractor_issues(item, min_rate)
+            if not issues:
+                continue
+            flagged += 1
+            rates = ' '.join(f'{option}:{rate:.0%}' for option, rate in item['rates'].items())
+            self.stdout.write(f"[{question_id}] 正解 {item['correct_answer']} ({item['total']} 件) {rates}")
+            for issue in issues:
+                self.stdout.write(f'  - {issue}')
+        self.stdout.write(self.style.SUCCESS(f'見直しが必要な選択肢がある問題: {flagged} 問'))
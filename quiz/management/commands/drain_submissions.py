@@ -0,0 +1,48 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from quiz.models import SubmissionReceipt
+from quiz.spool import spool_enabled, submission_spool
+
+
+class Command(BaseCommand):
+    help = (
+        'スプール (SUBMIT_SPOOL_DIR) に溜まった解答送信を Result などに保存します。'
+        '--loop で常駐し、SUBMIT_SPOOL_FLUSH_INTERVAL 秒ごとに保存します '
+        '(SUBMIT_SPOOL_DRAIN_IN_PROCESS=False の場合の保存用・サーバー停止後の残りの保存用)。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='終了せずに保存を続ける')
+        parser.add_argument(
+            '--stale-after', type=float,
+            help='終了したプロセスの書き込み中・保存中のファイルのうち、この秒数以上更新の無いものを保存する',
+        )
+        parser.add_argument('--prune-days', type=int, help='この日数より前の SubmissionReceipt (保存の記録) を削除する')
+
+    def handle(self, *args, **options):
+        if not spool_enabled():
+            raise CommandError('SUBMIT_SPOOL_DIR が設定されていません。')
+        if options['prune_days'] is not None and options['prune_days'] < 1:
+            raise CommandError('--prune-days には1以上を指定してください。')
+
+        while True:
+            recovered = submission_spool.recover(options['stale_after'])
+            started = time.monotonic()
+            segments, applied = submission_spool.drain()
+            if recovered or segments or not options['loop']:
+                self.stdout.write(
+                    f'{segments} ファイル・{applied} 件の送信を保存しました '
+                    f'({time.monotonic() - started:.2f} 秒。止まったプロセスのファイル: {recovered})。'
+                )
+            if not options['loop']:
+                break
+            time.sleep(submission_spool.flush_interval)
+
+        if options['prune_days'] is not None:
+            cutoff = timezone.now() - datetime.timedelta(days=options['prune_days'])
+            deleted, _ = SubmissionReceipt.objects.filter(applied_at__lt=cutoff).delete()
+            self.stdout.write(f'{deleted} 件の保存の記録を削除しました。')
@@ -0,0 +1,51 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.export import EXPORTS, FORMATS, export_chunks, parse_since
+
+
+class Command(BaseCommand):
+    help = (
+        '問題 (questions) か解答履歴 (results) を CSV / JSONL で書き出します。'
+        'サーバーサイドカーソルで少しずつ読み込むので、件数が多くてもメモリ使用量は増えません。'
+        '問題の CSV はそのまま import_questions で取り込めます。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS), help='書き出す対象')
+        parser.add_argument('--format', choices=FORMATS, default='csv', help='出力形式 (デフォルト: csv)')
+        parser.add_argument('--gzip', action='store_true', help='gzip で圧縮する')
+        parser.add_argument('--since', help='この日時以降に更新 (問題) ・解答 (解答履歴) されたものだけを書き出す (ISO 8601)')
+        parser.add_argument('--output', '-o', default='-', help='出力先のファイル (デフォルト: 標準出力)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='1回に読み込む行数 (デフォルト: 2000)')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size には1以上を指定してください。')
+        try:
+            since = parse_since(options['since']) if options['since'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = export_chunks(
+            options['kind'], options['format'], options['gzip'], since, options['chunk_size'],
+        )
+        started = time.monotonic()
+        written = 0
+        if options['output'] == '-':
+            output = sys.stdout.buffer
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+            output.flush()
+            return
+
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['output']} に書き出しました ({written:,} バイト, {time.monotonic() - started:.2f} 秒)。"
+        ))
@@ -0,0 +1,111 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+
+from quiz.bank import bump_bank_version
+from quiz.dedupe import DEFAULT_THRESHOLD, NUM_PERM, QUESTION_FIELDS, find_duplicates, question_dedupe_text
+from quiz.models import Question, Result, ReviewItem
+from quiz.payloads import invalidate_fragments
+
+
+class Command(BaseCommand):
+    help = '言い換え・句読点違いなど、ほぼ同じ問題のクラスタを表示します (--merge で1問にまとめます)。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help=f'同じ問題とみなす類似度 (0〜1、デフォルト: {DEFAULT_THRESHOLD})')
+        parser.add_argument('--num-perm', type=int, default=NUM_PERM, help=f'MinHash の署名の長さ (デフォルト: {NUM_PERM})')
+        parser.add_argument('--part', choices=[choice for choice, _ in Question.PART_CHOICES], help='このパートの問題だけを比較する')
+        parser.add_argument('--limit', type=int, default=50, help='表示するクラスタの数 (0 なら全件、デフォルト: 50)')
+        parser.add_argument('--merge', action='store_true', help='クラスタごとに ID の最も小さい問題を残し、他の問題の解答履歴・復習予定を移して削除する')
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        if not 0 < threshold <= 1:
+            raise CommandError('--threshold には 0 より大きく 1 以下の値を指定してください。')
+        if options['num_perm'] < 1:
+            raise CommandError('--num-perm には1以上を指定してください。')
+
+        started = time.monotonic()
+        questions = Question.objects.order_by('id')
+        if options['part']:
+            questions = questions.filter(part=options['part'])
+        ids, passages, texts = [], [], []
+        for row in questions.values('id', 'passage_id', *QUESTION_FIELDS).iterator(chunk_size=10000):
+            ids.append(row['id'])
+            passages.append(row['passage_id'])
+            texts.append(question_dedupe_text(row))
+
+        # 長文の設問は長文ごとに同じ問題文がありうるので、同じ長文 (か長文なし) の問題どうしだけをまとめる
+        clusters = []
+        for members in find_duplicates(texts, threshold, options['num_perm'])[0]:
+            groups = {}
+            for member in members:
+                groups.setdefault(passages[member], []).append(ids[member])
+            clusters += [group for group in groups.values() if len(group) > 1]
+
+        limit = options['limit'] or len(clusters)
+        if clusters:
+            details = Question.objects.in_bulk([question_id for members in clusters[:limit] for question_id in members])
+            for members in clusters[:limit]:
+                self.stdout.write(f'--- {len(members)} 問')
+                for question_id in members:
+                    question = details[question_id]
+                    self.stdout.write(f'  [{question_id}] {question.part} 正解:{question.correct_answer} {question.question_text[:80]}')
+            if len(clusters) > limit:
+                self.stdout.write(f'... 他 {len(clusters) - limit} クラスタ')
+
+        duplicates = sum(len(members) - 1 for members in clusters)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(ids)} 問中 {len(clusters)} クラスタ (重複 {duplicates} 問) が見つかりました '
+            f'({time.monotonic() - started:.2f} 秒)。'
+        ))
+
+        if options['merge'] and clusters:
+            merged = self.merge(clusters)
+            self.stdout.write(self.style.SUCCESS(f'{merged} 問を削除しました。'))
+            if merged:
+                self.stdout.write(self.style.WARNING(
+                    'rebuild_user_stats と rebuild_leaderboard を実行して、集計を作り直してください。'
+                ))
+
+    def merge(self, clusters):
+        """
+        各クラスタの ID の最も小さい問題に解答履歴・復習予定を移し、他の問題を削除して、削除した件数を返す
+        正解やパートが異なる問題は、別の問題の可能性があるので残す
+        """
+        merged = []
+        for members in clusters:
+            questions = Question.objects.in_bulk(members)
+            keeper = questions[members[0]]
+            duplicates = [
+                question_id for question_id in members[1:]
+                if questions[question_id].correct_answer == keeper.correct_answer
+                and questions[question_id].part == keeper.part
+            ]
+            if not duplicates:
+                continue
+            with transaction.atomic():
+                for model, answered_at in ((Result, 'answered_at'), (ReviewItem, 'last_reviewed_at')):
+                    # (user, question) はユニークなので、残す問題に履歴が無いユーザーの最新の1件だけを移す
+                    # (解き直しは UPSERT で元の行の id のまま更新されるので、id ではなく解答日時で選ぶ)
+                    answered = model.objects.filter(question_id=keeper.pk).values('user_id')
+                    candidates = model.objects.filter(question_id__in=duplicates)
+                    latest = Subquery(
+                        candidates.filter(user_id=OuterRef('user_id'))
+                        .order_by(f'-{answered_at}', '-id').values('id')[:1]
+                    )
+                    moved = (
+                        candidates.exclude(user_id__in=answered)
+                        .annotate(latest=latest).filter(id=F('latest')).values_list('id', flat=True)
+                    )
+                    model.objects.filter(pk__in=list(moved)).update(question_id=keeper.pk)
+                # 移さなかった分は問題と一緒に削除される (CASCADE)
+                Question.objects.filter(pk__in=duplicates).delete()
+            merged += duplicates
+
+        if merged:
+            invalidate_fragments(merged)
+            bump_bank_version()
+        return len(merged)
@@ -1,76 +1,280 @@
 import csv
-from django.core.management.base import BaseCommand, CommandError
-from quiz.models import Question
+import gzip
 import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from quiz.bank import bump_bank_version
+from quiz.dedupe import DEFAULT_THRESHOLD, QUESTION_FIELDS, find_duplicates, question_dedupe_text
+from quiz.models import Passage, Question, question_content_hash
+from quiz.payloads import invalidate_fragments
+from quiz.stats import regroup_user_stats
+from quiz.utils import chunked
+
+# CSVの必須ヘッダー (モデルのフィールド名と一致)
+EXPECTED_HEADERS = ['question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer', 'explanation', 'part', 'difficulty_level']
+
+# 長文 (Passage) を共有する設問のための任意の列
+# passage_key が同じ行は1つの長文を共有する。本文 (passage_text) とタイトルはグループの最初の行に書く
+PASSAGE_HEADERS = ['passage_key', 'passage_title', 'passage_text']
+
+# 既存の問題を更新するときに比較・上書きするフィールド
+UPDATE_FIELDS = ['question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer', 'explanation', 'part', 'difficulty_level']
+
+
+def build_question(row, passage_id=None):
+    """
+    CSVの1行から未保存の Question を作る (passage_id は passage_key から解決した長文のID)
+    """
+    # 難易度を整数に変換（空の場合はデフォルト値が使われるようにNone）
+    try:
+        difficulty = int(row.get('difficulty_level', 600))
+    except (ValueError, TypeError):
+        difficulty = 600 # 変換失敗時はデフォルト600
+
+    # 解説が空の場合（None）に対応
+    explanation_text = row.get('explanation')
+    if not explanation_text:
+        explanation_text = "" # DBの制約に合わせて空文字に
+
+    return Question(
+        question_text=row['question_text'],
+        passage_id=passage_id,
+        option_a=row['option_a'],
+        option_b=row['option_b'],
+        option_c=row['option_c'],
+        option_d=row['option_d'],
+        correct_answer=row['correct_answer'],
+        explanation=explanation_text,
+        part=row.get('part') or 'PART5', # CSVになければPART5
+        difficulty_level=difficulty,
+        # bulk_create は save() を呼ばないので、ここでハッシュを設定する
+        content_hash=question_content_hash(row['question_text'], passage_id),
+    )
+
 
 class Command(BaseCommand):
     help = '指定されたCSVファイルからTOEIC問題を一括インポートします。'
 
     def add_arguments(self, parser):
         # コマンドがCSVファイルのパスを引数として受け取れるようにする
-        parser.add_argument('csv_file_path', type=str, help='インポートするCSVファイルのパス')
+        parser.add_argument('csv_file_path', type=str, help='インポートするCSVファイルのパス (.gz なら gzip 圧縮として読む)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='1トランザクションで処理する行数 (デフォルト: 1000)')
+        parser.add_argument('--dry-run', action='store_true', help='データベースに書き込まず、件数だけを表示する')
+        parser.add_argument('--dedupe', action='store_true', help='既存の問題や先の行とほぼ同じ (言い換え・句読点違い) 行を取り込まない')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help=f'--dedupe で同じ問題とみなす類似度 (デフォルト: {DEFAULT_THRESHOLD})')
 
     def handle(self, *args, **options):
         csv_file_path = options['csv_file_path']
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        verbosity = options['verbosity']
+        # passage_key → 長文のID (グループが複数のチャンクにまたがっても同じ長文を使う)
+        self.passages = {}
+
+        if batch_size < 1:
+            raise CommandError('--batch-size には1以上を指定してください。')
+        if not 0 < options['threshold'] <= 1:
+            raise CommandError('--threshold には 0 より大きく 1 以下の値を指定してください。')
 
         # ファイルの存在チェック
         if not os.path.exists(csv_file_path):
             raise CommandError(f"ファイルが見つかりません: {csv_file_path}")
 
-        # CSVファイルを開く (UTF-8 BOM付きにも対応)
+        # CSVファイルを開く (UTF-8 BOM付きにも対応。export_data --gzip の出力もそのまま読める)
+        opener = gzip.open if csv_file_path.endswith('.gz') else open
         try:
-            with open(csv_file_path, mode='r', encoding='utf-8-sig') as file:
+            with opener(csv_file_path, mode='rt', encoding='utf-8-sig', newline='') as file:
                 reader = csv.DictReader(file)
-                
+
                 # CSVのヘッダー（列名）がモデルと一致しているか簡易チェック
-                expected_headers = ['question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer', 'explanation', 'part', 'difficulty_level']
-                if not all(header in reader.fieldnames for header in expected_headers):
+                if not all(header in (reader.fieldnames or []) for header in EXPECTED_HEADERS):
                     self.stdout.write(self.style.ERROR('CSVのヘッダーが正しくありません。'))
-                    self.stdout.write(self.style.WARNING(f"必須ヘッダー: {expected_headers}"))
+                    self.stdout.write(self.style.WARNING(f"必須ヘッダー: {EXPECTED_HEADERS}"))
                     self.stdout.write(self.style.WARNING(f"検出されたヘッダー: {reader.fieldnames}"))
                     return
 
+                count_rows = 0
                 count_created = 0
                 count_updated = 0
+                count_unchanged = 0
+                count_duplicates = 0
+                count_skipped = 0
+                started = time.monotonic()
+
+                rows = reader
+                if options['dedupe']:
+                    # 全行を既存の問題とまとめて比較するので、先に読み込む
+                    rows = [{**row, 'line': line} for line, row in enumerate(reader, start=2)]
+                    rows, skipped = self.drop_near_duplicates(rows, options['threshold'])
+                    count_skipped = len(skipped)
+                    if verbosity >= 2:
+                        for line, question_text in skipped:
+                            self.stdout.write(f"{line} 行目はほぼ同じ問題があるため取り込みません: {question_text[:80]}")
+
+                # チャンク単位で読み込み・差分計算・書き込みを行う
+                for chunk_number, chunk in enumerate(chunked(rows, batch_size), start=1):
+                    created, updated, unchanged, duplicates = self.import_chunk(chunk, dry_run)
+                    count_rows += len(chunk)
+                    count_created += created
+                    count_updated += updated
+                    count_unchanged += unchanged
+                    count_duplicates += duplicates
 
-                for row in reader:
-                    # 難易度を整数に変換（空の場合はデフォルト値が使われるようにNone）
-                    try:
-                        difficulty = int(row.get('difficulty_level', 600))
-                    except (ValueError, TypeError):
-                        difficulty = 600 # 変換失敗時はデフォルト600
-
-                    # 解説が空の場合（None）に対応
-                    explanation_text = row.get('explanation')
-                    if not explanation_text:
-                        explanation_text = "" # DBの制約に合わせて空文字に
-
-                    # update_or_create でデータの登録・更新を安全に行う
-                    # question_text が一致するものが既にあれば更新、なければ新規作成
-                    question, created = Question.objects.update_or_create(
-                        question_text=row['question_text'], # 問題文をキーにして重複チェック
-                        defaults={
-                            'option_a': row['option_a'],
-                            'option_b': row['option_b'],
-                            'option_c': row['option_c'],
-                            'option_d': row['option_d'],
-                            'correct_answer': row['correct_answer'],
-                            'explanation': explanation_text,
-                            'part': row.get('part', 'PART5'), # CSVになければPART5
-                            'difficulty_level': difficulty,
-                        }
-                    )
-
-                    if created:
-                        count_created += 1
-                    else:
-                        count_updated += 1
-
-            self.stdout.write(self.style.SUCCESS(f'インポートが完了しました。'))
-            self.stdout.write(self.style.SUCCESS(f'新規作成: {count_created} 件'))
-            self.stdout.write(self.style.SUCCESS(f'更新: {count_updated} 件'))
+                    # 進捗 (通常は10チャンクごと、-v 2 以上なら毎チャンク)
+                    if verbosity >= 2 or (verbosity >= 1 and chunk_number % 10 == 0):
+                        elapsed = time.monotonic() - started
+                        self.stdout.write(f"{count_rows} 行処理済み ({count_rows / elapsed if elapsed else 0:.0f} 行/秒)")
+
+            # bulk_create / bulk_update はシグナルを送らないので、ここでキャッシュを無効化する
+            if not dry_run and (count_created or count_updated):
+                bump_bank_version()
+
+            elapsed = time.monotonic() - started
+            prefix = '[dry-run] ' if dry_run else ''
+            self.stdout.write(self.style.SUCCESS(f'{prefix}インポートが完了しました。'))
+            self.stdout.write(self.style.SUCCESS(f'{prefix}新規作成: {count_created} 件'))
+            self.stdout.write(self.style.SUCCESS(f'{prefix}更新: {count_updated} 件'))
+            self.stdout.write(self.style.SUCCESS(f'{prefix}変更なし: {count_unchanged} 件'))
+            if count_duplicates:
+                self.stdout.write(self.style.SUCCESS(f'{prefix}CSV 内の重複 (後の行を採用): {count_duplicates} 件'))
+            if options['dedupe']:
+                self.stdout.write(self.style.SUCCESS(f'{prefix}ほぼ同じ問題があるため除外: {count_skipped} 件'))
+            if self.passages:
+                self.stdout.write(self.style.SUCCESS(f'{prefix}長文: {len(self.passages)} 件'))
+            self.stdout.write(self.style.SUCCESS(f'{prefix}処理時間: {elapsed:.2f} 秒 ({count_rows / elapsed if elapsed else 0:.0f} 行/秒)'))
 
         except FileNotFoundError:
             raise CommandError(f"ファイルが見つかりません: {csv_file_path}")
         except Exception as e:
-            raise CommandError(f"インポート中にエラーが発生しました: {e}")
\ No newline at end of file
+            raise CommandError(f"インポート中にエラーが発生しました: {e}")
+
+    def drop_near_duplicates(self, rows, threshold):
+        """
+        既存の問題か先の行とほぼ同じ行を除き、(残した行のリスト, [(行番号, 問題文), ...]) を返す
+        既存の問題と content_hash が同じ行 (既存の問題の更新) は残す
+        長文の設問は長文ごとに同じ問題文がありうるので比較しない
+        """
+        passage_rows = [row for row in rows if (row.get('passage_key') or '').strip()]
+        rows = [row for row in rows if not (row.get('passage_key') or '').strip()]
+
+        existing_hashes = set()
+        texts = []
+        questions = Question.objects.filter(passage__isnull=True).order_by('id').values('content_hash', *QUESTION_FIELDS)
+        for question in questions.iterator(chunk_size=10000):
+            existing_hashes.add(question['content_hash'])
+            texts.append(question_dedupe_text(question))
+        offset = len(texts)
+        texts += [question_dedupe_text(row) for row in rows]
+
+        # クラスタの先頭 (既存の問題、無ければ最初の行) 以外を除く
+        clusters, _ = find_duplicates(texts, threshold)
+        dropped = set()
+        for members in clusters:
+            for member in members[1:]:
+                if member >= offset and question_content_hash(rows[member - offset]['question_text']) not in existing_hashes:
+                    dropped.add(member - offset)
+
+        # 行番号はヘッダーを1行目として数える
+        skipped = [(rows[index]['line'], rows[index]['question_text']) for index in sorted(dropped)]
+        return [row for index, row in enumerate(rows) if index not in dropped] + passage_rows, skipped
+
+    def resolve_passages(self, rows, dry_run=False):
+        """
+        チャンク内の新しい passage_key の長文を作成し (本文が同じ既存の長文があれば再利用する)、{passage_key: 長文のID} を返す
+        (呼び出し側のトランザクション内で実行すること)
+        """
+        new = {}
+        for row in rows:
+            key = (row.get('passage_key') or '').strip()
+            if not key or key in self.passages or key in new:
+                continue
+            text = (row.get('passage_text') or '').strip()
+            if not text:
+                raise ValueError(f'passage_key "{key}" の最初の行に passage_text がありません。')
+            new[key] = Passage(
+                title=(row.get('passage_title') or '').strip(), passage_text=text,
+                # bulk_create は save() を呼ばないので、ここでハッシュを設定する
+                content_hash=question_content_hash(text),
+            )
+        if not new:
+            return {}
+
+        # 本文のハッシュで既存の長文を1回のクエリで探し、無いものだけをまとめて作成する
+        passages = Passage.objects.in_bulk({passage.content_hash for passage in new.values()}, field_name='content_hash')
+        to_create = {
+            passage.content_hash: passage for passage in new.values() if passage.content_hash not in passages
+        }
+        if dry_run:
+            # 作成しないので、既存の問題と一致しない仮のIDにする
+            for number, passage in enumerate(to_create.values(), start=len(self.passages) + 1):
+                passage.pk = -number
+        else:
+            Passage.objects.bulk_create(to_create.values())
+        passages.update(to_create)
+        return {key: passages[passage.content_hash].pk for key, passage in new.items()}
+
+    def import_chunk(self, rows, dry_run=False):
+        """
+        1チャンク分の行を1トランザクションで取り込み、(新規作成, 更新, 変更なし, チャンク内の重複) の件数を返す
+        (長文の作成も同じトランザクションで行うので、失敗したチャンクの長文は残らない)
+        """
+        with transaction.atomic():
+            new_passages = self.resolve_passages(rows, dry_run)
+            passages = {**self.passages, **new_passages}
+
+            # チャンク内で同じ問題が重複している場合は後の行を採用する
+            incoming = {}
+            for row in rows:
+                question = build_question(row, passages.get((row.get('passage_key') or '').strip()))
+                incoming[question.content_hash] = question
+            to_create, to_update, regrouped = self.diff(incoming)
+
+            if not dry_run:
+                Question.objects.bulk_create(to_create)
+                Question.objects.bulk_update(to_update, [*UPDATE_FIELDS, 'updated_at'])
+                regroup_user_stats(regrouped)
+
+        # 長文のIDはコミットしてから次のチャンクに引き継ぐ
+        self.passages.update(new_passages)
+        if not dry_run:
+            # 更新した問題の作成済み JSON を破棄する (bulk_update はシグナルを送らない)
+            invalidate_fragments([question.pk for question in to_update])
+
+        unchanged = len(incoming) - len(to_create) - len(to_update)
+        return len(to_create), len(to_update), unchanged, len(rows) - len(incoming)
+
+    def diff(self, incoming):
+        """
+        {content_hash: 未保存の Question} を既存の問題と比べ、(作成する問題, 更新する問題, {問題ID: (変更前, 変更後)}) を返す
+        (変更前・変更後はパート・難易度が変わる問題の (part, difficulty_level)。成績集計の件数を移し替える)
+        """
+        # 既存の問題との差分を1回のクエリで取得する (content_hash はユニークインデックス)
+        existing = Question.objects.in_bulk(list(incoming), field_name='content_hash')
+
+        to_create = []
+        to_update = []
+        regrouped = {}
+        now = timezone.now()
+        for content_hash, question in incoming.items():
+            current = existing.get(content_hash)
+            if current is None:
+                to_create.append(question)
+                continue
+            before = (current.part, current.difficulty_level)
+            changed = False
+            for field in UPDATE_FIELDS:
+                value = getattr(question, field)
+                if getattr(current, field) != value:
+                    setattr(current, field, value)
+                    changed = True
+            if changed:
+                # bulk_update は auto_now を設定しないので手動で更新する
+                current.updated_at = now
+                to_update.append(current)
+                if (current.part, current.difficulty_level) != before:
+                    regrouped[current.pk] = (before, (current.part, current.difficulty_level))
+        return to_create, to_update, regrouped
@@ -0,0 +1,75 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Q
+
+from quiz.leaderboard import GLOBAL_BOARD, leaderboard, week_board
+from quiz.models import AnswerLog, LeaderboardEntry, Result
+from quiz.utils import chunked
+
+
+class Command(BaseCommand):
+    help = 'Result と AnswerLog からランキング (全期間・週間) を再計算します (初回の作成や、ずれの修復用)。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='1トランザクションで処理するユーザー数 (デフォルト: 500)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size には1以上を指定してください。')
+
+        user_ids = User.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=batch_size)
+        count_users = count_entries = 0
+        for batch in chunked(user_ids, batch_size):
+            count_entries += self.rebuild_batch(batch)
+            count_users += len(batch)
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"{count_users} ユーザー処理済み")
+
+        leaderboard.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'{count_users} ユーザーのランキングを再計算しました ({count_entries} 件)。'
+        ))
+
+    def rebuild_batch(self, user_ids):
+        # 全期間は Result (問題ごとの最新の解答) を1回の GROUP BY で集計する
+        scores = {
+            (GLOBAL_BOARD, row['user_id']): [row['answered'], row['correct']]
+            for row in (
+                Result.objects.filter(user_id__in=user_ids)
+                .values('user_id')
+                .annotate(answered=Count('id'), correct=Count('id', filter=Q(is_correct=True)))
+                .order_by()
+            )
+        }
+
+        # 週間は、その週に解いた問題ごとに、その週の最後の解答が正解かどうかを数える (解答送信時の差分と同じ)。
+        # 解き直しは AnswerLog にだけ残るので、AnswerLog より前の解答は Result から補い、AnswerLog で上書きする
+        weekly = defaultdict(dict)
+        for rows in (
+            Result.objects.filter(user_id__in=user_ids).values_list('user_id', 'question_id', 'is_correct', 'answered_at'),
+            AnswerLog.objects.filter(user_id__in=user_ids).order_by('answered_at', 'id')
+            .values_list('user_id', 'question_id', 'is_correct', 'answered_at'),
+        ):
+            for user_id, question_id, is_correct, answered_at in rows.iterator(chunk_size=5000):
+                weekly[(week_board(answered_at), user_id)][question_id] = is_correct
+        for key, outcomes in weekly.items():
+            scores[key] = [len(outcomes), sum(outcomes.values())]
+
+        with transaction.atomic():
+            # 解答が無くなったランキングの行も消えるよう、削除してから作り直す
+            # (AnswerLog から切り離した月の週間ランキングは作り直せないので残す)
+            LeaderboardEntry.objects.filter(
+                user_id__in=user_ids, board__in={GLOBAL_BOARD} | {board for board, _ in weekly}
+            ).delete()
+            LeaderboardEntry.objects.bulk_create(
+                [
+                    LeaderboardEntry(board=board, user_id=user_id, answered=answered, correct=correct)
+                    for (board, user_id), (answered, correct) in scores.items()
+                ],
+                batch_size=1000,
+            )
+        return len(scores)
@@ -0,0 +1,111 @@
+import datetime
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, CharField, Count, Q, Value, When
+from django.db.models.functions import TruncDate
+
+from quiz.models import DIFFICULTY_BANDS, AnswerLog, Result, UserStats
+from quiz.utils import chunked
+
+# UserStats の集計列 (user と updated_at 以外)
+STATS_FIELDS = [
+    field.name for field in UserStats._meta.concrete_fields
+    if field.name not in ('user', 'updated_at')
+]
+
+
+def band_expression():
+    """
+    question__difficulty_level を難易度帯のキーに変換する式 (DIFFICULTY_BANDS と同じ区切り)
+    """
+    whens = []
+    for key, _, lower, upper in DIFFICULTY_BANDS:
+        condition = Q()
+        if lower is not None:
+            condition &= Q(question__difficulty_level__gte=lower)
+        if upper is not None:
+            condition &= Q(question__difficulty_level__lt=upper)
+        whens.append(When(condition, then=Value(key)))
+    return Case(*whens, output_field=CharField())
+
+
+def streaks(days):
+    """
+    昇順の日付リストから (最後の日で終わる連続日数, 最長連続日数) を返す
+    """
+    current = longest = 0
+    previous = None
+    for day in days:
+        current = current + 1 if previous == day - datetime.timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest
+
+
+class Command(BaseCommand):
+    help = 'Result (連続学習日数は AnswerLog も) から UserStats を再計算します (初回の作成や、ずれの修復用)。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='1トランザクションで処理するユーザー数 (デフォルト: 500)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size には1以上を指定してください。')
+
+        user_ids = User.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=batch_size)
+        count_users = 0
+        for batch in chunked(user_ids, batch_size):
+            self.rebuild_batch(batch)
+            count_users += len(batch)
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"{count_users} ユーザー処理済み")
+
+        self.stdout.write(self.style.SUCCESS(f'{count_users} ユーザーの成績集計を再計算しました。'))
+
+    def rebuild_batch(self, user_ids):
+        stats = defaultdict(lambda: defaultdict(int))
+
+        # パート × 難易度帯ごとの件数を1回の GROUP BY で集計
+        rows = (
+            Result.objects.filter(user_id__in=user_ids)
+            .values('user_id', 'question__part', band=band_expression())
+            .annotate(answered=Count('id'), correct=Count('id', filter=Q(is_correct=True)))
+            .order_by()
+        )
+        for row in rows:
+            user_stats = stats[row['user_id']]
+            for group in ('total', row['question__part'].lower(), row['band']):
+                user_stats[f'{group}_answered'] += row['answered']
+                user_stats[f'{group}_correct'] += row['correct']
+
+        # 解答日から連続学習日数を計算する
+        # Result の answered_at は最新の解答日時だけなので、解き直す前の解答日は AnswerLog から補う
+        # (AnswerLog から切り離した月は Result に残っている日だけになる)
+        days = defaultdict(set)
+        for model in (Result, AnswerLog):
+            rows = (
+                model.objects.filter(user_id__in=user_ids)
+                .values_list('user_id', TruncDate('answered_at'))
+                .distinct()
+                .order_by()
+            )
+            for user_id, day in rows:
+                days[user_id].add(day)
+        for user_id, user_days in days.items():
+            user_days = sorted(user_days)
+            stats[user_id]['current_streak'], stats[user_id]['longest_streak'] = streaks(user_days)
+            stats[user_id]['last_active_date'] = user_days[-1]
+
+        with transaction.atomic():
+            UserStats.objects.bulk_create(
+                [UserStats(user_id=user_id, **values) for user_id, values in stats.items()],
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=[*STATS_FIELDS, 'updated_at'],
+            )
+            # 解答が1件も無いユーザーの集計は削除する
+            UserStats.objects.filter(user_id__in=user_ids).exclude(user_id__in=list(stats)).delete()
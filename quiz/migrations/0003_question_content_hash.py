@@ -0,0 +1,51 @@
+import hashlib
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+def content_hash(question_text):
+    """
+    このマイグレーションを作成した時点の quiz.models.question_content_hash
+    (モデル側の関数が後で変わっても、このマイグレーションの結果は変わらないよう固定する)
+    """
+    normalized = re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', question_text)).strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def fill_content_hash(apps, schema_editor):
+    """
+    既存の問題に content_hash を設定する
+    (正規化後に重複する問題は NULL のまま残す)
+    """
+    Question = apps.get_model('quiz', 'Question')
+    seen = set()
+    batch = []
+    for question in Question.objects.only('id', 'question_text').order_by('id').iterator(chunk_size=2000):
+        value = content_hash(question.question_text)
+        if value in seen:
+            continue
+        seen.add(value)
+        question.content_hash = value
+        batch.append(question)
+        if len(batch) >= 2000:
+            Question.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    Question.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0002_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, verbose_name='内容ハッシュ'),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+    ]
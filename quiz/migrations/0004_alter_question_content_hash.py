@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # データ移行 (0003) とは別トランザクションで UNIQUE 制約を追加する
+    dependencies = [
+        ('quiz', '0003_question_content_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True, verbose_name='内容ハッシュ'),
+        ),
+    ]
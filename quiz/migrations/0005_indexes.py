@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0004_alter_question_content_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['part', 'difficulty_level'], name='question_part_difficulty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['difficulty_level'], name='question_difficulty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['user', '-answered_at'], name='result_user_answered_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['question', 'is_correct'], name='result_question_correct_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['answered_at'], name='result_answered_at_idx'),
+        ),
+        # 置き換え先のインデックスを作成してから、FK 単体のインデックスを削除する
+        migrations.AlterField(
+            model_name='result',
+            name='question',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='quiz.question', verbose_name='対象問題'),
+        ),
+        migrations.AlterField(
+            model_name='result',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='解答者'),
+        ),
+    ]
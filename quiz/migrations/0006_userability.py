@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('quiz', '0005_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAbility',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+                ('rating', models.FloatField(default=600, verbose_name='推定能力値')),
+                ('answered_count', models.PositiveIntegerField(default=0, verbose_name='解答数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '推定能力値',
+                'verbose_name_plural': '推定能力値一覧',
+            },
+        ),
+    ]
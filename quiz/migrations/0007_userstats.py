@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('quiz', '0006_userability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+                ('total_answered', models.PositiveIntegerField(default=0, verbose_name='解答数')),
+                ('total_correct', models.PositiveIntegerField(default=0, verbose_name='正解数')),
+                ('part5_answered', models.PositiveIntegerField(default=0, verbose_name='Part 5 解答数')),
+                ('part5_correct', models.PositiveIntegerField(default=0, verbose_name='Part 5 正解数')),
+                ('part7_answered', models.PositiveIntegerField(default=0, verbose_name='Part 7 解答数')),
+                ('part7_correct', models.PositiveIntegerField(default=0, verbose_name='Part 7 正解数')),
+                ('basic_answered', models.PositiveIntegerField(default=0, verbose_name='〜495 解答数')),
+                ('basic_correct', models.PositiveIntegerField(default=0, verbose_name='〜495 正解数')),
+                ('intermediate_answered', models.PositiveIntegerField(default=0, verbose_name='500〜695 解答数')),
+                ('intermediate_correct', models.PositiveIntegerField(default=0, verbose_name='500〜695 正解数')),
+                ('advanced_answered', models.PositiveIntegerField(default=0, verbose_name='700〜845 解答数')),
+                ('advanced_correct', models.PositiveIntegerField(default=0, verbose_name='700〜845 正解数')),
+                ('expert_answered', models.PositiveIntegerField(default=0, verbose_name='850〜 解答数')),
+                ('expert_correct', models.PositiveIntegerField(default=0, verbose_name='850〜 正解数')),
+                ('current_streak', models.PositiveIntegerField(default=0, verbose_name='連続学習日数')),
+                ('longest_streak', models.PositiveIntegerField(default=0, verbose_name='最長連続学習日数')),
+                ('last_active_date', models.DateField(blank=True, null=True, verbose_name='最終学習日')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '成績集計',
+                'verbose_name_plural': '成績集計一覧',
+            },
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:21
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# このマイグレーションを作成した時点の quiz.review の定数
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+QUALITY_CORRECT = 4
+QUALITY_INCORRECT = 1
+RELEARN_DELAY = datetime.timedelta(minutes=10)
+
+
+def schedule(ease, interval, repetitions, is_correct, now):
+    """
+    このマイグレーションを作成した時点の quiz.review.schedule
+    (quiz.review が後で変わっても、このマイグレーションの結果は変わらないよう固定する)
+    """
+    quality = QUALITY_CORRECT if is_correct else QUALITY_INCORRECT
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if quality < 3:
+        return ease, 0, 0, now + RELEARN_DELAY
+
+    if repetitions == 0:
+        interval = 1
+    elif repetitions == 1:
+        interval = 6
+    else:
+        interval = round(interval * ease)
+    return ease, interval, repetitions + 1, now + datetime.timedelta(days=interval)
+
+
+def create_review_items(apps, schema_editor):
+    """
+    既存の解答履歴から復習スケジュールを作成する (各問題を1回解いた状態とみなす)
+    """
+    Result = apps.get_model('quiz', 'Result')
+    ReviewItem = apps.get_model('quiz', 'ReviewItem')
+    batch = []
+    rows = Result.objects.order_by('id').values_list('user_id', 'question_id', 'is_correct', 'answered_at')
+    for user_id, question_id, is_correct, answered_at in rows.iterator(chunk_size=5000):
+        ease, interval, repetitions, next_due = schedule(INITIAL_EASE, 0, 0, is_correct, answered_at)
+        batch.append(ReviewItem(
+            user_id=user_id, question_id=question_id,
+            ease=ease, interval=interval, repetitions=repetitions,
+            next_due=next_due, last_reviewed_at=answered_at,
+        ))
+        if len(batch) >= 5000:
+            ReviewItem.objects.bulk_create(batch)
+            batch = []
+    ReviewItem.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0007_userstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ease', models.FloatField(default=2.5, verbose_name='易しさ係数')),
+                ('interval', models.PositiveIntegerField(default=0, verbose_name='復習間隔 (日)')),
+                ('repetitions', models.PositiveIntegerField(default=0, verbose_name='連続正解回数')),
+                ('next_due', models.DateTimeField(verbose_name='次回の復習日時')),
+                ('last_reviewed_at', models.DateTimeField(verbose_name='最終解答日時')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.question', verbose_name='対象問題')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': '復習スケジュール',
+                'verbose_name_plural': '復習スケジュール一覧',
+                'indexes': [models.Index(fields=['user', 'next_due'], name='review_user_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'question'), name='unique_review_user_question')],
+            },
+        ),
+        migrations.RunPython(create_review_items, migrations.RunPython.noop),
+    ]
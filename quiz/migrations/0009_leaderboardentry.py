@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0008_reviewitem'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(max_length=10, verbose_name='ランキング')),
+                ('correct', models.PositiveIntegerField(default=0, verbose_name='正解数')),
+                ('answered', models.PositiveIntegerField(default=0, verbose_name='解答数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': 'ランキング',
+                'verbose_name_plural': 'ランキング一覧',
+                'constraints': [models.UniqueConstraint(fields=('board', 'user'), name='unique_leaderboard_board_user')],
+            },
+        ),
+    ]
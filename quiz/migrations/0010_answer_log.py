@@ -0,0 +1,132 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:27
+
+import datetime
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# マイグレーション時に作成する月のパーティション (今月から)
+INITIAL_PARTITION_MONTHS = 3
+
+
+def create_initial_partitions(schema_editor, months_ahead):
+    """
+    今月から months_ahead か月先までの月のパーティションを作成する
+    (このマイグレーションを作成した時点の quiz.partitions のテーブル名と範囲。quiz.partitions が後で変わっても結果は変わらない)
+    """
+    tz = timezone.get_current_timezone()
+    today = timezone.localtime().date()
+    current = today.year * 12 + today.month - 1  # 0年1月からの月数
+
+    def month_start(index):
+        return datetime.datetime(index // 12, index % 12 + 1, 1, tzinfo=tz)
+
+    for offset in range(months_ahead + 1):
+        start, end = month_start(current + offset), month_start(current + offset + 1)
+        schema_editor.execute(
+            f'CREATE TABLE quiz_answerlog_p{start.year:04d}_{start.month:02d}'
+            ' PARTITION OF quiz_answerlog FOR VALUES FROM (%s) TO (%s)',
+            [start, end],
+        )
+
+
+def create_answer_log(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        schema_editor.create_model(apps.get_model('quiz', 'AnswerLog'))
+        return
+
+    user_table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    schema_editor.execute(f'''
+        CREATE TABLE quiz_answerlog (
+            id bigint GENERATED BY DEFAULT AS IDENTITY,
+            user_id integer NOT NULL REFERENCES {user_table} (id) DEFERRABLE INITIALLY DEFERRED,
+            question_id bigint NOT NULL,
+            selected_answer varchar(1) NOT NULL,
+            is_correct boolean NOT NULL,
+            answered_at timestamp with time zone NOT NULL,
+            PRIMARY KEY (id, answered_at)
+        ) PARTITION BY RANGE (answered_at)
+    ''')
+    schema_editor.execute('CREATE INDEX answerlog_user_answered_idx ON quiz_answerlog (user_id, answered_at)')
+    # どの月のパーティションにも入らない行の受け皿
+    schema_editor.execute('CREATE TABLE quiz_answerlog_default PARTITION OF quiz_answerlog DEFAULT')
+    create_initial_partitions(schema_editor, INITIAL_PARTITION_MONTHS - 1)
+
+
+def drop_answer_log(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.delete_model(apps.get_model('quiz', 'AnswerLog'))
+        return
+    # パーティション (切り離していないもの) も一緒に削除される
+    schema_editor.execute('DROP TABLE quiz_answerlog')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0009_leaderboardentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='対象月')),
+                ('rows', models.PositiveBigIntegerField(default=0, verbose_name='件数')),
+                ('rolled_up_at', models.DateTimeField(blank=True, null=True, verbose_name='集約日時')),
+                ('exported_to', models.CharField(blank=True, max_length=500, verbose_name='書き出し先')),
+                ('detached_at', models.DateTimeField(blank=True, null=True, verbose_name='切り離し日時')),
+            ],
+            options={
+                'verbose_name': '解答ログのアーカイブ',
+                'verbose_name_plural': '解答ログのアーカイブ一覧',
+                'ordering': ['month'],
+            },
+        ),
+        # テーブルは次の RunPython で作る。PostgreSQL では answered_at の範囲で分割したパーティションテーブルにする
+        # (パーティションの主キーには分割キーが必要なため、主キーは (id, answered_at) になる)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='AnswerLog',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('selected_answer', models.CharField(choices=[('A', 'A'), ('B', 'B'), ('C', 'C'), ('D', 'D')], max_length=1, verbose_name='ユーザーの選択')),
+                        ('is_correct', models.BooleanField(default=False, verbose_name='正解フラグ')),
+                        ('answered_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='解答日時')),
+                        ('question', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='quiz.question', verbose_name='対象問題')),
+                        ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='解答者')),
+                    ],
+                    options={
+                        'verbose_name': '解答ログ',
+                        'verbose_name_plural': '解答ログ一覧',
+                        'indexes': [models.Index(fields=['user', 'answered_at'], name='answerlog_user_answered_idx')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_answer_log, drop_answer_log),
+        migrations.CreateModel(
+            name='AnswerRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='解答回数')),
+                ('correct', models.PositiveIntegerField(default=0, verbose_name='正解回数')),
+                ('first_answered_at', models.DateTimeField(verbose_name='最初の解答日時')),
+                ('last_answered_at', models.DateTimeField(verbose_name='最後の解答日時')),
+                ('question', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='quiz.question', verbose_name='対象問題')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='解答者')),
+            ],
+            options={
+                'verbose_name': '解答ログの集計',
+                'verbose_name_plural': '解答ログの集計一覧',
+                'constraints': [models.UniqueConstraint(fields=('user', 'question'), name='unique_rollup_user_question')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0010_answer_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='result',
+            name='answered_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='解答日時'),
+        ),
+        migrations.CreateModel(
+            name='SubmissionReceipt',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False, verbose_name='送信ID')),
+                ('submitted_at', models.DateTimeField(verbose_name='送信日時')),
+                ('applied_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='保存日時')),
+                ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL, verbose_name='解答者')),
+            ],
+            options={
+                'verbose_name': '解答送信の保存記録',
+                'verbose_name_plural': '解答送信の保存記録一覧',
+                'indexes': [models.Index(fields=['applied_at'], name='receipt_applied_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0011_submission_spool'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='discrimination',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='識別力'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0012_question_discrimination'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Passage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(blank=True, max_length=255, verbose_name='タイトル')),
+                ('passage_text', models.TextField(verbose_name='本文')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('content_hash', models.CharField(editable=False, max_length=64, unique=True, verbose_name='内容ハッシュ')),
+            ],
+            options={
+                'verbose_name': '長文',
+                'verbose_name_plural': '長文一覧',
+            },
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='passage',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='questions', to='quiz.passage', verbose_name='長文'),
+        ),
+    ]
@@ -1,5 +1,71 @@
+import hashlib
+import re
+import unicodedata
+
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+def question_content_hash(question_text, passage_id=None):
+    """
+    問題文を正規化 (NFKC・前後の空白除去・連続する空白を1つに) した上で SHA-256 を返す
+    (インポート時の重複チェックのキーとして使う)
+    長文 (Passage) の設問は、別の長文の同じ問題文と区別するため長文のIDも含める
+    """
+    normalized = re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', question_text)).strip()
+    if passage_id is not None:
+        normalized = f'{passage_id}:{normalized}'
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class Passage(models.Model):
+    """
+    Part 7 などで複数の設問 (2〜5問) が共有する長文
+    (各設問の question_text に長文をコピーせず、Question.passage から参照する)
+    """
+    title = models.CharField(max_length=255, blank=True, verbose_name="タイトル")
+    passage_text = models.TextField(verbose_name="本文")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    # 正規化した本文のハッシュ (インポート時に同じ長文を重複して作らないため、save() で自動設定)
+    content_hash = models.CharField(max_length=64, unique=True, editable=False, verbose_name="内容ハッシュ")
+
+    def validate_unique(self, exclude=None):
+        """
+        content_hash はフォームに無いので、本文が同じ長文があればフォームのエラーにする
+        (save() まで進むとユニーク制約違反の IntegrityError になる)
+        """
+        super().validate_unique(exclude=exclude)
+        if exclude and 'passage_text' in exclude:
+            return
+        duplicate = (
+            Passage.objects.filter(content_hash=question_content_hash(self.passage_text))
+            .exclude(pk=self.pk).values_list('pk', flat=True).first()
+        )
+        if duplicate is not None:
+            raise ValidationError({'passage_text': ValidationError(
+                '同じ本文の長文が既に登録されています (ID: %(id)s)。', code='unique', params={'id': duplicate},
+            )})
+
+    def save(self, *args, **kwargs):
+        self.content_hash = question_content_hash(self.passage_text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'passage_text' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'content_hash'}
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        # 一覧では本文を読み込まないので、本文は使わない
+        return f"{self.title or '長文'} (ID: {self.id})"
+
+    class Meta:
+        verbose_name = "長文"
+        verbose_name_plural = "長文一覧"
+
 
 class Question(models.Model):
     """
@@ -22,6 +88,10 @@ class Question(models.Model):
 
     # 問題文 (長文の可能性も考慮し TextField)
     question_text = models.TextField(verbose_name="問題文")
+    # 複数の設問で共有する長文 (Part 7 など。長文を使わない問題は None)
+    passage = models.ForeignKey(
+        Passage, on_delete=models.PROTECT, null=True, blank=True, related_name='questions', verbose_name="長文"
+    )
 
     # 選択肢
     option_a = models.CharField(max_length=255, verbose_name="選択肢 A")
@@ -36,10 +106,39 @@ class Question(models.Model):
     # 問題の属性
     part = models.CharField(max_length=5, choices=PART_CHOICES, default='PART5', verbose_name="パート")
     difficulty_level = models.IntegerField(default=600, verbose_name="難易度レベル (目安スコア)")
+    # 解答履歴から推定した識別力 (manage.py calibrate_questions で設定。未推定なら None)
+    discrimination = models.FloatField(null=True, blank=True, editable=False, verbose_name="識別力")
 
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
 
+    # 正規化した問題文のハッシュ (重複チェック用、save() で自動設定)
+    content_hash = models.CharField(max_length=64, unique=True, null=True, editable=False, verbose_name="内容ハッシュ")
+
+    def validate_unique(self, exclude=None):
+        """
+        content_hash はフォームに無いので、同じ問題文 (同じ長文の設問) があればフォームのエラーにする
+        (save() まで進むとユニーク制約違反の IntegrityError になる)
+        """
+        super().validate_unique(exclude=exclude)
+        if exclude and 'question_text' in exclude:
+            return
+        duplicate = (
+            Question.objects.filter(content_hash=question_content_hash(self.question_text, self.passage_id))
+            .exclude(pk=self.pk).values_list('pk', flat=True).first()
+        )
+        if duplicate is not None:
+            raise ValidationError({'question_text': ValidationError(
+                '同じ問題文の問題が既に登録されています (ID: %(id)s)。', code='unique', params={'id': duplicate},
+            )})
+
+    def save(self, *args, **kwargs):
+        self.content_hash = question_content_hash(self.question_text, self.passage_id)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'question_text', 'passage'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'content_hash'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         # 管理画面などで見やすくするための設定
         return f"{self.part} (ID: {self.id}) - {self.question_text[:20]}..."
@@ -49,6 +148,13 @@ class Question(models.Model):
         verbose_name = "問題"
         verbose_name_plural = "問題一覧"
 
+        indexes = [
+            # パート + 難易度での絞り込み (クイズ抽出・管理画面の list_filter)
+            models.Index(fields=['part', 'difficulty_level'], name='question_part_difficulty_idx'),
+            # 難易度のみでの絞り込み・並び替え
+            models.Index(fields=['difficulty_level'], name='question_difficulty_idx'),
+        ]
+
 
 class Result(models.Model):
     """
@@ -58,12 +164,14 @@ class Result(models.Model):
     # 1. ユーザーとの連携 (ForeignKey)
     # どのユーザーが答えたか？
     # Userモデルが削除されたら、この解答履歴も一緒に削除する (CASCADE)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="解答者")
+    # (user 単体のインデックスは unique_user_question と result_user_answered_idx で代用できるため作らない)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name="解答者")
     
     # 2. 問題との連携 (ForeignKey)
     # どの問題に答えたか？
     # Questionモデルが削除されたら、この解答履歴も一緒に削除する (CASCADE)
-    question = models.ForeignKey(Question, on_delete=models.CASCADE, verbose_name="対象問題")
+    # (question 単体のインデックスは result_question_correct_idx で代用できるため作らない)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, db_index=False, verbose_name="対象問題")
     
     # 3. ユーザーの選択
     selected_answer = models.CharField(max_length=1, choices=Question.ANSWER_CHOICES, verbose_name="ユーザーの選択")
@@ -71,10 +179,11 @@ class Result(models.Model):
     # 4. 正誤判定
     is_correct = models.BooleanField(default=False, verbose_name="正解フラグ")
     
-    answered_at = models.DateTimeField(auto_now_add=True, verbose_name="解答日時")
+    # 書き込みを遅らせる場合 (quiz.spool) に送信時の日時を残せるよう、auto_now_add ではなく default にする
+    answered_at = models.DateTimeField(default=timezone.now, editable=False, verbose_name="解答日時")
 
     def __str__(self):
-        return f"{self.user.username} -> {self.question.id} (正解: {self.is_correct})"
+        return f"{self.user.username} -> {self.question_id} (正解: {self.is_correct})"
 
     class Meta:
         verbose_name = "解答履歴"
@@ -83,4 +192,245 @@ class Result(models.Model):
         # (推奨) 1ユーザーが1問題に1回だけ答えられるように制約
         constraints = [
             models.UniqueConstraint(fields=['user', 'question'], name='unique_user_question')
-        ]
\ No newline at end of file
+        ]
+
+        indexes = [
+            # ユーザーごとの解答履歴を新しい順に取得
+            models.Index(fields=['user', '-answered_at'], name='result_user_answered_idx'),
+            # 問題ごとの正答率の集計
+            models.Index(fields=['question', 'is_correct'], name='result_question_correct_idx'),
+            # 解答日時での絞り込み (管理画面の list_filter)
+            models.Index(fields=['answered_at'], name='result_answered_at_idx'),
+        ]
+
+class UserAbility(models.Model):
+    """
+    ユーザーの推定能力値 (Elo レーティング、TOEIC の目安スコアと同じ尺度)
+    解答送信のたびに更新し、適応型クイズの出題に使う
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, verbose_name="ユーザー")
+    rating = models.FloatField(default=600, verbose_name="推定能力値")
+    answered_count = models.PositiveIntegerField(default=0, verbose_name="解答数")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    def __str__(self):
+        return f"{self.user.username} ({self.rating:.0f})"
+
+    class Meta:
+        verbose_name = "推定能力値"
+        verbose_name_plural = "推定能力値一覧"
+
+
+# 難易度帯 (キー, 表示名, 下限, 上限) 下限は含み、上限は含まない
+DIFFICULTY_BANDS = (
+    ('basic', '〜495', None, 500),
+    ('intermediate', '500〜695', 500, 700),
+    ('advanced', '700〜845', 700, 850),
+    ('expert', '850〜', 850, None),
+)
+
+
+def difficulty_band(difficulty_level):
+    """
+    難易度レベルが属する難易度帯のキーを返す
+    """
+    for key, _, lower, upper in DIFFICULTY_BANDS:
+        if (lower is None or difficulty_level >= lower) and (upper is None or difficulty_level < upper):
+            return key
+    return DIFFICULTY_BANDS[-1][0]
+
+
+class UserStats(models.Model):
+    """
+    ユーザーごとの成績の集計 (Result の内容と一致するように解答送信時に差分で更新する)
+    パート別・難易度帯別の件数は F() で加算できるよう、それぞれ列として持つ
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, verbose_name="ユーザー")
+
+    # 全体 (Result の件数 = 解答した問題数)
+    total_answered = models.PositiveIntegerField(default=0, verbose_name="解答数")
+    total_correct = models.PositiveIntegerField(default=0, verbose_name="正解数")
+
+    # パート別
+    part5_answered = models.PositiveIntegerField(default=0, verbose_name="Part 5 解答数")
+    part5_correct = models.PositiveIntegerField(default=0, verbose_name="Part 5 正解数")
+    part7_answered = models.PositiveIntegerField(default=0, verbose_name="Part 7 解答数")
+    part7_correct = models.PositiveIntegerField(default=0, verbose_name="Part 7 正解数")
+
+    # 難易度帯別 (DIFFICULTY_BANDS)
+    basic_answered = models.PositiveIntegerField(default=0, verbose_name="〜495 解答数")
+    basic_correct = models.PositiveIntegerField(default=0, verbose_name="〜495 正解数")
+    intermediate_answered = models.PositiveIntegerField(default=0, verbose_name="500〜695 解答数")
+    intermediate_correct = models.PositiveIntegerField(default=0, verbose_name="500〜695 正解数")
+    advanced_answered = models.PositiveIntegerField(default=0, verbose_name="700〜845 解答数")
+    advanced_correct = models.PositiveIntegerField(default=0, verbose_name="700〜845 正解数")
+    expert_answered = models.PositiveIntegerField(default=0, verbose_name="850〜 解答数")
+    expert_correct = models.PositiveIntegerField(default=0, verbose_name="850〜 正解数")
+
+    # 連続学習日数
+    current_streak = models.PositiveIntegerField(default=0, verbose_name="連続学習日数")
+    longest_streak = models.PositiveIntegerField(default=0, verbose_name="最長連続学習日数")
+    last_active_date = models.DateField(null=True, blank=True, verbose_name="最終学習日")
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    def __str__(self):
+        return f"{self.user.username} ({self.total_correct}/{self.total_answered})"
+
+    class Meta:
+        verbose_name = "成績集計"
+        verbose_name_plural = "成績集計一覧"
+
+
+class ReviewItem(models.Model):
+    """
+    (ユーザー, 問題) ごとの復習スケジュール (SM-2)
+    解答送信のたびに更新し、next_due が過ぎたものを復習クイズで出題する
+    """
+    # (user 単体のインデックスは unique_review_user_question と review_user_due_idx で代用できるため作らない)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name="ユーザー")
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, verbose_name="対象問題")
+
+    ease = models.FloatField(default=2.5, verbose_name="易しさ係数")
+    interval = models.PositiveIntegerField(default=0, verbose_name="復習間隔 (日)")
+    repetitions = models.PositiveIntegerField(default=0, verbose_name="連続正解回数")
+    next_due = models.DateTimeField(verbose_name="次回の復習日時")
+    last_reviewed_at = models.DateTimeField(verbose_name="最終解答日時")
+
+    def __str__(self):
+        return f"{self.user.username} -> {self.question_id} ({self.next_due:%Y-%m-%d %H:%M})"
+
+    class Meta:
+        verbose_name = "復習スケジュール"
+        verbose_name_plural = "復習スケジュール一覧"
+
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'], name='unique_review_user_question')
+        ]
+        indexes = [
+            # 復習期限が来た問題を期限の古い順に引く (インデックスの範囲検索だけで済む)
+            models.Index(fields=['user', 'next_due'], name='review_user_due_idx'),
+        ]
+
+
+class LeaderboardEntry(models.Model):
+    """
+    ランキング (全期間・ISO週ごと) のユーザー別スコア
+    解答送信時に差分で更新し、ランキングの取得では board ごとに全件をスナップショットに読み込む (quiz.leaderboard)
+    """
+    # 'global' (全期間) か ISO週 ('2026-W42')
+    board = models.CharField(max_length=10, verbose_name="ランキング")
+    # (user 単体のインデックスは削除時の CASCADE でしか使わないため作らない)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name="ユーザー")
+    correct = models.PositiveIntegerField(default=0, verbose_name="正解数")
+    answered = models.PositiveIntegerField(default=0, verbose_name="解答数")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    def __str__(self):
+        return f"{self.board}: {self.user.username} ({self.correct}/{self.answered})"
+
+    class Meta:
+        verbose_name = "ランキング"
+        verbose_name_plural = "ランキング一覧"
+
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'user'], name='unique_leaderboard_board_user')
+        ]
+
+
+class AnswerLog(models.Model):
+    """
+    解き直しも含めたすべての解答の履歴 (追記のみ。Result は (ユーザー, 問題) ごとの最新の解答だけを持つ)
+    PostgreSQL では answered_at による月ごとのパーティションテーブルにする (quiz.partitions)
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name="解答者")
+    # 問題を削除しても履歴は残す (外部キー制約と question 単体のインデックスは作らない)
+    question = models.ForeignKey(
+        Question, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, verbose_name="対象問題"
+    )
+    selected_answer = models.CharField(max_length=1, choices=Question.ANSWER_CHOICES, verbose_name="ユーザーの選択")
+    is_correct = models.BooleanField(default=False, verbose_name="正解フラグ")
+    answered_at = models.DateTimeField(default=timezone.now, verbose_name="解答日時")
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.question_id} ({self.answered_at:%Y-%m-%d %H:%M})"
+
+    class Meta:
+        verbose_name = "解答ログ"
+        verbose_name_plural = "解答ログ一覧"
+
+        indexes = [
+            # ユーザーの最近の解答を引く (パーティションごとに作られ、古い月のパーティションは読まれない)
+            models.Index(fields=['user', 'answered_at'], name='answerlog_user_answered_idx'),
+        ]
+
+
+class AnswerRollup(models.Model):
+    """
+    集約済みの月の AnswerLog を (ユーザー, 問題) ごとにまとめた件数 (manage.py archive_answers で加算する)
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name="解答者")
+    question = models.ForeignKey(
+        Question, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, verbose_name="対象問題"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="解答回数")
+    correct = models.PositiveIntegerField(default=0, verbose_name="正解回数")
+    first_answered_at = models.DateTimeField(verbose_name="最初の解答日時")
+    last_answered_at = models.DateTimeField(verbose_name="最後の解答日時")
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.question_id} ({self.correct}/{self.attempts})"
+
+    class Meta:
+        verbose_name = "解答ログの集計"
+        verbose_name_plural = "解答ログの集計一覧"
+
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'], name='unique_rollup_user_question')
+        ]
+
+
+class AnswerArchive(models.Model):
+    """
+    AnswerLog の月ごとの集約・書き出し・切り離しの状況 (同じ月を二重に集約しないための記録)
+    """
+    month = models.DateField(unique=True, verbose_name="対象月")  # 月の1日
+    rows = models.PositiveBigIntegerField(default=0, verbose_name="件数")
+    rolled_up_at = models.DateTimeField(null=True, blank=True, verbose_name="集約日時")
+    exported_to = models.CharField(max_length=500, blank=True, verbose_name="書き出し先")
+    detached_at = models.DateTimeField(null=True, blank=True, verbose_name="切り離し日時")
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} ({self.rows} 件)"
+
+    class Meta:
+        verbose_name = "解答ログのアーカイブ"
+        verbose_name_plural = "解答ログのアーカイブ一覧"
+        ordering = ['month']
+
+
+class SubmissionReceipt(models.Model):
+    """
+    スプール (quiz.spool) から保存した解答送信の記録
+    同じ送信を2回保存しないために使う (再送・再実行しても結果が変わらない)
+    """
+    id = models.UUIDField(primary_key=True, editable=False, verbose_name="送信ID")
+    # 退会したユーザーの記録も期限まで残す (外部キー制約は作らない)
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, verbose_name="解答者"
+    )
+    submitted_at = models.DateTimeField(verbose_name="送信日時")
+    # 同じトランザクションで保存したものは同じ日時になる
+    applied_at = models.DateTimeField(default=timezone.now, verbose_name="保存日時")
+
+    def __str__(self):
+        return f"{self.id} ({self.user_id})"
+
+    class Meta:
+        verbose_name = "解答送信の保存記録"
+        verbose_name_plural = "解答送信の保存記録一覧"
+
+        indexes = [
+            # 古い記録の削除 (manage.py drain_submissions --prune-days)
+            models.Index(fields=['applied_at'], name='receipt_applied_at_idx'),
+        ]
@@ -0,0 +1,234 @@
+import gzip
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .bank import RefreshingSnapshot
+from .models import Passage, Question
+
+try:
+    import brotli
+except ImportError:  # brotli は任意 (無ければ gzip だけで配信する)
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# パートを指定しない場合 (問題バンク全体) のシャードのキー
+ALL_PARTS = None
+
+# 問題パックに含める列 (正解・解説は含めない。採点は従来どおり /api/quiz/submit/ で行う)
+# passage は長文のID (長文の本文はパックの passages に1回だけ含める)
+PACK_FIELDS = ['id', 'passage', 'question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'part', 'difficulty_level']
+# 長文の列 (PassageSerializer と同じ)
+PASSAGE_FIELDS = ['id', 'title', 'passage_text']
+
+# 差分の基準にするため、過去のバージョンの {'questions': {問題ID: ダイジェスト}, 'passages': {長文ID: ダイジェスト}} を保持するキャッシュキー
+MANIFEST_KEY = 'quiz:pack:manifest:{shard}:{version}'
+
+# プロセス内に保持する差分パックの数 (パックを作り直すと破棄する)
+MAX_DELTAS = 64
+
+_ACCEPTS = {
+    'br': re.compile(r'\bbr\b'),
+    'gzip': re.compile(r'\bgzip\b'),
+}
+
+
+def _compact(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _shard_name(part):
+    return part or 'all'
+
+
+def _digest(item):
+    return hashlib.blake2b(item, digest_size=8).digest()
+
+
+class _Encoded:
+    """
+    圧縮済みのパック (gzip は必ず、brotli はライブラリがある場合のみ)
+    """
+    __slots__ = ('version', 'gzip', 'br')
+
+    def __init__(self, version, body, level=9):
+        self.version = version
+        self.gzip = gzip.compress(body, compresslevel=level, mtime=0)
+        self.br = brotli.compress(body) if brotli is not None else None
+
+    def body(self, accept_encoding=''):
+        """
+        Accept-Encoding に合わせて (本文, Content-Encoding) を返す
+        """
+        if self.br is not None and _ACCEPTS['br'].search(accept_encoding):
+            return self.br, 'br'
+        if _ACCEPTS['gzip'].search(accept_encoding):
+            return self.gzip, 'gzip'
+        # 圧縮を受け付けないクライアントはまれなので、その都度展開する
+        return gzip.decompress(self.gzip), None
+
+
+class _Shard:
+    """
+    1シャード (問題バンク全体か1パート) 分のパック
+    version は問題と長文の内容のハッシュなので、どのプロセスで作っても同じ内容なら同じになる
+    (長文は、シャード内の問題から参照されているものだけを含める)
+    """
+    __slots__ = ('part', 'items', 'digests', 'passages', 'passage_digests', 'version', 'full')
+
+    def __init__(self, part):
+        self.part = part
+        self.items = {}
+        self.digests = {}
+        self.passages = {}
+        self.passage_digests = {}
+
+    def add(self, question_id, item):
+        self.items[question_id] = item
+        self.digests[question_id] = _digest(item)
+
+    def add_passage(self, passage_id, item):
+        if passage_id not in self.passages:
+            self.passages[passage_id] = item
+            self.passage_digests[passage_id] = _digest(item)
+
+    def manifest(self):
+        return {'questions': self.digests, 'passages': self.passage_digests}
+
+    def finish(self):
+        hasher = hashlib.sha256()
+        for question_id in sorted(self.digests):
+            hasher.update(self.digests[question_id])
+        # 長文の変更でもバージョン (ETag) が変わるようにする
+        hasher.update(b'|passages|')
+        for passage_id in sorted(self.passage_digests):
+            hasher.update(self.passage_digests[passage_id])
+        self.version = hasher.hexdigest()[:20]
+        body = b''.join([
+            b'{"version":', _compact(self.version),
+            b',"part":', _compact(self.part),
+            b',"count":', str(len(self.items)).encode(),
+            b',"questions":[', b','.join(self.items.values()), b']',
+            b',"passages":[', b','.join(self.passages[key] for key in sorted(self.passages)), b']}',
+        ])
+        self.full = _Encoded(self.version, body)
+
+
+class QuestionPacks(RefreshingSnapshot):
+    """
+    オフライン用の問題パック (問題バンク全体・パートごと) を作成して保持するクラス
+
+    QuestionSampler と同様に、問題バンクのバージョン (quiz.bank) が変わるか、
+    QUIZ_PACK_MAX_AGE 秒が経過したら作り直す。作り直しても内容が同じならバージョン (ETag) は変わらない。
+    各問題のダイジェストをキャッシュに残しておき、?since=<以前のバージョン> には変更分だけを返す。
+    """
+
+    max_age_setting = 'QUIZ_PACK_MAX_AGE'
+    default_max_age = 600
+
+    def __init__(self, max_age=None):
+        super().__init__(max_age)
+        self._deltas = {}
+
+    @property
+    def manifest_ttl(self):
+        return getattr(settings, 'QUIZ_PACK_DELTA_TTL', 7 * 24 * 3600)
+
+    def _build(self):
+        # 問題の無いパートも空のパックとして返す
+        shards = {key: _Shard(key) for key in (ALL_PARTS, *dict(Question.PART_CHOICES))}
+        # 長文は Part 7 の一部の問題だけが参照するので、件数は問題よりずっと少ない
+        passages = {
+            row[0]: _compact(dict(zip(PASSAGE_FIELDS, row)))
+            for row in Passage.objects.filter(questions__isnull=False).distinct().values_list(*PASSAGE_FIELDS)
+        }
+        rows = Question.objects.order_by('id').values_list(*PACK_FIELDS).iterator(chunk_size=10000)
+        passage_index = PACK_FIELDS.index('passage')
+        for row in rows:
+            item = _compact(dict(zip(PACK_FIELDS, row)))
+            passage_id = row[passage_index]
+            for key in (ALL_PARTS, row[PACK_FIELDS.index('part')]):
+                shard = shards.get(key)
+                if shard is None:
+                    shard = shards[key] = _Shard(key)
+                shard.add(row[0], item)
+                if passage_id is not None and passage_id in passages:
+                    shard.add_passage(passage_id, passages[passage_id])
+
+        for key, shard in shards.items():
+            old = self._data.get(key)
+            if old is not None and old.manifest() == shard.manifest():
+                # 内容が同じなら圧縮し直さない
+                shard = shards[key] = old
+            else:
+                shard.finish()
+            # 期限切れにならないよう、現在のバージョンのダイジェストは作り直すたびに保存し直す
+            cache.set(
+                MANIFEST_KEY.format(shard=_shard_name(key), version=shard.version),
+                shard.manifest(), self.manifest_ttl,
+            )
+        return shards
+
+    def _rebuild(self, version):
+        # 送信中のレスポンスは古いパックを使い続ける (差分は新しいパックから作り直す)
+        super()._rebuild(version)
+        self._deltas = {}
+
+    def get(self, part=ALL_PARTS, since=None):
+        """
+        パック (_Encoded) を返す。該当するパートの問題が無ければ None
+        since に以前のバージョンを指定すると、そこからの差分
+        ({"version", "base", "part", "questions": [追加・変更された問題], "deleted": [問題ID],
+        "passages": [追加・変更された長文], "deleted_passages": [長文ID]}) を返す
+        (since のダイジェストが残っていなければ全件のパックを返す)
+        """
+        shard = self._ensure_fresh().get(part)
+        if shard is None:
+            return None
+        if since is None:
+            return shard.full
+        return self._delta(shard, since) or shard.full
+
+    def _delta(self, shard, since):
+        key = (shard.part, since)
+        delta = self._deltas.get(key)
+        if delta is not None and delta.version == shard.version:
+            return delta
+        manifest = cache.get(MANIFEST_KEY.format(shard=_shard_name(shard.part), version=since))
+        if manifest is None or 'questions' not in manifest:
+            # 長文を含める前の形式のダイジェストは使わない (全件を返す)
+            return None
+        base, base_passages = manifest['questions'], manifest['passages']
+
+        changed = [
+            item for question_id, item in shard.items.items()
+            if base.get(question_id) != shard.digests[question_id]
+        ]
+        deleted = sorted(question_id for question_id in base if question_id not in shard.digests)
+        changed_passages = [
+            shard.passages[passage_id] for passage_id in sorted(shard.passages)
+            if base_passages.get(passage_id) != shard.passage_digests[passage_id]
+        ]
+        deleted_passages = sorted(passage_id for passage_id in base_passages if passage_id not in shard.passage_digests)
+        body = b''.join([
+            b'{"version":', _compact(shard.version),
+            b',"base":', _compact(since),
+            b',"part":', _compact(shard.part),
+            b',"questions":[', b','.join(changed), b']',
+            b',"deleted":', _compact(deleted),
+            b',"passages":[', b','.join(changed_passages), b']',
+            b',"deleted_passages":', _compact(deleted_passages), b'}',
+        ])
+        delta = _Encoded(shard.version, body, level=6)
+        if len(self._deltas) >= MAX_DELTAS:
+            self._deltas.clear()
+        self._deltas[key] = delta
+        return delta
+
+
+question_packs = QuestionPacks()
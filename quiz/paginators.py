@@ -0,0 +1,58 @@
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimated_count(queryset):
+    """
+    PostgreSQL の統計情報から queryset の件数の推定値を返す (推定できなければ None)
+
+    絞り込みが無ければ pg_class.reltuples、あれば EXPLAIN の Plan Rows を使う。
+    どちらも COUNT(*) と違いテーブルを読まないので、件数に関係なく一定時間で返る。
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    query = queryset.query
+    if not query.where and not query.distinct and not query.combinator:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # 一度も ANALYZE されていないテーブルは -1 (PostgreSQL 14 以降) か 0
+        if row and row[0] > 0:
+            return row[0]
+        return None
+
+    # QuerySet.explain() の JSON はドライバーによって形が変わるので、カーソルで直接実行する
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    # psycopg は json 型を [{"Plan": ...}] に変換して返す (変換されない場合は文字列)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    if isinstance(plan, list):
+        plan = plan[0]
+    return int(plan['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    件数の推定値が ADMIN_ESTIMATED_COUNT_THRESHOLD 件以上なら、正確な COUNT(*) の代わりに推定値を使うページネーター
+    (大きなテーブルの管理画面用。最後のほうのページは空になったり、件数がずれたりすることがある)
+    """
+
+    @cached_property
+    def count(self):
+        threshold = getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000)
+        estimate = estimated_count(self.object_list) if hasattr(self.object_list, 'query') else None
+        if estimate is not None and estimate >= threshold:
+            return estimate
+        return super().count
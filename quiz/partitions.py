@@ -0,0 +1,250 @@
+import csv
+import datetime
+import gzip
+import re
+from pathlib import Path
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .models import AnswerArchive, AnswerLog
+
+TABLE = 'quiz_answerlog'
+DEFAULT_PARTITION = f'{TABLE}_default'
+EXPORT_FIELDS = ['id', 'user_id', 'question_id', 'selected_answer', 'is_correct', 'answered_at']
+
+_PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(value):
+    """
+    日時・日付が属する月の1日 (日時はローカル時刻で判定する)
+    """
+    if isinstance(value, datetime.datetime):
+        value = timezone.localtime(value).date()
+    return value.replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(month):
+    """
+    月の [開始, 終了) の aware な日時 (パーティションの範囲・検索条件に使う)
+    """
+    tz = timezone.get_current_timezone()
+    start = datetime.datetime.combine(month, datetime.time(), tzinfo=tz)
+    end = datetime.datetime.combine(add_months(month, 1), datetime.time(), tzinfo=tz)
+    return start, end
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month.year:04d}_{month.month:02d}'
+
+
+def is_partitioned(using=DEFAULT_DB_ALIAS):
+    """
+    AnswerLog がパーティションテーブルなら True (PostgreSQL の場合)
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return bool(row and row[0] == 'p')
+
+
+def attached_partitions(using=DEFAULT_DB_ALIAS):
+    """
+    接続中の月のパーティションの {月の1日: テーブル名}
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits"
+            " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+            " WHERE pg_inherits.inhparent = to_regclass(%s)",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime.date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def ensure_partitions(months_ahead=2, now=None, using=DEFAULT_DB_ALIAS):
+    """
+    今月から months_ahead か月先までの月のパーティションを作成し、作成したテーブル名のリストを返す
+
+    DEFAULT パーティションに既にその月の行があると、そのままでは作成できないため、
+    空のテーブルに行を移してから ATTACH する (同じトランザクション内で行う)。
+    """
+    if not is_partitioned(using):
+        return []
+    connection = connections[using]
+    existing = attached_partitions(using)
+    current = month_start(now or timezone.now())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month in existing:
+            continue
+        name = partition_name(month)
+        start, end = month_range(month)
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE answered_at >= %s AND answered_at < %s'
+                f' RETURNING *) INSERT INTO {name} SELECT * FROM moved',
+                [start, end],
+            )
+            cursor.execute(
+                f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+                [start, end],
+            )
+        created.append(name)
+    return created
+
+
+def record_answer_log(results):
+    """
+    保存した Result を AnswerLog に1回の INSERT で追記する (呼び出し側のトランザクション内で実行すること)
+    """
+    # 1回の送信内の同じ問題への重複した解答は最後のものだけが保存される (Result と同じ)
+    # (スプールからまとめて保存する場合、別々の送信は解答日時で区別してすべて残す)
+    latest = {(result.user_id, result.question_id, result.answered_at): result for result in results}
+    AnswerLog.objects.bulk_create([
+        AnswerLog(
+            user_id=result.user_id,
+            question_id=result.question_id,
+            selected_answer=result.selected_answer,
+            is_correct=result.is_correct,
+            answered_at=result.answered_at or timezone.now(),
+        )
+        for result in latest.values()
+    ])
+
+
+def closed_months(keep_months, now=None, using=DEFAULT_DB_ALIAS):
+    """
+    直近 keep_months か月 (今月を含む) より前で、AnswerLog に行が残っている月のリスト
+    (PostgreSQL ではパーティションの一覧から求め、テーブルを走査しない)
+    """
+    cutoff = add_months(month_start(now or timezone.now()), -(keep_months - 1))
+    if is_partitioned(using):
+        months = set(attached_partitions(using))
+        # DEFAULT パーティションに入った古い行 (パーティション作成前の解答) も対象にする
+        start, _ = month_range(cutoff)
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT DISTINCT date_trunc('month', answered_at AT TIME ZONE %s)::date"
+                f' FROM {DEFAULT_PARTITION} WHERE answered_at < %s',
+                [timezone.get_current_timezone_name(), start],
+            )
+            months.update(row[0] for row in cursor.fetchall())
+    else:
+        months = set(AnswerLog.objects.using(using).dates('answered_at', 'month'))
+    return sorted(month for month in months if month < cutoff)
+
+
+def rollup_month(month, using=DEFAULT_DB_ALIAS):
+    """
+    1か月分の AnswerLog を (ユーザー, 問題) ごとに集計して AnswerRollup に加算し、AnswerArchive に記録する
+    (INSERT ... SELECT ... ON CONFLICT の1文で、データベースの外に行を読み出さない)
+    既に集約済みの月なら何もせず False を返す
+    """
+    connection = connections[using]
+    start, end = month_range(month)
+    least, greatest = ('LEAST', 'GREATEST') if connection.vendor == 'postgresql' else ('MIN', 'MAX')
+    with transaction.atomic(using=using):
+        archive, _ = AnswerArchive.objects.using(using).select_for_update().get_or_create(month=month)
+        if archive.rolled_up_at is not None:
+            return False
+        with connection.cursor() as cursor:
+            # WHERE true は SQLite で INSERT ... SELECT と ON CONFLICT を併用する場合に必要
+            cursor.execute(
+                f'''
+                INSERT INTO quiz_answerrollup
+                    (user_id, question_id, attempts, correct, first_answered_at, last_answered_at)
+                SELECT user_id, question_id, COUNT(*), SUM(CASE WHEN is_correct THEN 1 ELSE 0 END),
+                       MIN(answered_at), MAX(answered_at)
+                FROM {TABLE}
+                WHERE answered_at >= %s AND answered_at < %s AND true
+                GROUP BY user_id, question_id
+                ON CONFLICT (user_id, question_id) DO UPDATE SET
+                    attempts = quiz_answerrollup.attempts + excluded.attempts,
+                    correct = quiz_answerrollup.correct + excluded.correct,
+                    first_answered_at = {least}(quiz_answerrollup.first_answered_at, excluded.first_answered_at),
+                    last_answered_at = {greatest}(quiz_answerrollup.last_answered_at, excluded.last_answered_at)
+                ''',
+                [connection.ops.adapt_datetimefield_value(value) for value in (start, end)],
+            )
+        archive.rows = AnswerLog.objects.using(using).filter(answered_at__gte=start, answered_at__lt=end).count()
+        archive.rolled_up_at = timezone.now()
+        archive.save(update_fields=['rows', 'rolled_up_at'])
+    return True
+
+
+def export_month(month, directory, using=DEFAULT_DB_ALIAS, chunk_size=10000):
+    """
+    1か月分の AnswerLog を gzip 圧縮した CSV (answerlog-2026-09.csv.gz) に書き出し、そのパスを返す
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'answerlog-{month:%Y-%m}.csv.gz'
+    temporary = directory / f'.{path.name}.tmp'
+    start, end = month_range(month)
+    rows = (
+        AnswerLog.objects.using(using)
+        .filter(answered_at__gte=start, answered_at__lt=end)
+        .order_by()
+        .values_list(*EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    with gzip.open(temporary, 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            writer.writerow([*row[:5], row[5].isoformat()])
+    # 書き出しが終わってから置き換える (途中で止まっても不完全なファイルを残さない)
+    temporary.replace(path)
+    AnswerArchive.objects.using(using).filter(month=month).update(exported_to=str(path))
+    return path
+
+
+def detach_month(month, drop=False, using=DEFAULT_DB_ALIAS, batch_size=10000):
+    """
+    集約済みの月の行を AnswerLog から外す
+
+    PostgreSQL ではパーティションを DETACH する (drop=True なら削除する。残したテーブルは pg_dump などで退避できる)。
+    パーティションの無いデータベースや DEFAULT パーティションの行は batch_size 件ずつ DELETE する。
+    """
+    start, end = month_range(month)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        archive = AnswerArchive.objects.using(using).select_for_update().filter(month=month).first()
+        if archive is None or archive.rolled_up_at is None:
+            raise ValueError(f'{month:%Y-%m} はまだ集約されていません。')
+
+        name = attached_partitions(using).get(month) if is_partitioned(using) else None
+        if name is not None:
+            with connection.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+                if drop:
+                    cursor.execute(f'DROP TABLE {name}')
+
+    # 残りの行 (パーティションの無い場合・DEFAULT パーティション) は長いロックを避けて少しずつ削除する
+    queryset = AnswerLog.objects.using(using).filter(answered_at__gte=start, answered_at__lt=end)
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        AnswerLog.objects.using(using).filter(id__in=ids, answered_at__gte=start, answered_at__lt=end).delete()
+
+    AnswerArchive.objects.using(using).filter(month=month).update(detached_at=timezone.now())
+    return name
@@ -0,0 +1,276 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.fields import DateTimeField
+from rest_framework.renderers import JSONRenderer
+
+from .models import Passage, Question
+from .serializers import PassageSerializer, QuestionResultSerializer, QuestionSerializer
+
+# 出題用 (正解・解説なし) と結果表示用 (正解・解説あり) の2種類
+QUIZ_VARIANT = 'quiz'
+RESULT_VARIANT = 'result'
+
+_SERIALIZERS = {
+    QUIZ_VARIANT: QuestionSerializer,
+    RESULT_VARIANT: QuestionResultSerializer,
+}
+
+# DRF の Response と同じ形式 (コンパクト・UTF-8) で出力する
+_renderer = JSONRenderer()
+_datetime_field = DateTimeField()
+
+
+def _cache_key(variant, question_id):
+    return f'quiz:fragment:{variant}:{question_id}'
+
+
+def _passage_cache_key(passage_id):
+    return f'quiz:fragment:passage:{passage_id}'
+
+
+def _questions(variant):
+    # シリアライズに使うフィールドだけを読み込む (出題用では解説などの長いテキストを読まない)
+    # 作成した JSON は共有のキャッシュに入るので、レプリカに振り分けられたリクエストの中でもプライマリから読む
+    # (レプリカの遅れで、無効化した直後の古い内容を作り直してしまわないように)
+    return Question.objects.using(DEFAULT_DB_ALIAS).only(*_SERIALIZERS[variant].Meta.fields)
+
+
+def _passages():
+    # 長文の JSON も同様にプライマリから作る
+    return Passage.objects.using(DEFAULT_DB_ALIAS)
+
+
+def _timeout():
+    # プロセスごとのキャッシュ (LocMem) でも他のワーカーの変更が反映されるよう有効期限を設ける
+    return getattr(settings, 'QUIZ_FRAGMENT_TIMEOUT', 300)
+
+
+def render_question(question, variant):
+    """
+    1問分の JSON (bytes) をシリアライザで作成する
+    """
+    return _renderer.render(_SERIALIZERS[variant](question).data)
+
+
+def _render_missing(missing, loaded, variant):
+    """
+    キャッシュに無かった問題をシリアライズする (削除済みの問題は結果に含めない)
+    """
+    return {
+        question_id: render_question(loaded[question_id], variant)
+        for question_id in missing if question_id in loaded
+    }
+
+
+def get_fragments(question_ids, variant, questions=None):
+    """
+    問題ごとに作成済みの JSON (bytes) を {question_id: bytes} で返す
+    キャッシュに無いものだけを (questions に無ければ in_bulk で取得して) シリアライズする
+    """
+    keys = {_cache_key(variant, question_id): question_id for question_id in question_ids}
+    fragments = {keys[key]: fragment for key, fragment in cache.get_many(keys).items()}
+
+    missing = [question_id for question_id in question_ids if question_id not in fragments]
+    if missing:
+        loaded = dict(questions or {})
+        to_load = [question_id for question_id in missing if question_id not in loaded]
+        if to_load:
+            loaded.update(_questions(variant).in_bulk(to_load))
+        rendered = _render_missing(missing, loaded, variant)
+        cache.set_many(
+            {_cache_key(variant, question_id): fragment for question_id, fragment in rendered.items()},
+            _timeout(),
+        )
+        fragments.update(rendered)
+    return fragments
+
+
+async def aget_fragments(question_ids, variant, questions=None):
+    """
+    get_fragments の非同期版 (キャッシュと ORM の非同期 API を使う)
+    """
+    keys = {_cache_key(variant, question_id): question_id for question_id in question_ids}
+    fragments = {keys[key]: fragment for key, fragment in (await cache.aget_many(keys)).items()}
+
+    missing = [question_id for question_id in question_ids if question_id not in fragments]
+    if missing:
+        loaded = dict(questions or {})
+        to_load = [question_id for question_id in missing if question_id not in loaded]
+        if to_load:
+            loaded.update(await _questions(variant).ain_bulk(to_load))
+        rendered = _render_missing(missing, loaded, variant)
+        await cache.aset_many(
+            {_cache_key(variant, question_id): fragment for question_id, fragment in rendered.items()},
+            _timeout(),
+        )
+        fragments.update(rendered)
+    return fragments
+
+
+def invalidate_fragments(question_ids):
+    """
+    指定した問題のキャッシュを削除する
+    """
+    cache.delete_many([
+        _cache_key(variant, question_id)
+        for question_id in question_ids
+        for variant in _SERIALIZERS
+    ])
+
+
+def invalidate_passage_fragments(passage_ids):
+    """
+    指定した長文のキャッシュを削除する
+    """
+    cache.delete_many([_passage_cache_key(passage_id) for passage_id in passage_ids])
+
+
+def _passage_ids(fragments):
+    """
+    問題の JSON (bytes) から、参照している長文のIDを出現順に重複なしで返す
+    """
+    passage_ids = {}
+    for fragment in fragments:
+        passage_id = json.loads(fragment)['passage']
+        if passage_id is not None:
+            passage_ids[passage_id] = None
+    return list(passage_ids)
+
+
+def _render_passages(passage_ids, loaded):
+    return {
+        passage_id: _renderer.render(PassageSerializer(loaded[passage_id]).data)
+        for passage_id in passage_ids if passage_id in loaded
+    }
+
+
+def get_passage_fragments(passage_ids):
+    """
+    長文ごとに作成済みの JSON (bytes) を、passage_ids の順のリストで返す (キャッシュに無いものだけ取得する)
+    """
+    keys = {_passage_cache_key(passage_id): passage_id for passage_id in passage_ids}
+    fragments = {keys[key]: fragment for key, fragment in cache.get_many(keys).items()}
+    missing = [passage_id for passage_id in passage_ids if passage_id not in fragments]
+    if missing:
+        rendered = _render_passages(missing, _passages().in_bulk(missing))
+        cache.set_many({_passage_cache_key(passage_id): fragment for passage_id, fragment in rendered.items()}, _timeout())
+        fragments.update(rendered)
+    return [fragments[passage_id] for passage_id in passage_ids if passage_id in fragments]
+
+
+async def aget_passage_fragments(passage_ids):
+    """
+    get_passage_fragments の非同期版
+    """
+    keys = {_passage_cache_key(passage_id): passage_id for passage_id in passage_ids}
+    fragments = {keys[key]: fragment for key, fragment in (await cache.aget_many(keys)).items()}
+    missing = [passage_id for passage_id in passage_ids if passage_id not in fragments]
+    if missing:
+        rendered = _render_passages(missing, await _passages().ain_bulk(missing))
+        await cache.aset_many({_passage_cache_key(passage_id): fragment for passage_id, fragment in rendered.items()}, _timeout())
+        fragments.update(rendered)
+    return [fragments[passage_id] for passage_id in passage_ids if passage_id in fragments]
+
+
+def json_array(fragments):
+    """
+    JSON (bytes) のリストを連結して JSON 配列にする
+    """
+    return b'[' + b','.join(fragments) + b']'
+
+
+def with_passages(key, payload, passages):
+    """
+    {key: payload, "passages": [長文, ...]} の JSON を返す (長文は1回のレスポンスで1回だけ含める)
+    """
+    return b'{"' + key.encode() + b'":' + payload + b',"passages":' + json_array(passages) + b'}'
+
+
+def questions_payload(question_ids, passages=False):
+    """
+    出題用の問題リストの JSON 配列 (QuestionSerializer(many=True) と同じ内容) を返す
+    passages なら {"questions": [...], "passages": [...]} にして、参照している長文も返す
+    """
+    fragments = get_fragments(question_ids, QUIZ_VARIANT)
+    items = [fragments[question_id] for question_id in question_ids if question_id in fragments]
+    if not passages:
+        return json_array(items)
+    return with_passages('questions', json_array(items), get_passage_fragments(_passage_ids(items)))
+
+
+async def aquestions_payload(question_ids, passages=False):
+    """
+    questions_payload の非同期版
+    """
+    fragments = await aget_fragments(question_ids, QUIZ_VARIANT)
+    items = [fragments[question_id] for question_id in question_ids if question_id in fragments]
+    if not passages:
+        return json_array(items)
+    return with_passages('questions', json_array(items), await aget_passage_fragments(_passage_ids(items)))
+
+
+def _result_rows(results):
+    """
+    Result のインスタンスを values() と同じ形の dict に揃える
+    """
+    return [
+        result if isinstance(result, dict) else {
+            'id': result.id,
+            'user_id': result.user_id,
+            'question_id': result.question_id,
+            'selected_answer': result.selected_answer,
+            'is_correct': result.is_correct,
+            'answered_at': result.answered_at,
+        }
+        for result in results
+    ]
+
+
+def _assemble_results(rows, fragments):
+    items = []
+    for row in rows:
+        fragment = fragments.get(row['question_id'])
+        if fragment is None:
+            continue
+        # ResultSerializer.Meta.fields と同じ順序で組み立てる
+        head = _renderer.render({'id': row['id'], 'user': row['user_id']})
+        tail = _renderer.render({
+            'selected_answer': row['selected_answer'],
+            'is_correct': row['is_correct'],
+            'answered_at': _datetime_field.to_representation(row['answered_at']),
+        })
+        items.append(head[:-1] + b',"question":' + fragment + b',' + tail[1:])
+    return json_array(items)
+
+
+def _result_passage_ids(rows, fragments):
+    return _passage_ids(fragments[row['question_id']] for row in rows if row['question_id'] in fragments)
+
+
+def results_payload(results, questions=None, passages=False):
+    """
+    採点結果の JSON 配列 (ResultSerializer(many=True) と同じ内容) を返す
+    results は Result のインスタンスか、同じキーを持つ dict (values() の結果) のリスト
+    passages なら {"results": [...], "passages": [...]} にして、参照している長文も返す
+    """
+    rows = _result_rows(results)
+    fragments = get_fragments({row['question_id'] for row in rows}, RESULT_VARIANT, questions)
+    payload = _assemble_results(rows, fragments)
+    if not passages:
+        return payload
+    return with_passages('results', payload, get_passage_fragments(_result_passage_ids(rows, fragments)))
+
+
+async def aresults_payload(results, questions=None, passages=False):
+    """
+    results_payload の非同期版
+    """
+    rows = _result_rows(results)
+    fragments = await aget_fragments({row['question_id'] for row in rows}, RESULT_VARIANT, questions)
+    payload = _assemble_results(rows, fragments)
+    if not passages:
+        return payload
+    return with_passages('results', payload, await aget_passage_fragments(_result_passage_ids(rows, fragments)))
@@ -0,0 +1,89 @@
+import datetime
+
+from django.utils import timezone
+
+from .models import ReviewItem
+
+# SM-2 の易しさ係数の初期値と下限
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+
+# 正解・不正解を SM-2 の評価 (0〜5) に置き換える (3 未満は覚え直し)
+QUALITY_CORRECT = 4
+QUALITY_INCORRECT = 1
+
+# 間違えた問題をもう一度出題するまでの時間
+# (SM-2 では1日後だが、同じ日のうちに復習クイズで解き直せるように短くする)
+RELEARN_DELAY = datetime.timedelta(minutes=10)
+
+SCHEDULE_FIELDS = ['ease', 'interval', 'repetitions', 'next_due', 'last_reviewed_at']
+
+
+def schedule(ease, interval, repetitions, is_correct, now):
+    """
+    SM-2 で解答後の (ease, interval, repetitions, next_due) を計算する
+    """
+    quality = QUALITY_CORRECT if is_correct else QUALITY_INCORRECT
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if quality < 3:
+        return ease, 0, 0, now + RELEARN_DELAY
+
+    if repetitions == 0:
+        interval = 1
+    elif repetitions == 1:
+        interval = 6
+    else:
+        interval = round(interval * ease)
+    return ease, interval, repetitions + 1, now + datetime.timedelta(days=interval)
+
+
+def update_review_schedule(user, results, now=None):
+    """
+    採点済みの Result から復習スケジュールを更新する
+    (既存の行の取得1回と INSERT ... ON CONFLICT 1回。呼び出し側のトランザクション内で実行すること)
+    """
+    if not results:
+        return
+    now = now or timezone.now()
+    # 同じ問題への重複した解答は最後のものだけを使う (Result と同じ)
+    latest = {result.question_id: result for result in results}
+    existing = {
+        item.question_id: item
+        for item in ReviewItem.objects.filter(user=user, question_id__in=latest).only(
+            'question_id', 'ease', 'interval', 'repetitions'
+        )
+    }
+
+    items = []
+    for question_id, result in latest.items():
+        previous = existing.get(question_id)
+        ease, interval, repetitions, next_due = schedule(
+            previous.ease if previous else INITIAL_EASE,
+            previous.interval if previous else 0,
+            previous.repetitions if previous else 0,
+            result.is_correct,
+            now,
+        )
+        items.append(ReviewItem(
+            user=user, question_id=question_id,
+            ease=ease, interval=interval, repetitions=repetitions,
+            next_due=next_due, last_reviewed_at=now,
+        ))
+    ReviewItem.objects.bulk_create(
+        items,
+        update_conflicts=True,
+        unique_fields=['user', 'question'],
+        update_fields=SCHEDULE_FIELDS,
+    )
+
+
+def due_question_ids(user, k=10, now=None):
+    """
+    復習期限が来た問題IDを期限の古い順に k 件返す (review_user_due_idx の範囲検索1回)
+    """
+    now = now or timezone.now()
+    return list(
+        ReviewItem.objects.filter(user=user, next_due__lte=now)
+        .order_by('next_due')
+        .values_list('question_id', flat=True)[:k]
+    )
@@ -0,0 +1,122 @@
+import random
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.db import DEFAULT_DB_ALIAS
+
+from .bank import RefreshingSnapshot
+from .models import Question
+
+# パートを指定しない場合に使うインデックスのキー
+ALL_PARTS = None
+
+
+class _PartIndex:
+    """
+    1パート分の問題IDを難易度順に並べたインデックス
+    (ids[i] の難易度が difficulties[i])
+    """
+    __slots__ = ('ids', 'difficulties')
+
+    def __init__(self):
+        self.ids = array('q')
+        self.difficulties = array('i')
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class QuestionSampler(RefreshingSnapshot):
+    """
+    ORDER BY RANDOM() を使わずにランダムな問題を抽出するクラス
+
+    問題のID・パート・難易度だけをメモリ上に保持し、
+    難易度の範囲は二分探索、抽出は random.sample で O(k) で行う。
+    問題バンクのバージョン (quiz.bank) が変わるか、
+    QUIZ_SAMPLER_MAX_AGE 秒が経過したらインデックスを作り直す。
+    """
+
+    max_age_setting = 'QUIZ_SAMPLER_MAX_AGE'
+
+    def _build(self):
+        indexes = {ALL_PARTS: _PartIndex()}
+        # 難易度順に並べて読み込むので、各インデックスは最初からソート済みになる
+        # プロセス内で共有するインデックスなので、レプリカに振り分けられたリクエストの中でも
+        # 遅れのないプライマリから読む (古い内容を新しいバージョンとして保持しないように)
+        rows = (
+            Question.objects.using(DEFAULT_DB_ALIAS)
+            .order_by('difficulty_level', 'id')
+            .values_list('id', 'part', 'difficulty_level')
+            .iterator(chunk_size=10000)
+        )
+        for question_id, part, difficulty in rows:
+            for key in (ALL_PARTS, part):
+                index = indexes.get(key)
+                if index is None:
+                    index = indexes[key] = _PartIndex()
+                index.ids.append(question_id)
+                index.difficulties.append(difficulty)
+        return indexes
+
+    def count(self, part=ALL_PARTS, min_difficulty=None, max_difficulty=None):
+        """
+        条件に合う問題数を返す
+        """
+        lo, hi, _ = self.locate(part, min_difficulty, max_difficulty)
+        return hi - lo
+
+    def locate(self, part=ALL_PARTS, min_difficulty=None, max_difficulty=None):
+        """
+        条件に合う問題の範囲 (lo, hi, index) を返す
+        (index.ids[lo:hi] が対象の問題ID。該当するパートが無ければ index は None)
+        """
+        return self._locate(self._ensure_fresh(), part, min_difficulty, max_difficulty)
+
+    async def alocate(self, part=ALL_PARTS, min_difficulty=None, max_difficulty=None):
+        """
+        locate の非同期版
+        """
+        return self._locate(await self._aensure_fresh(), part, min_difficulty, max_difficulty)
+
+    def _locate(self, indexes, part, min_difficulty, max_difficulty):
+        index = indexes.get(part)
+        if index is None:
+            return 0, 0, None
+        lo = 0 if min_difficulty is None else bisect_left(index.difficulties, min_difficulty)
+        hi = len(index) if max_difficulty is None else bisect_right(index.difficulties, max_difficulty)
+        return lo, max(lo, hi), index
+
+    def sample_ids(self, k=10, part=ALL_PARTS, min_difficulty=None, max_difficulty=None):
+        """
+        条件に合う問題IDを重複なしで最大 k 件ランダムに返す
+        """
+        return self._sample(self.locate(part, min_difficulty, max_difficulty), k)
+
+    async def asample_ids(self, k=10, part=ALL_PARTS, min_difficulty=None, max_difficulty=None):
+        """
+        sample_ids の非同期版
+        """
+        return self._sample(await self.alocate(part, min_difficulty, max_difficulty), k)
+
+    def _sample(self, located, k):
+        lo, hi, index = located
+        if hi - lo <= k:
+            positions = list(range(lo, hi))
+            random.shuffle(positions)
+        else:
+            # range に対する random.sample は母集団の大きさに関係なく O(k)
+            positions = random.sample(range(lo, hi), k)
+        return [index.ids[pos] for pos in positions]
+
+    def sample(self, k=10, part=ALL_PARTS, min_difficulty=None, max_difficulty=None):
+        """
+        ランダムな Question を最大 k 件、主キー検索1回で取得して返す
+        """
+        question_ids = self.sample_ids(k, part, min_difficulty, max_difficulty)
+        questions = Question.objects.in_bulk(question_ids)
+        # インデックス作成後に削除された問題は飛ばす
+        return [questions[qid] for qid in question_ids if qid in questions]
+
+
+# プロセス内で共有するサンプラー
+question_sampler = QuestionSampler()
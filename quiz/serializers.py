@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Question, Result
+from .models import DIFFICULTY_BANDS, Passage, Question, Result, UserStats
+from .stats import current_streak
 
 class QuestionSerializer(serializers.ModelSerializer):
     """
@@ -10,6 +11,7 @@ class QuestionSerializer(serializers.ModelSerializer):
         # JSONに含めるフィールドを指定
         fields = [
             'id', 
+            'passage',  # 長文のID (長文の本文は ?passages=1 で別に返す)
             'question_text', 
             'option_a', 
             'option_b', 
@@ -31,6 +33,7 @@ class QuestionResultSerializer(serializers.ModelSerializer):
         # 正解と解説を含める
         fields = [
             'id', 
+            'passage',
             'question_text', 
             'option_a', 
             'option_b', 
@@ -40,6 +43,15 @@ class QuestionResultSerializer(serializers.ModelSerializer):
             'explanation'     # 解説を追加
         ]
 
+class PassageSerializer(serializers.ModelSerializer):
+    """
+    複数の設問で共有する長文のシリアライザ (1回のレスポンスで長文ごとに1回だけ返す)
+    """
+    class Meta:
+        model = Passage
+        fields = ['id', 'title', 'passage_text']
+
+
 class ResultSerializer(serializers.ModelSerializer):
     """
     ResultモデルをJSONに変換するためのシリアライザ
@@ -58,4 +70,50 @@ class ResultSerializer(serializers.ModelSerializer):
             'selected_answer', # どう答えたか
             'is_correct',    # 正誤
             'answered_at'    # いつ
-        ]
\ No newline at end of file
+        ]
+
+def _accuracy(correct, answered):
+    return round(correct / answered, 4) if answered else None
+
+
+class UserStatsSerializer(serializers.ModelSerializer):
+    """
+    UserStats を「全体・パート別・難易度帯別」の形に整えて返すシリアライザ
+    """
+    accuracy = serializers.SerializerMethodField()
+    parts = serializers.SerializerMethodField()
+    difficulty_bands = serializers.SerializerMethodField()
+    current_streak = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserStats
+        fields = [
+            'total_answered',
+            'total_correct',
+            'accuracy',
+            'parts',             # パート別
+            'difficulty_bands',  # 難易度帯別
+            'current_streak',
+            'longest_streak',
+            'last_active_date',
+        ]
+
+    def _group(self, obj, prefix):
+        answered = getattr(obj, f'{prefix}_answered')
+        correct = getattr(obj, f'{prefix}_correct')
+        return {'answered': answered, 'correct': correct, 'accuracy': _accuracy(correct, answered)}
+
+    def get_accuracy(self, obj):
+        return _accuracy(obj.total_correct, obj.total_answered)
+
+    def get_parts(self, obj):
+        return {part: self._group(obj, part.lower()) for part, _ in Question.PART_CHOICES}
+
+    def get_difficulty_bands(self, obj):
+        return {
+            key: {'label': label, **self._group(obj, key)}
+            for key, label, _, _ in DIFFICULTY_BANDS
+        }
+
+    def get_current_streak(self, obj):
+        return current_streak(obj)
@@ -0,0 +1,59 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .bank import bump_bank_version
+from .models import Passage, Question
+from .payloads import invalidate_fragments, invalidate_passage_fragments
+from .stats import regroup_user_stats
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, **kwargs):
+    """
+    問題が追加・更新・削除されたら問題バンクのバージョンを更新する
+    (bulk_create / bulk_update はシグナルを送らないので、呼び出し側で bump_bank_version を呼ぶこと)
+    """
+    bump_bank_version()
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_fragments_changed(sender, instance, **kwargs):
+    """
+    問題が更新・削除されたら、その問題の作成済み JSON を破棄する
+    """
+    invalidate_fragments([instance.pk])
+
+
+@receiver(pre_save, sender=Question)
+def question_groups_changed(sender, instance, raw=False, **kwargs):
+    """
+    既存の問題のパート・難易度が変わる場合は、解答済みのユーザーの成績集計のパート別・難易度帯別の件数を移し替える
+    (bulk_update で変更する場合は、呼び出し側で regroup_user_stats を呼ぶこと)
+    """
+    if raw or instance.pk is None:
+        return
+    before = Question.objects.filter(pk=instance.pk).values_list('part', 'difficulty_level').first()
+    after = (instance.part, instance.difficulty_level)
+    if before is not None and tuple(before) != after:
+        regroup_user_stats({instance.pk: (tuple(before), after)})
+
+
+@receiver(post_save, sender=Passage)
+@receiver(post_delete, sender=Passage)
+def passage_changed(sender, **kwargs):
+    """
+    長文が更新・削除されたら問題バンクのバージョンを更新する (オフライン用の問題パックに長文を含めるため)
+    """
+    bump_bank_version()
+
+
+@receiver(post_save, sender=Passage)
+@receiver(post_delete, sender=Passage)
+def passage_fragments_changed(sender, instance, **kwargs):
+    """
+    長文が更新・削除されたら、その長文の作成済み JSON を破棄する
+    (設問の JSON は長文のIDだけを含むので、作り直す必要は無い)
+    """
+    invalidate_passage_fragments([instance.pk])
@@ -0,0 +1,280 @@
+import atexit
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections
+from django.utils.dateparse import parse_datetime
+
+from .grading import grade_with_key, record_submissions
+
+logger = logging.getLogger(__name__)
+
+# スプールに書き出した1回分の解答送信 (answers は [(問題ID, 選択肢, 正誤), ...])
+Submission = namedtuple('Submission', ['id', 'user_id', 'submitted_at', 'answers'])
+
+# セグメントファイルの状態 (書き込み中 → 保存待ち → 保存中。保存が終わったら削除する)
+# 保存に SUBMIT_SPOOL_MAX_ATTEMPTS 回失敗したファイルは、後の送信の保存を止めないよう .failed にして残す
+OPEN = '.open'
+READY = '.ready'
+DRAINING = '.draining'
+FAILED = '.failed'
+
+
+def spool_enabled():
+    """
+    解答の保存を遅らせるモード (SUBMIT_SPOOL_DIR を設定した場合) なら True
+    """
+    return bool(getattr(settings, 'SUBMIT_SPOOL_DIR', ''))
+
+
+def read_segment(path):
+    """
+    セグメントファイルの Submission のリストを返す
+    (書き込み中に止まった場合の途中の行は読み飛ばす。その送信はクライアントに応答していない)
+    """
+    submissions = []
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                logger.warning('スプールの壊れた行を読み飛ばしました: %s', path)
+                continue
+            submissions.append(Submission(
+                uuid.UUID(data['id']), data['user'], parse_datetime(data['at']),
+                [tuple(answer) for answer in data['answers']],
+            ))
+    return submissions
+
+
+def _owner_pid(path):
+    """
+    書き込み中・保存中のファイルを持つプロセスの pid (ファイル名から読めなければ None)
+    書き込み中は '{時刻}-{pid}-{連番}.open'、保存中は '{時刻}-{pid}-{連番}.{保存するプロセスの pid}.draining'
+    """
+    try:
+        if path.suffix == OPEN:
+            return int(path.stem.split('-')[1])
+        return int(path.stem.rsplit('.', 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    """
+    同じホストでそのプロセスが動いていれば True
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # 他のユーザーのプロセス
+    return True
+
+
+class SubmissionSpool:
+    """
+    採点済みの解答をローカルのファイル (SUBMIT_SPOOL_DIR) に追記し、まとめて保存するクラス
+
+    各プロセスは自分のセグメントファイル (*.open) に1送信1行で追記し、応答の前に fsync する。
+    SUBMIT_SPOOL_FLUSH_SIZE 件か SUBMIT_SPOOL_FLUSH_INTERVAL 秒でファイルを閉じて *.ready にし、
+    バックグラウンドのスレッド (または manage.py drain_submissions) が1ファイルを1トランザクションで保存する。
+    保存中に止まったファイルは再び保存するが、SubmissionReceipt で保存済みの送信は飛ばす (at-least-once)。
+    """
+
+    def __init__(self, directory=None):
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._pid = None
+        self._file = None
+        self._path = None
+        self._count = 0
+        self._first_at = 0.0
+        self._wakeup = threading.Event()
+        self._flusher_pid = None
+        self._failures = {}  # 保存待ちのファイル名 -> 保存に失敗した回数
+
+    @property
+    def directory(self):
+        return Path(self._directory or settings.SUBMIT_SPOOL_DIR)
+
+    @property
+    def flush_size(self):
+        return getattr(settings, 'SUBMIT_SPOOL_FLUSH_SIZE', 200)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'SUBMIT_SPOOL_FLUSH_INTERVAL', 1.0)
+
+    @property
+    def max_attempts(self):
+        return getattr(settings, 'SUBMIT_SPOOL_MAX_ATTEMPTS', 3)
+
+    def append(self, user_id, results):
+        """
+        採点済みの Result (同じユーザーの1回の送信分) を追記し、送信ID (UUID) を返す
+        戻った時点でディスクに書き込まれている
+        """
+        submission_id = uuid.uuid4()
+        line = json.dumps({
+            'id': submission_id.hex,
+            'user': user_id,
+            'at': results[0].answered_at.isoformat(),
+            'answers': [[result.question_id, result.selected_answer, result.is_correct] for result in results],
+        }, separators=(',', ':')).encode('utf-8') + b'\n'
+
+        with self._lock:
+            if self._file is None or self._pid != os.getpid():
+                self._open_segment()
+            self._file.write(line)
+            self._file.flush()
+            if getattr(settings, 'SUBMIT_SPOOL_FSYNC', True):
+                os.fsync(self._file.fileno())
+            if self._count == 0:
+                self._first_at = time.monotonic()
+            self._count += 1
+            if self._count >= self.flush_size:
+                self._close_segment()
+                self._wakeup.set()
+        self._ensure_flusher()
+        return submission_id
+
+    def _open_segment(self):
+        # fork 後の子プロセスは親のファイルを引き継がず、自分のファイルを作る
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._pid = os.getpid()
+        name = f'{time.time_ns():020d}-{self._pid}-{next(self._sequence)}'
+        self._path = self.directory / (name + OPEN)
+        self._file = open(self._path, 'ab')
+        self._count = 0
+
+    def _close_segment(self):
+        self._file.close()
+        self._path.rename(self._path.with_suffix(READY))
+        self._file = self._path = None
+        self._count = 0
+
+    def rotate(self, force=False):
+        """
+        書き込み中のファイルが SUBMIT_SPOOL_FLUSH_INTERVAL 秒を過ぎていれば (force なら常に) 保存待ちにする
+        """
+        with self._lock:
+            if self._file is None or self._pid != os.getpid() or not self._count:
+                return
+            if force or time.monotonic() - self._first_at >= self.flush_interval:
+                self._close_segment()
+
+    def recover(self, stale_after=None):
+        """
+        止まったプロセスが残した書き込み中・保存中のファイルを保存待ちに戻す
+        ファイル名の pid のプロセスが終了していて、stale_after 秒以上更新の無いものだけを対象にする
+        (動いているプロセスのファイルは、長い保存の途中などで更新が止まっていても移さない)
+        """
+        if stale_after is None:
+            stale_after = max(60, self.flush_interval * 10)
+        recovered = 0
+        deadline = time.time() - stale_after
+        for path in [*self.directory.glob('*' + OPEN), *self.directory.glob('*' + DRAINING)]:
+            pid = _owner_pid(path)
+            if pid is not None and _pid_alive(pid):
+                continue
+            try:
+                if path.stat().st_mtime < deadline:
+                    path.rename(path.with_name(path.name.split('.')[0] + READY))
+                    recovered += 1
+            except FileNotFoundError:
+                continue  # 他のプロセスが先に移動・削除した
+        return recovered
+
+    def drain(self, max_segments=None):
+        """
+        保存待ちのファイルを古い順に1ファイル1トランザクションで保存し、(ファイル数, 保存した送信数) を返す
+        複数のプロセスが同時に呼んでも、rename で取り出したプロセスだけが保存する
+
+        保存に失敗したファイルは保存待ちに戻して次のファイルに進み、max_attempts 回失敗したら .failed にする。
+        DBに接続できないなどの一時的なエラーでは回数を数えず、保存待ちに戻して例外を送出する。
+        """
+        segments = applied = 0
+        for path in sorted(self.directory.glob('*' + READY)):
+            if max_segments is not None and segments >= max_segments:
+                break
+            # 保存中のファイル名には自分の pid を付ける (recover が動いているプロセスのファイルを移さないように)
+            claimed = path.with_name(f'{path.stem}.{os.getpid()}{DRAINING}')
+            try:
+                path.rename(claimed)
+            except FileNotFoundError:
+                continue
+            try:
+                applied += record_submissions(read_segment(claimed))
+            except (OperationalError, InterfaceError):
+                # 次回もう一度保存する (保存済みの送信は飛ばされる)
+                claimed.rename(path)
+                raise
+            except Exception:
+                self._failed(path, claimed)
+                continue
+            self._failures.pop(path.name, None)
+            claimed.unlink()
+            segments += 1
+        return segments, applied
+
+    def _failed(self, path, claimed):
+        attempts = self._failures[path.name] = self._failures.get(path.name, 0) + 1
+        if attempts < self.max_attempts:
+            logger.exception('スプールのファイルの保存に失敗しました (%d 回目、後でもう一度保存します): %s', attempts, path)
+            claimed.rename(path)
+            return
+        del self._failures[path.name]
+        failed = path.with_suffix(FAILED)
+        claimed.rename(failed)
+        logger.exception('スプールのファイルの保存に %d 回失敗したため、保存をやめて %s に移しました', attempts, failed)
+
+    def _ensure_flusher(self):
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._run_flusher, name='submission-spool', daemon=True).start()
+
+    def _run_flusher(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.rotate()
+                if getattr(settings, 'SUBMIT_SPOOL_DRAIN_IN_PROCESS', True):
+                    self.recover()
+                    self.drain()
+            except Exception:
+                logger.exception('スプールした解答の保存に失敗しました')
+            finally:
+                close_old_connections()
+
+
+submission_spool = SubmissionSpool()
+
+# 終了時に書き込み中のファイルを保存待ちにする (残ったものは drain_submissions / 他のプロセスが保存する)
+atexit.register(lambda: submission_spool.rotate(force=True))
+
+
+def spool_answers(user, answers_data):
+    """
+    解答をメモリ上の正解で採点してスプールに追記し、(送信ID, 未保存の Result のリスト) を返す
+    (有効な解答が無ければ送信IDは None)
+    """
+    results = grade_with_key(user, answers_data)
+    if not results:
+        return None, results
+    return submission_spool.append(user.pk, results), results
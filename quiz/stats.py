@@ -0,0 +1,126 @@
+import datetime
+from collections import Counter, namedtuple
+
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Result, UserStats, difficulty_band
+from .utils import chunked
+
+# 保存前の Result の正誤と解答日時
+Outcome = namedtuple('Outcome', ['is_correct', 'answered_at'])
+
+
+def previous_outcomes(user, results):
+    """
+    保存前の Result について、既存の {question_id: Outcome} を1回のクエリで返す
+    (UPSERT の前に呼び出し、差分計算に使う)
+    """
+    question_ids = {result.question_id for result in results}
+    if not question_ids:
+        return {}
+    return {
+        question_id: Outcome(is_correct, answered_at)
+        for question_id, is_correct, answered_at in Result.objects.filter(
+            user=user, question_id__in=question_ids
+        ).values_list('question_id', 'is_correct', 'answered_at')
+    }
+
+
+def stats_groups(part, difficulty_level):
+    """
+    問題が集計されるパート別・難易度帯別の列の接頭辞 (例: ('part5', 'advanced'))
+    """
+    return part.lower(), difficulty_band(difficulty_level)
+
+
+def stats_deltas(results, previous):
+    """
+    Result の保存によって UserStats の各列がいくつ増減するかを返す
+    previous は previous_outcomes() の戻り値 (保存前の状態)
+    """
+    deltas = Counter()
+    # 同じ問題への重複した解答は最後のものだけが保存される
+    latest = {result.question_id: result for result in results}
+    for question_id, result in latest.items():
+        question = result.question
+        groups = ('total', *stats_groups(question.part, question.difficulty_level))
+        was = previous.get(question_id)
+
+        answered = 0 if was else 1
+        correct = int(result.is_correct) - int(bool(was and was.is_correct))
+        for group in groups:
+            deltas[f'{group}_answered'] += answered
+            deltas[f'{group}_correct'] += correct
+
+    return {field: delta for field, delta in deltas.items() if delta}
+
+
+def update_user_stats(user, results, previous, today=None):
+    """
+    UserStats を F() による加算で更新する (行が無ければ先に作成する)
+    呼び出し側のトランザクション内で実行すること
+    """
+    if not results:
+        return
+    today = today or timezone.localdate()
+    yesterday = today - datetime.timedelta(days=1)
+
+    # 行が無ければ作成 (既にあれば何もしない)
+    UserStats.objects.bulk_create([UserStats(user=user)], ignore_conflicts=True)
+
+    # 連続学習日数: 今日既に学習済みならそのまま、昨日学習していれば +1、それ以外は 1 から
+    streak = Case(
+        When(last_active_date=today, then=F('current_streak')),
+        When(last_active_date=yesterday, then=F('current_streak') + 1),
+        default=Value(1),
+        output_field=IntegerField(),
+    )
+    UserStats.objects.filter(user=user).update(
+        # 列は PositiveIntegerField なので、集計がずれていても負にならないよう 0 で止める
+        **{field: Greatest(F(field) + delta, 0) for field, delta in stats_deltas(results, previous).items()},
+        current_streak=streak,
+        longest_streak=Greatest(F('longest_streak'), streak),
+        last_active_date=today,
+        updated_at=timezone.now(),
+    )
+
+
+def regroup_user_stats(changes, batch_size=500):
+    """
+    問題のパート・難易度の変更に合わせて、解答済みのユーザーの UserStats のパート別・難易度帯別の件数を移し替える
+    changes = {question_id: ((変更前のパート, 変更前の難易度), (変更後のパート, 変更後の難易度))}
+    (移し替えの組ごと・batch_size 問ごとに、Result を数える相関サブクエリ付きの UPDATE を1回実行する。
+    解答送信と同じ列を更新するので、問題の更新と同じトランザクション内で呼び出すこと)
+    """
+    moves = {}
+    for question_id, (before, after) in changes.items():
+        for old, new in zip(stats_groups(*before), stats_groups(*after)):
+            if old != new:
+                moves.setdefault((old, new), []).append(question_id)
+
+    for (old, new), question_ids in moves.items():
+        for batch in chunked(question_ids, batch_size):
+            results = Result.objects.filter(question_id__in=batch)
+            per_user = results.filter(user_id=OuterRef('user_id')).order_by().values('user_id')
+            answered = Coalesce(Subquery(per_user.annotate(count=Count('id')).values('count')), 0)
+            correct = Coalesce(Subquery(
+                per_user.annotate(count=Count('id', filter=Q(is_correct=True))).values('count')
+            ), 0)
+            UserStats.objects.filter(user_id__in=results.values('user_id')).update(**{
+                f'{old}_answered': Greatest(F(f'{old}_answered') - answered, 0),
+                f'{old}_correct': Greatest(F(f'{old}_correct') - correct, 0),
+                f'{new}_answered': F(f'{new}_answered') + answered,
+                f'{new}_correct': F(f'{new}_correct') + correct,
+            })
+
+
+def current_streak(stats, today=None):
+    """
+    表示用の連続学習日数 (昨日も今日も学習していなければ 0)
+    """
+    today = today or timezone.localdate()
+    if stats.last_active_date is None or stats.last_active_date < today - datetime.timedelta(days=1):
+        return 0
+    return stats.current_streak
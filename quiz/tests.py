@@ -1,3 +1,1322 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DataError, OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config.db_router import (
+    ReplicaRouter, _areplica_for, _read_alias, _replica_for, apin_to_primary, choose_replica, pin_to_primary,
+    read_from_replica,
+)
+
+from .adaptive import INITIAL_RATING, select_question_ids
+from .bank import RefreshingSnapshot, bump_bank_version
+from .calibration import Calibration, save_calibration
+from .grading import grade_answers, record_results, record_submissions
+from .leaderboard import GLOBAL_BOARD, leaderboard, week_board
+from .models import (
+    AnswerArchive, AnswerLog, AnswerRollup, LeaderboardEntry, Passage, Question, Result, ReviewItem, SubmissionReceipt,
+    UserAbility, UserStats,
+)
+from .packs import QuestionPacks
+from .paginators import EstimatedCountPaginator, estimated_count
+from .partitions import closed_months, detach_month, export_month, month_range, rollup_month
+from .payloads import questions_payload, results_payload
+from .review import INITIAL_EASE, RELEARN_DELAY, due_question_ids, schedule
+from .sampling import question_sampler
+from .serializers import PassageSerializer, ResultSerializer
+from .spool import DRAINING, FAILED, OPEN, READY, Submission, SubmissionSpool
+
+
+def explain(sql):
+    """
+    SQL の実行計画を1行ずつのリストで返す (PostgreSQL / SQLite)
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def is_sequential_scan(plan_line):
+    """
+    アプリのテーブルに対するフルスキャンなら True
+    """
+    if connection.vendor == 'postgresql':
+        return 'Seq Scan on quiz_' in plan_line
+    # SQLite: SEARCH はインデックス検索、SCAN はテーブル (またはインデックス全体) の走査
+    return plan_line.startswith('SCAN quiz_')
+
+
+# DATABASE_REPLICA_URLS を設定していても、テストのトランザクション内のデータが見えるよう全て default で実行する
+@override_settings(DATABASE_ROUTERS=[])
+class QueryPlanTests(TestCase):
+    """
+    API が発行するクエリの実行計画を確認し、
+    大きめのデータでフルスキャンに落ちていないことを保証するテスト
+    (インデックスを消したり、ビューのクエリを変えたりしたときの回帰検知用)
+    """
+    QUESTION_COUNT = 20000
+    USER_COUNT = 100
+    RESULTS_PER_USER = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        Question.objects.bulk_create([
+            Question(
+                question_text=f"Question {n} ------- text.",
+                option_a='a', option_b='b', option_c='c', option_d='d',
+                correct_answer=rng.choice('ABCD'),
+                part=rng.choice(('PART5', 'PART7')),
+                difficulty_level=rng.randrange(300, 990, 5),
+            )
+            for n in range(cls.QUESTION_COUNT)
+        ], batch_size=2000)
+        question_ids = list(Question.objects.values_list('id', flat=True))
+
+        users = User.objects.bulk_create([User(username=f'user{n}') for n in range(cls.USER_COUNT)])
+        Result.objects.bulk_create([
+            Result(user=user, question_id=question_id, selected_answer='A', is_correct=rng.random() < 0.6)
+            for user in users
+            for question_id in rng.sample(question_ids, cls.RESULTS_PER_USER)
+        ], batch_size=2000)
+        ReviewItem.objects.bulk_create([
+            ReviewItem(
+                user_id=result.user_id, question_id=result.question_id,
+                next_due=timezone.now() + datetime.timedelta(days=rng.randrange(-30, 30)),
+                last_reviewed_at=timezone.now(),
+            )
+            for result in Result.objects.all()
+        ], batch_size=2000)
+        call_command('rebuild_leaderboard', stdout=io.StringIO())
+        cls.user = users[0]
+        cls.question_ids = question_ids
+
+        # プランナーに統計情報を渡す
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        # サンプラーのインデックス作成 (意図的な全件読み込み) は計測対象から外す
+        question_sampler.invalidate()
+        question_sampler.count()
+        # ランキングのスナップショット作成も同様
+        leaderboard.invalidate()
+        leaderboard.total(GLOBAL_BOARD)
+
+    def assertNoSequentialScans(self, request):
+        """
+        request() 内で発行された SELECT の実行計画にフルスキャンが無いことを確認する
+        """
+        with CaptureQueriesContext(connection) as captured:
+            response = request()
+        self.assertLess(response.status_code, 400, response.content)
+
+        selects = [query['sql'] for query in captured.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            plan = explain(sql)
+            scans = [line for line in plan if is_sequential_scan(line)]
+            self.assertFalse(scans, f"フルスキャンが発生しています:\n{sql}\n" + '\n'.join(plan))
+        return response
+
+    def test_quiz(self):
+        self.assertNoSequentialScans(lambda: self.client.get('/api/quiz/'))
+
+    def test_quiz_filtered(self):
+        self.assertNoSequentialScans(
+            lambda: self.client.get('/api/quiz/', {'part': 'PART5', 'min_difficulty': 500, 'max_difficulty': 700})
+        )
+
+    def test_quiz_adaptive(self):
+        self.assertNoSequentialScans(lambda: self.client.get('/api/quiz/', {'mode': 'adaptive'}))
+
+    def test_review(self):
+        response = self.assertNoSequentialScans(lambda: self.client.get('/api/quiz/review/'))
+        self.assertTrue(response.json())
+
+    def test_submit(self):
+        answers = [{'question_id': qid, 'selected_answer': 'B'} for qid in self.question_ids[:10]]
+        self.assertNoSequentialScans(lambda: self.client.post('/api/quiz/submit/', answers, format='json'))
+
+    def test_results(self):
+        result_ids = Result.objects.filter(user=self.user).values_list('id', flat=True)[:10]
+        ids = ','.join(str(result_id) for result_id in result_ids)
+        self.assertNoSequentialScans(lambda: self.client.get('/api/results/', {'ids': ids}))
+
+    def test_stats(self):
+        self.assertNoSequentialScans(lambda: self.client.get('/api/stats/'))
+
+    def test_leaderboard(self):
+        response = self.assertNoSequentialScans(lambda: self.client.get('/api/leaderboard/'))
+        body = response.json()
+        self.assertEqual(body['total'], self.USER_COUNT)
+        self.assertEqual(body['me']['answered'], self.RESULTS_PER_USER)
+        self.assertIsNotNone(body['me']['rank'])
+
+
+def make_question(n=0, **fields):
+    """
+    テスト用の問題を1件作成する (正解は A)
+    """
+    defaults = {
+        'question_text': f'Question {n} ------- text.',
+        'option_a': 'a', 'option_b': 'b', 'option_c': 'c', 'option_d': 'd',
+        'correct_answer': 'A', 'part': 'PART5', 'difficulty_level': 600,
+    }
+    return Question.objects.create(**{**defaults, **fields})
+
+
+def submit(user, *answers):
+    """
+    (問題, 選択肢) の組を採点して保存し、保存した Result のリストを返す
+    """
+    answers_data = [{'question_id': question.pk, 'selected_answer': answer} for question, answer in answers]
+    return record_results(user, grade_answers(user, answers_data))
+
+
+class UserStatsTests(TestCase):
+    """
+    解答送信時の UserStats の差分更新と、問題のパート・難易度の変更への追従
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='learner')
+
+    def stats(self):
+        return UserStats.objects.get(user=self.user)
+
+    def test_reanswer_changes_correct_only(self):
+        question = make_question(difficulty_level=300)
+        submit(self.user, (question, 'A'))
+        submit(self.user, (question, 'B'))
+        stats = self.stats()
+        self.assertEqual((stats.total_answered, stats.total_correct), (1, 0))
+        self.assertEqual((stats.basic_answered, stats.basic_correct), (1, 0))
+        self.assertEqual((stats.part5_answered, stats.part5_correct), (1, 0))
+
+    def test_difficulty_change_moves_counts_to_new_band(self):
+        question = make_question(difficulty_level=300)
+        submit(self.user, (question, 'A'))
+
+        question.difficulty_level = 900
+        question.save()
+        stats = self.stats()
+        self.assertEqual((stats.basic_answered, stats.basic_correct), (0, 0))
+        self.assertEqual((stats.expert_answered, stats.expert_correct), (1, 1))
+
+        # 変更後の帯から正解が取り消される (以前は CHECK 制約違反になっていた)
+        submit(self.user, (question, 'B'))
+        stats = self.stats()
+        self.assertEqual((stats.expert_answered, stats.expert_correct), (1, 0))
+        self.assertEqual(stats.total_correct, 0)
+
+    def test_part_change_moves_counts_to_new_part(self):
+        question = make_question()
+        submit(self.user, (question, 'A'))
+        question.part = 'PART7'
+        question.save()
+        stats = self.stats()
+        self.assertEqual((stats.part5_answered, stats.part7_answered, stats.part7_correct), (0, 1, 1))
+
+    def test_drifted_counts_do_not_go_negative(self):
+        question = make_question()
+        submit(self.user, (question, 'A'))
+        UserStats.objects.filter(user=self.user).update(total_correct=0, part5_correct=0, intermediate_correct=0)
+        submit(self.user, (question, 'B'))
+        self.assertEqual(self.stats().total_correct, 0)
+
+
+class AdaptiveTests(TestCase):
+    """
+    能力値の更新と、能力値に合った未解答の問題の選択 (quiz.adaptive)
+    """
+
+    def setUp(self):
+        cache.clear()
+        question_sampler.invalidate()
+        self.user = User.objects.create(username='learner')
+        self.questions = {
+            difficulty: make_question(n, difficulty_level=difficulty) for n, difficulty in enumerate(range(300, 950, 50))
+        }
+
+    def rating(self):
+        return UserAbility.objects.get(user=self.user).rating
+
+    def test_ability_moves_with_answers(self):
+        submit(self.user, (self.questions[600], 'A'))
+        after_correct = self.rating()
+        self.assertGreater(after_correct, INITIAL_RATING)
+        submit(self.user, (self.questions[650], 'B'))
+        after_wrong = self.rating()
+        self.assertLess(after_wrong, after_correct)
+        # 易しい問題の正解より、難しい問題の正解の方が大きく上がる
+        submit(self.user, (self.questions[300], 'A'))
+        after_easy = self.rating()
+        submit(self.user, (self.questions[900], 'A'))
+        self.assertGreater(self.rating() - after_easy, after_easy - after_wrong)
+
+    def test_selection_respects_range_and_answers(self):
+        # 能力値 (初期値 600) に近い難易度から選ぶ
+        self.assertEqual(select_question_ids(self.user, 1), [self.questions[600].pk])
+        selected = select_question_ids(self.user, 10, min_difficulty=500, max_difficulty=700)
+        self.assertEqual(sorted(selected), sorted(self.questions[d].pk for d in (500, 550, 600, 650, 700)))
+        self.assertEqual(select_question_ids(self.user, 10, part='PART7'), [])
+
+        # 解答済みの問題は選ばない
+        submit(self.user, (self.questions[600], 'A'), (self.questions[650], 'B'))
+        selected = select_question_ids(self.user, 10, min_difficulty=500, max_difficulty=700)
+        self.assertEqual(sorted(selected), sorted(self.questions[d].pk for d in (500, 550, 700)))
+
+    def test_adaptive_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/quiz/', {'mode': 'adaptive', 'min_difficulty': 700, 'max_difficulty': 800})
+        self.assertEqual(
+            sorted(question['id'] for question in response.json()),
+            sorted(self.questions[d].pk for d in (700, 750, 800)),
+        )
+
+
+class CalibrationTests(TestCase):
+    """
+    calibrate_questions の書き戻しと成績集計の整合性
+    """
+
+    def test_recalibrated_band_keeps_stats_consistent(self):
+        user = User.objects.create(username='learner')
+        question = make_question(difficulty_level=300)
+        submit(user, (question, 'A'))
+
+        # b = 3.5 は difficulty_level 1208 → 990 (expert)
+        calibration = Calibration(np.array([question.pk]), np.array([3.5]), np.array([1.2]), np.array([50]), 1)
+        self.assertEqual(save_calibration(calibration), 1)
+        question.refresh_from_db()
+        self.assertEqual(question.difficulty_level, 990)
+        stats = UserStats.objects.get(user=user)
+        self.assertEqual((stats.basic_answered, stats.expert_answered, stats.expert_correct), (0, 1, 1))
+
+        submit(user, (question, 'B'))
+        stats.refresh_from_db()
+        self.assertEqual((stats.expert_answered, stats.expert_correct, stats.total_correct), (1, 0, 0))
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    """
+    管理画面の Result / ReviewItem の一覧で使う件数の推定
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        questions = [make_question(n) for n in range(3)]
+        Result.objects.bulk_create([
+            Result(user=cls.admin, question=question, selected_answer='A', is_correct=True)
+            for question in questions
+        ])
+
+    def test_filtered_changelists(self):
+        self.client.force_login(self.admin)
+        for url in ('/admin/quiz/result/', '/admin/quiz/reviewitem/'):
+            for query in ({'q': 'Question'}, {'user__id__exact': self.admin.pk}):
+                with self.subTest(url=url, query=query):
+                    self.assertEqual(self.client.get(url, query).status_code, 200)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=0)
+    def test_exact_count_without_estimate(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('PostgreSQL では推定値を使う')
+        self.assertIsNone(estimated_count(Result.objects.filter(is_correct=True)))
+        self.assertEqual(EstimatedCountPaginator(Result.objects.filter(is_correct=True), 10).count, 3)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'PostgreSQL のみ')
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=0)
+    def test_estimate_on_postgresql(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE quiz_result')
+        filtered = Result.objects.filter(is_correct=True, question__question_text__icontains='Question')
+        self.assertIsInstance(estimated_count(filtered), int)
+        self.assertIsInstance(estimated_count(Result.objects.all()), (int, type(None)))
+        self.assertEqual(EstimatedCountPaginator(filtered, 10).count, estimated_count(filtered))
+
+
+class ReplicaCacheFillTests(TestCase):
+    """
+    レプリカに振り分けられたリクエストの中でも、共有のキャッシュを作る読み取りはプライマリから行うこと
+    (存在しない接続名をレプリカとして設定し、そこへの読み取りがあればエラーになるようにして確認する)
+    """
+
+    def setUp(self):
+        cache.clear()
+        passage = Passage.objects.create(title='Notice', passage_text='The office will be closed.')
+        self.questions = [make_question(n, passage=passage if n == 0 else None) for n in range(3)]
+        self.token = _read_alias.set('replica-missing')
+
+    def tearDown(self):
+        _read_alias.reset(self.token)
+
+    def test_fragments_and_index_read_from_primary(self):
+        question_ids = [question.pk for question in self.questions]
+        question_sampler.invalidate()
+        self.assertEqual(question_sampler.count(), 3)
+        body = json.loads(questions_payload(question_ids, passages=True))
+        self.assertEqual([question['id'] for question in body['questions']], question_ids)
+        self.assertEqual(body['passages'][0]['passage_text'], 'The office will be closed.')
+
+
+@override_settings(DATABASE_REPLICA_STICKY_SECONDS=10)
+class ReplicaRouterTests(TestCase):
+    """
+    レプリカの選択 (重み)・書き込んだユーザーの固定・書き込みとマイグレーションの振り分け
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='learner')
+        patcher = mock.patch('config.db_router.replica_aliases', return_value=['replica1', 'replica2'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_weighted_choice(self):
+        with override_settings(DATABASE_REPLICA_WEIGHTS=[0, 1]):
+            self.assertEqual({choose_replica() for _ in range(20)}, {'replica2'})
+        random.seed(0)
+        with override_settings(DATABASE_REPLICA_WEIGHTS=[3, 1]):
+            chosen = [choose_replica() for _ in range(4000)]
+        self.assertAlmostEqual(chosen.count('replica1') / len(chosen), 0.75, delta=0.03)
+        with override_settings(DATABASE_REPLICA_WEIGHTS=[]):
+            self.assertEqual({choose_replica() for _ in range(100)}, {'replica1', 'replica2'})
+
+    def test_sticky_window(self):
+        other = User.objects.create(username='other')
+        self.assertIsNotNone(_replica_for(self.user))
+        pin_to_primary(self.user)
+        # 書き込んだユーザーだけが DATABASE_REPLICA_STICKY_SECONDS 秒の間プライマリから読む
+        self.assertIsNone(_replica_for(self.user))
+        self.assertIsNotNone(_replica_for(other))
+        self.assertIsNone(async_to_sync(_areplica_for)(self.user))
+        with mock.patch('time.time', return_value=time.time() + 11):
+            self.assertIsNotNone(_replica_for(self.user))
+
+        async_to_sync(apin_to_primary)(other)
+        self.assertIsNone(_replica_for(other))
+
+    def test_writes_and_migrations_go_to_primary(self):
+        router = ReplicaRouter()
+        token = _read_alias.set('replica2')
+        try:
+            self.assertEqual(router.db_for_read(Result), 'replica2')
+            self.assertEqual(router.db_for_write(Result), 'default')
+        finally:
+            _read_alias.reset(token)
+        self.assertEqual(router.db_for_read(Result), 'default')
+        self.assertTrue(router.allow_migrate('default', 'quiz'))
+        self.assertFalse(router.allow_migrate('replica1', 'quiz'))
+
+    def test_read_from_replica(self):
+        class View:
+            @read_from_replica
+            def get(self, request):
+                return _read_alias.get()
+
+            @read_from_replica
+            async def aget(self, request):
+                return _read_alias.get()
+
+        request = mock.Mock(user=self.user)
+        with mock.patch('config.db_router.choose_replica', return_value='replica1'):
+            self.assertEqual((View().get(request), async_to_sync(View().aget)(request)), ('replica1', 'replica1'))
+            pin_to_primary(self.user)
+            self.assertEqual((View().get(request), async_to_sync(View().aget)(request)), (None, None))
+        # ビューを出た後はプライマリから読む
+        self.assertIsNone(_read_alias.get())
+
+
+class RefreshingSnapshotTests(TestCase):
+    """
+    問題バンクのバージョンと max_age による作り直し (QuestionSampler・AnswerKey・QuestionPacks の基底クラス)
+    """
+
+    class Snapshot(RefreshingSnapshot):
+        max_age_setting = 'TEST_SNAPSHOT_MAX_AGE'
+
+        def __init__(self):
+            super().__init__()
+            self.builds = 0
+
+        def _build(self):
+            self.builds += 1
+            return {'builds': self.builds}
+
+    def setUp(self):
+        cache.clear()
+
+    def test_rebuilds_on_bank_version_and_max_age(self):
+        snapshot = self.Snapshot()
+        self.assertEqual(snapshot._ensure_fresh(), {'builds': 1})
+        self.assertEqual(async_to_sync(snapshot._aensure_fresh)(), {'builds': 1})
+
+        bump_bank_version()
+        self.assertEqual(snapshot._ensure_fresh(), {'builds': 2})
+        snapshot.invalidate()
+        self.assertEqual(async_to_sync(snapshot._aensure_fresh)(), {'builds': 3})
+
+        # max_age はサブクラスの設定名から読む (無ければ default_max_age)
+        self.assertEqual(snapshot.max_age, 300)
+        with override_settings(TEST_SNAPSHOT_MAX_AGE=10):
+            with mock.patch('time.monotonic', return_value=time.monotonic() + 11):
+                self.assertEqual(snapshot._ensure_fresh(), {'builds': 4})
+        self.assertEqual(snapshot._ensure_fresh(), {'builds': 4})
+
+
+class QuestionPackTests(TestCase):
+    """
+    オフライン用の問題パックの内容・バージョン・差分
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.passage = Passage.objects.create(title='Notice', passage_text='The office will be closed.')
+        self.part7 = make_question(1, part='PART7', passage=self.passage)
+        self.part5 = make_question(2)
+        self.packs = QuestionPacks()
+
+    def load(self, part=None, since=None):
+        pack = self.packs.get(part, since=since)
+        return pack.version, json.loads(gzip.decompress(pack.gzip))
+
+    def test_pack_includes_referenced_passages(self):
+        _, body = self.load('PART7')
+        self.assertEqual(body['questions'][0]['passage'], self.passage.pk)
+        self.assertEqual(body['passages'], [{'id': self.passage.pk, 'title': 'Notice', 'passage_text': 'The office will be closed.'}])
+        _, body = self.load('PART5')
+        self.assertEqual(body['passages'], [])
+
+    def test_passage_edit_changes_version_and_delta(self):
+        version, _ = self.load()
+        self.passage.passage_text = 'The office will open late.'
+        self.passage.save()
+
+        new_version, body = self.load(since=version)
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(body['base'], version)
+        self.assertEqual(body['questions'], [])
+        self.assertEqual([passage['passage_text'] for passage in body['passages']], ['The office will open late.'])
+        self.assertEqual(body['deleted_passages'], [])
+
+
+class ContentHashValidationTests(TestCase):
+    """
+    content_hash (フォームに無いユニークな列) の重複を、管理画面のフォームのエラーとして返すこと
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+
+    def test_duplicate_passage(self):
+        Passage.objects.create(title='Notice', passage_text='The office  will be closed.')
+        response = self.client.post('/admin/quiz/passage/add/', {'title': 'Copy', 'passage_text': 'The office will be closed.'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('passage_text', response.context['adminform'].form.errors)
+        self.assertEqual(Passage.objects.count(), 1)
+
+    def question_form(self, **fields):
+        return {
+            'question_text': 'Question 1 ------- text.', 'option_a': 'a', 'option_b': 'b', 'option_c': 'c',
+            'option_d': 'd', 'correct_answer': 'A', 'explanation': '', 'part': 'PART5', 'difficulty_level': 600,
+            **fields,
+        }
+
+    def test_duplicate_question(self):
+        question = make_question(1)
+        response = self.client.post('/admin/quiz/question/add/', self.question_form(question_text='Question 1  ------- text. '))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('question_text', response.context['adminform'].form.errors)
+        self.assertEqual(Question.objects.count(), 1)
+
+        # 自分自身との重複にはならない
+        response = self.client.post(f'/admin/quiz/question/{question.pk}/change/', self.question_form(difficulty_level=700))
+        self.assertEqual(response.status_code, 302)
+
+    def test_same_text_in_another_passage(self):
+        passage = Passage.objects.create(passage_text='The office will be closed.')
+        make_question(1, passage=passage)
+        response = self.client.post('/admin/quiz/question/add/', self.question_form())
+        self.assertEqual(response.status_code, 302)
+
+
+class DuplicateMergeTests(TestCase):
+    """
+    find_duplicate_questions --merge で移す解答履歴
+    """
+
+    def test_merge_moves_latest_answer(self):
+        text = 'The manager asked all employees to submit their expense reports ------- Friday afternoon.'
+        keeper = make_question(question_text=text)
+        first = make_question(question_text=text.upper())
+        second = make_question(question_text=text.replace('.', '!'))
+        user = User.objects.create(username='learner')
+        other = User.objects.create(username='other')
+        submit(other, (keeper, 'A'), (first, 'B'))
+
+        # first の行 (id が小さい) を後から解き直す。UPSERT なので id は変わらない
+        submit(user, (first, 'B'))
+        submit(user, (second, 'C'))
+        submit(user, (first, 'A'))
+        now = timezone.now()
+        Result.objects.filter(user=user, question=second).update(answered_at=now - datetime.timedelta(hours=1))
+        Result.objects.filter(user=user, question=first).update(answered_at=now)
+
+        call_command('find_duplicate_questions', '--merge', stdout=io.StringIO())
+
+        self.assertEqual(list(Question.objects.values_list('id', flat=True)), [keeper.pk])
+        result = Result.objects.get(user=user)
+        self.assertEqual((result.question_id, result.selected_answer, result.is_correct), (keeper.pk, 'A', True))
+        self.assertEqual(ReviewItem.objects.get(user=user).question_id, keeper.pk)
+        # 残す問題に解答済みのユーザーの履歴はそのまま
+        self.assertEqual(Result.objects.get(user=other).selected_answer, 'A')
+
+
+class LeaderboardTests(TestCase):
+    """
+    解答送信時のランキングの差分更新と rebuild_leaderboard
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='learner')
+        self.question = make_question()
+        self.this_week = week_board()
+        self.last_week = week_board(timezone.now() - datetime.timedelta(weeks=1))
+
+    def scores(self):
+        rows = LeaderboardEntry.objects.filter(user=self.user).values_list('board', 'answered', 'correct')
+        return {board: (answered, correct) for board, answered, correct in rows}
+
+    def answer_last_week(self, answer):
+        # 先週に解答したものとして、解答日時とランキングの行を1週間前に移す
+        submit(self.user, (self.question, answer))
+        answered_at = timezone.now() - datetime.timedelta(weeks=1)
+        Result.objects.filter(user=self.user).update(answered_at=answered_at)
+        AnswerLog.objects.filter(user=self.user).update(answered_at=answered_at)
+        LeaderboardEntry.objects.filter(user=self.user, board=self.this_week).update(board=self.last_week)
+
+    def test_reanswer_in_same_week_changes_correct_only(self):
+        submit(self.user, (self.question, 'A'))
+        submit(self.user, (self.question, 'B'))
+        self.assertEqual(self.scores(), {GLOBAL_BOARD: (1, 0), self.this_week: (1, 0)})
+
+    def test_reanswer_leaves_closed_week_unchanged(self):
+        self.answer_last_week('A')
+        submit(self.user, (self.question, 'B'))
+        expected = {GLOBAL_BOARD: (1, 0), self.last_week: (1, 1), self.this_week: (1, 0)}
+        self.assertEqual(self.scores(), expected)
+
+        # 作り直しても解答送信時の差分と同じ集計になる
+        call_command('rebuild_leaderboard', stdout=io.StringIO())
+        self.assertEqual(self.scores(), expected)
+
+    def test_rebuild_keeps_weeks_without_answer_log(self):
+        self.answer_last_week('A')
+        # 先週の月を AnswerLog から切り離した後に解き直した場合
+        AnswerLog.objects.all().delete()
+        submit(self.user, (self.question, 'A'))
+        call_command('rebuild_leaderboard', stdout=io.StringIO())
+        self.assertEqual(
+            self.scores(), {GLOBAL_BOARD: (1, 1), self.last_week: (1, 1), self.this_week: (1, 1)}
+        )
+
+
+class AnswerArchiveTests(TestCase):
+    """
+    古い月の解答ログの集約・書き出し・切り離し (quiz.partitions / manage.py archive_answers。SQLite ではパーティションを使わない)
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='learner')
+        self.questions = [make_question(n) for n in range(2)]
+        self.month = datetime.date(2026, 1, 1)
+        start, _ = month_range(self.month)
+        self.logs = AnswerLog.objects.bulk_create([
+            AnswerLog(user=self.user, question=self.questions[0], selected_answer='B', is_correct=False, answered_at=start),
+            AnswerLog(
+                user=self.user, question=self.questions[0], selected_answer='A', is_correct=True,
+                answered_at=start + datetime.timedelta(days=3),
+            ),
+            AnswerLog(
+                user=self.user, question=self.questions[1], selected_answer='A', is_correct=True,
+                answered_at=start + datetime.timedelta(days=40),
+            ),
+        ])
+
+    def test_closed_months(self):
+        now = datetime.datetime(2026, 4, 15, tzinfo=datetime.timezone.utc)
+        self.assertEqual(closed_months(3, now=now), [self.month])
+        self.assertEqual(closed_months(2, now=now), [self.month, datetime.date(2026, 2, 1)])
+
+    def test_rollup_is_idempotent(self):
+        self.assertTrue(rollup_month(self.month))
+        rollup = AnswerRollup.objects.get(user=self.user, question=self.questions[0])
+        self.assertEqual((rollup.attempts, rollup.correct), (2, 1))
+        self.assertEqual((rollup.first_answered_at, rollup.last_answered_at), (self.logs[0].answered_at, self.logs[1].answered_at))
+        self.assertFalse(AnswerRollup.objects.filter(question=self.questions[1]).exists())
+        self.assertEqual(AnswerArchive.objects.get(month=self.month).rows, 2)
+
+        # 集約済みの月をもう一度集約しても加算しない
+        self.assertFalse(rollup_month(self.month))
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.attempts, rollup.correct), (2, 1))
+
+        # 次の月は既存の集計に加算する
+        self.assertTrue(rollup_month(datetime.date(2026, 2, 1)))
+        self.assertEqual(AnswerRollup.objects.get(question=self.questions[1]).attempts, 1)
+
+    def test_export(self):
+        rollup_month(self.month)
+        with tempfile.TemporaryDirectory() as directory:
+            path = export_month(self.month, directory)
+            self.assertEqual(path.name, 'answerlog-2026-01.csv.gz')
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                header, *rows = csv.reader(f)
+            # 書き出し中の一時ファイルは残さない
+            self.assertEqual(os.listdir(directory), [path.name])
+        self.assertEqual(header, ['id', 'user_id', 'question_id', 'selected_answer', 'is_correct', 'answered_at'])
+        self.assertEqual(sorted(rows), [
+            [str(log.id), str(self.user.pk), str(log.question_id), log.selected_answer, str(log.is_correct),
+             log.answered_at.astimezone(datetime.timezone.utc).isoformat()]
+            for log in self.logs[:2]
+        ])
+        self.assertEqual(AnswerArchive.objects.get(month=self.month).exported_to, str(path))
+
+    def test_detach_requires_rollup(self):
+        with self.assertRaises(ValueError):
+            detach_month(self.month)
+        AnswerArchive.objects.create(month=self.month)
+        with self.assertRaises(ValueError):
+            detach_month(self.month)
+        self.assertEqual(AnswerLog.objects.count(), 3)
+
+        rollup_month(self.month)
+        self.assertIsNone(detach_month(self.month, batch_size=1))
+        self.assertEqual(list(AnswerLog.objects.values_list('id', flat=True)), [self.logs[2].id])
+        self.assertIsNotNone(AnswerArchive.objects.get(month=self.month).detached_at)
+
+    def test_command(self):
+        now = datetime.datetime(2026, 4, 15, tzinfo=datetime.timezone.utc)
+        with tempfile.TemporaryDirectory() as directory, mock.patch('django.utils.timezone.now', return_value=now):
+            call_command('archive_answers', '--keep-months=2', f'--export={directory}', '--detach', stdout=io.StringIO())
+            self.assertEqual(sorted(os.listdir(directory)), ['answerlog-2026-01.csv.gz', 'answerlog-2026-02.csv.gz'])
+        self.assertFalse(AnswerLog.objects.exists())
+        self.assertEqual(
+            sorted(AnswerRollup.objects.values_list('question_id', 'attempts', 'correct')),
+            [(self.questions[0].pk, 2, 1), (self.questions[1].pk, 1, 1)],
+        )
+        # 2回目は対象の月が無い
+        output = io.StringIO()
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            call_command('archive_answers', '--keep-months=2', '--dry-run', stdout=output)
+        self.assertIn('0 か月', output.getvalue())
+
+
+class RecordSubmissionsTests(TestCase):
+    """
+    スプールから保存する record_submissions の冪等性
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='learner')
+        self.questions = [make_question(n) for n in range(2)]
+
+    def submission(self, user_id, *answers, minutes=0):
+        submitted_at = timezone.now() + datetime.timedelta(minutes=minutes)
+        return Submission(uuid.uuid4(), user_id, submitted_at, [
+            (question.pk, answer, answer == question.correct_answer) for question, answer in answers
+        ])
+
+    def test_replayed_submissions_are_skipped(self):
+        # 1つのファイルに同じユーザーの送信が複数あり、同じ問題は後の送信が優先される
+        segment = [
+            self.submission(self.user.pk, (self.questions[1], 'A'), minutes=1),
+            self.submission(self.user.pk, (self.questions[0], 'A'), (self.questions[1], 'B')),
+        ]
+        self.assertEqual(record_submissions(segment), 2)
+        # 保存中に止まったファイルをもう一度保存しても変わらない
+        self.assertEqual(record_submissions(segment), 0)
+        # 一部だけ保存済みの場合は残りだけを保存する
+        later = self.submission(self.user.pk, (self.questions[0], 'B'), minutes=2)
+        self.assertEqual(record_submissions([*segment, later]), 1)
+
+        results = dict(Result.objects.filter(user=self.user).values_list('question_id', 'selected_answer'))
+        self.assertEqual(results, {self.questions[0].pk: 'B', self.questions[1].pk: 'A'})
+        self.assertEqual(AnswerLog.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(SubmissionReceipt.objects.count(), 3)
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.total_answered, stats.total_correct), (2, 1))
+
+    def test_deleted_user_and_question(self):
+        deleted_user = User.objects.create(username='deleted')
+        deleted_question = make_question(2)
+        segment = [
+            self.submission(deleted_user.pk, (self.questions[0], 'A')),
+            self.submission(self.user.pk, (self.questions[0], 'A'), (deleted_question, 'A')),
+        ]
+        deleted_user.delete()
+        deleted_question.delete()
+
+        self.assertEqual(record_submissions(segment), 2)
+        self.assertEqual(list(Result.objects.values_list('user_id', 'question_id')), [(self.user.pk, self.questions[0].pk)])
+        # 保存できなかった送信も記録し、もう一度保存しようとはしない
+        self.assertEqual(SubmissionReceipt.objects.count(), 2)
+        self.assertEqual(record_submissions(segment), 0)
+
+
+class SubmissionSpoolTests(TestCase):
+    """
+    スプールのファイルの保存 (drain) と、止まったプロセスのファイルの回収 (recover)
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.spool = SubmissionSpool(directory.name)
+        # 保存用のスレッドは起動せず、rotate() / drain() を直接呼ぶ
+        self.spool._flusher_pid = os.getpid()
+        self.user = User.objects.create(username='learner')
+        self.question = make_question()
+
+    def append(self, answer='A'):
+        return self.spool.append(self.user.pk, [Result(
+            user=self.user, question=self.question, selected_answer=answer,
+            is_correct=answer == 'A', answered_at=timezone.now(),
+        )])
+
+    def segment(self, name, age=3600):
+        path = self.directory / name
+        path.write_bytes(b'')
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        return process.pid
+
+    @override_settings(SUBMIT_SPOOL_FSYNC=False)
+    def test_drain_retries_failed_segment(self):
+        self.append('B')
+        self.append('A')
+        self.spool.rotate(force=True)
+
+        with mock.patch('quiz.spool.record_submissions', side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                self.spool.drain()
+        # DBに接続できないときは保存待ちに戻して例外を送出する
+        self.assertEqual([path.suffix for path in self.directory.iterdir()], [READY])
+
+        self.assertEqual(self.spool.drain(), (1, 2))
+        self.assertEqual(list(self.directory.iterdir()), [])
+        self.assertEqual(Result.objects.get(user=self.user).selected_answer, 'A')
+
+    @override_settings(SUBMIT_SPOOL_FSYNC=False, SUBMIT_SPOOL_MAX_ATTEMPTS=2)
+    def test_failing_segment_does_not_block_later_segments(self):
+        self.append('B')
+        self.spool.rotate(force=True)
+        poisoned, = self.directory.iterdir()
+        self.append('A')
+        self.spool.rotate(force=True)
+
+        def record(submissions):
+            # 'B' の送信は保存できない (列に収まらない値を想定)
+            if submissions[0].answers[0][1] == 'B':
+                raise DataError
+            return record_submissions(submissions)
+
+        with mock.patch('quiz.spool.record_submissions', side_effect=record), self.assertLogs('quiz.spool', 'ERROR'):
+            # 1回目は保存待ちに戻し、後のファイルは保存する
+            self.assertEqual(self.spool.drain(), (1, 1))
+            self.assertEqual(list(self.directory.iterdir()), [poisoned])
+            # 2回目で .failed に移す
+            self.assertEqual(self.spool.drain(), (0, 0))
+        self.assertEqual(list(self.directory.iterdir()), [poisoned.with_suffix(FAILED)])
+        self.assertEqual(Result.objects.get(user=self.user).selected_answer, 'A')
+
+    @override_settings(SUBMIT_SPOOL_FSYNC=False)
+    def test_spool_skips_malformed_answers(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        other = make_question(1)
+        with override_settings(SUBMIT_SPOOL_DIR=str(self.directory)), mock.patch('quiz.spool.submission_spool', self.spool):
+            response = client.post('/api/quiz/submit/', [
+                {'question_id': self.question.pk, 'selected_answer': 'AB'},
+                {'question_id': self.question.pk, 'selected_answer': {'A': 1}},
+                {'question_id': self.question.pk, 'selected_answer': 'x' * 1000},
+                {'question_id': True, 'selected_answer': 'A'},
+                'A',
+                {'question_id': other.pk, 'selected_answer': 'C'},
+            ], format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual([result['question']['id'] for result in response.json()['results']], [other.pk])
+
+        self.spool.rotate(force=True)
+        self.assertEqual(self.spool.drain(), (1, 1))
+        self.assertEqual(list(Result.objects.values_list('question_id', 'selected_answer')), [(other.pk, 'C')])
+
+    def test_recover_skips_live_processes(self):
+        live = self.segment(f'{time.time_ns():020d}-{os.getpid()}-0{OPEN}')
+        draining = self.segment(f'{time.time_ns():020d}-{os.getpid()}-1.{os.getpid()}{DRAINING}')
+        fresh = self.segment(f'{time.time_ns():020d}-{self.dead_pid()}-2{OPEN}', age=0)
+        self.assertEqual(self.spool.recover(), 0)
+        self.assertTrue(live.exists() and draining.exists() and fresh.exists())
+
+    def test_recover_moves_dead_processes_segments(self):
+        pid = self.dead_pid()
+        self.segment(f'00000000000000000001-{pid}-0{OPEN}')
+        self.segment(f'00000000000000000002-{os.getpid()}-1.{pid}{DRAINING}')
+        # pid の無い以前の形式のファイルは更新日時だけで判定する
+        self.segment(f'00000000000000000003-{pid}-2{DRAINING}')
+        self.assertEqual(self.spool.recover(), 3)
+        self.assertEqual(sorted(path.name for path in self.directory.iterdir()), [
+            f'00000000000000000001-{pid}-0{READY}',
+            f'00000000000000000002-{os.getpid()}-1{READY}',
+            f'00000000000000000003-{pid}-2{READY}',
+        ])
+
+
+class SaveResultsTests(TestCase):
+    """
+    解答の一括 UPSERT (save_results)
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='learner')
+        self.questions = [make_question(n) for n in range(5)]
+
+    def test_last_answer_wins(self):
+        question = self.questions[0]
+        saved = submit(self.user, (question, 'B'), (self.questions[1], 'A'), (question, 'A'))
+        # 同じ問題への重複した解答は最後のものが保存され、戻り値は引数と同じ順序・長さ
+        self.assertEqual(len(saved), 3)
+        self.assertEqual(saved[0].pk, saved[2].pk)
+        result = Result.objects.get(user=self.user, question=question)
+        self.assertEqual((result.selected_answer, result.is_correct), ('A', True))
+
+        # 解き直しは同じ行を上書きする
+        resaved, = submit(self.user, (question, 'C'))
+        self.assertEqual(resaved.pk, result.pk)
+        self.assertEqual(Result.objects.get(pk=result.pk).selected_answer, 'C')
+        self.assertEqual(Result.objects.filter(user=self.user).count(), 2)
+
+    def test_query_count_does_not_depend_on_answers(self):
+        submit(self.user, (self.questions[0], 'A'))
+        with CaptureQueriesContext(connection) as one:
+            submit(self.user, (self.questions[1], 'A'))
+        with CaptureQueriesContext(connection) as many:
+            submit(self.user, *((question, 'B') for question in self.questions))
+        self.assertEqual(len(one), len(many))
+        inserts = [query for query in many.captured_queries if query['sql'].startswith('INSERT INTO "quiz_result"')]
+        self.assertEqual(len(inserts), 1)
+
+
+class RecordResultsTests(TestCase):
+    """
+    集計の更新を含めた record_results のトランザクション
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='learner')
+
+    def test_updates_are_one_transaction(self):
+        question = make_question()
+        # 最後の更新 (ランキング) で失敗すると、Result も含めて何も保存されない
+        with mock.patch('quiz.grading.update_leaderboards', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                submit(self.user, (question, 'A'))
+        for model in (Result, AnswerLog, UserStats, ReviewItem, UserAbility, LeaderboardEntry):
+            self.assertFalse(model.objects.filter(user=self.user).exists(), model.__name__)
+
+        submit(self.user, (question, 'A'))
+        for model in (Result, AnswerLog, UserStats, ReviewItem, UserAbility, LeaderboardEntry):
+            self.assertTrue(model.objects.filter(user=self.user).exists(), model.__name__)
+
+
+class UserStatsAPITests(TestCase):
+    """
+    /api/stats/ の成績集計と rebuild_user_stats
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='learner')
+
+    def test_stats_api_matches_rebuild(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/stats/').json()['total_answered'], 0)
+
+        submit(self.user, (make_question(0, difficulty_level=300), 'A'), (make_question(1, part='PART7'), 'B'))
+        body = client.get('/api/stats/').json()
+        self.assertEqual((body['total_answered'], body['total_correct'], body['accuracy']), (2, 1, 0.5))
+        self.assertEqual(body['parts']['PART7'], {'answered': 1, 'correct': 0, 'accuracy': 0.0})
+        self.assertEqual(body['difficulty_bands']['basic']['correct'], 1)
+        self.assertEqual(body['current_streak'], 1)
+
+        # Result から作り直しても同じ集計になる
+        call_command('rebuild_user_stats', stdout=io.StringIO())
+        self.assertEqual(client.get('/api/stats/').json(), body)
+
+    def test_rebuild_streak_counts_reanswered_days(self):
+        question = make_question()
+        today = timezone.now()
+        # 同じ問題を3日続けて解き直す (Result には最後の日だけが残る)
+        for days_ago in (2, 1, 0):
+            answered_at = today - datetime.timedelta(days=days_ago)
+            record_submissions([Submission(uuid.uuid4(), self.user.pk, answered_at, [(question.pk, 'A', True)])])
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.current_streak, stats.longest_streak), (3, 3))
+
+        UserStats.objects.filter(user=self.user).update(current_streak=0, longest_streak=0)
+        call_command('rebuild_user_stats', stdout=io.StringIO())
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.current_streak, stats.longest_streak, stats.last_active_date), (3, 3, timezone.localdate(today)))
+
+
+class GradedSubmitTests(TestCase):
+    """
+    /api/quiz/submit/?graded=1 が返す採点結果
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='learner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.passage = Passage.objects.create(title='Notice', passage_text='The office will be closed on Monday.')
+        self.questions = [make_question(0), make_question(1, part='PART7', passage=self.passage)]
+
+    def post(self, query):
+        answers = [
+            {'question_id': self.questions[0].pk, 'selected_answer': 'A'},
+            {'question_id': self.questions[1].pk, 'selected_answer': 'C'},
+        ]
+        response = self.client.post(f'/api/quiz/submit/?{query}', answers, format='json')
+        self.assertEqual(response.status_code, 201)
+        return json.loads(response.content)
+
+    def serialized(self, result_ids):
+        results = [Result.objects.get(pk=result_id) for result_id in result_ids]
+        return json.loads(JSONRenderer().render(ResultSerializer(results, many=True).data))
+
+    def test_graded_results_match_results_api(self):
+        body = self.post('graded=1')
+        self.assertEqual(body['results'], self.serialized(body['result_ids']))
+        self.assertEqual([result['is_correct'] for result in body['results']], [True, False])
+        # /api/results/ を呼び直した場合と同じ内容
+        ids = ','.join(map(str, body['result_ids']))
+        self.assertEqual(body['results'], json.loads(self.client.get(f'/api/results/?ids={ids}').content))
+        self.assertEqual(body['results'], json.loads(results_payload(Result.objects.order_by('id'))))
+
+    def test_graded_results_with_passages(self):
+        body = self.post('graded=1&passages=1')
+        self.assertEqual(body['results']['results'], self.serialized(body['result_ids']))
+        passages = json.loads(JSONRenderer().render(PassageSerializer([self.passage], many=True).data))
+        self.assertEqual(body['results']['passages'], passages)
+
+
+class AsyncViewTests(TestCase):
+    """
+    /api/async/ の非同期版のビュー (JWT 認証と、同期版のビューと同じ応答)
+    """
+
+    def setUp(self):
+        cache.clear()
+        question_sampler.invalidate()
+        self.user = User.objects.create(username='learner')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        self.passage = Passage.objects.create(title='Notice', passage_text='The office will be closed on Monday.')
+        self.questions = [make_question(0), make_question(1, part='PART7', passage=self.passage)]
+        self.answers = [
+            {'question_id': self.questions[0].pk, 'selected_answer': 'A'},
+            {'question_id': self.questions[1].pk, 'selected_answer': 'C'},
+        ]
+
+    def submit(self, path):
+        return self.client.post(path, json.dumps(self.answers), content_type='application/json', **self.auth)
+
+    def test_requires_token(self):
+        for path in ('/api/async/quiz/', '/api/async/results/?ids=1'):
+            for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer invalid'}):
+                response = self.client.get(path, **headers)
+                self.assertEqual(response.status_code, 401, (path, headers))
+                self.assertTrue(response['WWW-Authenticate'].startswith('Bearer'))
+        response = self.client.post('/api/async/quiz/submit/', json.dumps(self.answers), content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Result.objects.exists())
+
+    def test_quiz_matches_sync_view(self):
+        for query in ('', 'passages=1', 'part=PART7&passages=1'):
+            sync_body = json.loads(self.client.get(f'/api/quiz/?{query}', **self.auth).content)
+            async_body = json.loads(self.client.get(f'/api/async/quiz/?{query}', **self.auth).content)
+            # 出題順はランダムなので ID 順で比べる
+            if 'questions' in sync_body:
+                sync_body['questions'].sort(key=lambda question: question['id'])
+                async_body['questions'].sort(key=lambda question: question['id'])
+            else:
+                sync_body.sort(key=lambda question: question['id'])
+                async_body.sort(key=lambda question: question['id'])
+            self.assertEqual(async_body, sync_body, query)
+
+    def test_results_match_sync_view(self):
+        body = json.loads(self.submit('/api/async/quiz/submit/').content)
+        ids = ','.join(map(str, body['result_ids']))
+        for query in (f'ids={ids}', f'ids={ids}&passages=1'):
+            self.assertEqual(
+                self.client.get(f'/api/async/results/?{query}', **self.auth).content,
+                self.client.get(f'/api/results/?{query}', **self.auth).content,
+            )
+        self.assertEqual(self.client.get('/api/async/results/?ids=x', **self.auth).status_code, 400)
+
+    def test_graded_submit(self):
+        response = self.submit('/api/async/quiz/submit/?graded=1&passages=1')
+        self.assertEqual(response.status_code, 201)
+        body = json.loads(response.content)
+        ids = ','.join(map(str, body['result_ids']))
+        self.assertEqual(body['results'], json.loads(self.client.get(f'/api/results/?ids={ids}&passages=1', **self.auth).content))
+        self.assertEqual([result['is_correct'] for result in body['results']['results']], [True, False])
+        self.assertEqual(UserStats.objects.get(user=self.user).total_answered, 2)
+
+    @override_settings(SUBMIT_SPOOL_FSYNC=False)
+    def test_spooled_submit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spool = SubmissionSpool(directory)
+            spool._flusher_pid = os.getpid()
+            with override_settings(SUBMIT_SPOOL_DIR=directory), mock.patch('quiz.spool.submission_spool', spool):
+                response = self.submit('/api/async/quiz/submit/')
+            self.assertEqual(response.status_code, 202)
+            body = json.loads(response.content)
+            self.assertTrue(body['submission_id'])
+            self.assertEqual([result['is_correct'] for result in body['results']], [True, False])
+            self.assertFalse(Result.objects.exists())
+
+            spool.rotate(force=True)
+            self.assertEqual(spool.drain(), (1, 1))
+        # 保存後の /api/results/ は、id 以外は応答と同じ
+        saved = json.loads(results_payload(Result.objects.order_by('id')))
+        self.assertEqual([{**result, 'id': None} for result in saved], body['results'])
+
+
+class ReviewScheduleTests(TestCase):
+    """
+    SM-2 の復習スケジュールと /api/quiz/review/
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='learner')
+        self.questions = [make_question(n) for n in range(3)]
+
+    def test_schedule(self):
+        now = timezone.now()
+        ease, interval, repetitions, next_due = schedule(INITIAL_EASE, 0, 0, True, now)
+        self.assertEqual((interval, repetitions, next_due), (1, 1, now + datetime.timedelta(days=1)))
+        ease, interval, repetitions, _ = schedule(ease, interval, repetitions, True, now)
+        self.assertEqual((interval, repetitions), (6, 2))
+        _, interval, repetitions, _ = schedule(ease, interval, repetitions, True, now)
+        self.assertEqual((interval, repetitions), (round(6 * ease), 3))
+
+        # 間違えると覚え直し (易しさ係数は下がり、すぐにもう一度出題する)
+        wrong_ease, interval, repetitions, next_due = schedule(ease, interval, repetitions, False, now)
+        self.assertLess(wrong_ease, ease)
+        self.assertEqual((interval, repetitions, next_due), (0, 0, now + RELEARN_DELAY))
+
+    def test_due_questions_in_due_order(self):
+        now = timezone.now()
+        submit(self.user, (self.questions[0], 'A'), (self.questions[1], 'B'))
+        submit(self.user, (self.questions[2], 'B'))
+        ReviewItem.objects.filter(question=self.questions[2]).update(next_due=now)
+
+        self.assertEqual(due_question_ids(self.user, now=now), [self.questions[2].pk])
+        later = now + RELEARN_DELAY + datetime.timedelta(seconds=1)
+        self.assertEqual(due_question_ids(self.user, now=later), [self.questions[2].pk, self.questions[1].pk])
+        tomorrow = now + datetime.timedelta(days=1, minutes=1)
+        self.assertEqual(len(due_question_ids(self.user, now=tomorrow)), 3)
+        self.assertEqual(due_question_ids(self.user, k=1, now=tomorrow), [self.questions[2].pk])
+
+    def test_review_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(json.loads(client.get('/api/quiz/review/').content), [])
+
+        submit(self.user, (self.questions[0], 'A'), (self.questions[1], 'B'))
+        ReviewItem.objects.filter(question=self.questions[1]).update(next_due=timezone.now())
+        body = json.loads(client.get('/api/quiz/review/').content)
+        self.assertEqual([question['id'] for question in body], [self.questions[1].pk])
+        self.assertNotIn('correct_answer', body[0])
+
+
+class ExportTests(TestCase):
+    """
+    export_data / 管理画面のダウンロードと import_questions の往復
+    """
+    QUESTION_FIELDS = [
+        'question_text', 'option_a', 'option_b', 'option_c', 'option_d',
+        'correct_answer', 'explanation', 'part', 'difficulty_level', 'passage__title', 'passage__passage_text',
+    ]
+
+    def setUp(self):
+        passage = Passage.objects.create(title='Notice', passage_text='The office will be closed on Monday, "October" 20.')
+        make_question(0, explanation='説明, カンマと\n改行を含む')
+        make_question(1, part='PART7', passage=passage, difficulty_level=750, explanation='')
+        make_question(2, part='PART7', passage=passage, correct_answer='D', explanation='')
+
+    def questions(self):
+        return list(Question.objects.order_by('question_text').values_list(*self.QUESTION_FIELDS))
+
+    def test_questions_round_trip(self):
+        expected = self.questions()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'questions.csv.gz')
+            call_command('export_data', 'questions', '--gzip', '--chunk-size', '2', '-o', path, stdout=io.StringIO())
+
+            # 同じDBに取り込み直しても変わらない
+            call_command('import_questions', path, stdout=io.StringIO())
+            self.assertEqual(self.questions(), expected)
+            self.assertEqual(Passage.objects.count(), 1)
+
+            # 空のDBに取り込むと同じ問題と長文ができる
+            Question.objects.all().delete()
+            Passage.objects.all().delete()
+            call_command('import_questions', path, stdout=io.StringIO())
+        self.assertEqual(self.questions(), expected)
+        self.assertEqual(Passage.objects.count(), 1)
+
+    def test_results_jsonl_download(self):
+        user = User.objects.create(username='learner')
+        question = Question.objects.order_by('id').first()
+        submit(user, (question, 'B'))
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+
+        response = self.client.get('/admin/export/results/?format=jsonl&gzip=1')
+        self.assertEqual(response.status_code, 200)
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8').splitlines()
+        row = json.loads(lines[0])
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(
+            (row['user__username'], row['question_id'], row['selected_answer'], row['is_correct']),
+            ('learner', question.pk, 'B', False),
+        )
+        # 指定した日時より後の解答が無ければ空
+        response = self.client.get('/admin/export/results/?format=jsonl&since=2999-01-01')
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+
+class ImportQuestionsTests(TestCase):
+    """
+    import_questions のチャンクごとの取り込み・件数の表示・--dry-run・--dedupe
+    """
+    HEADER = [
+        'question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer', 'explanation', 'part',
+        'difficulty_level', 'passage_key', 'passage_title', 'passage_text',
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'questions.csv')
+        self.existing = make_question(0, explanation='')
+        self.unchanged = make_question(2, explanation='')
+
+    def write(self, *rows):
+        with open(self.path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.HEADER)
+            for row in rows:
+                writer.writerow(row)
+
+    def row(self, text, correct='A', passage=('', '', ''), options=('a', 'b', 'c', 'd')):
+        return [text, *options, correct, '', 'PART7' if passage[0] else 'PART5', 600, *passage]
+
+    def run_import(self, *args):
+        output = io.StringIO()
+        call_command('import_questions', self.path, *args, stdout=output)
+        return output.getvalue()
+
+    def sample_rows(self):
+        return [
+            self.row(self.unchanged.question_text),  # 変更なし
+            self.row('Question 1 ------- text.'),
+            self.row('Question 1 ------- text.', correct='B'),  # 同じチャンク内の重複 (後の行を採用)
+            self.row(self.existing.question_text, correct='C'),  # 既存の問題の更新
+            self.row('What is closed?', passage=('notice', 'Notice', 'The office will be closed.')),
+            self.row('When does it reopen?', passage=('notice', '', '')),  # 次のチャンクの同じ長文
+        ]
+
+    def test_chunked_import_counts_every_row(self):
+        self.write(*self.sample_rows())
+        output = self.run_import('--batch-size=4')
+        for line in ('新規作成: 3 件', '更新: 1 件', '変更なし: 1 件', 'CSV 内の重複 (後の行を採用): 1 件', '長文: 1 件'):
+            self.assertIn(line, output)
+        self.assertEqual(Question.objects.get(question_text='Question 1 ------- text.').correct_answer, 'B')
+        self.assertEqual(Question.objects.get(pk=self.existing.pk).correct_answer, 'C')
+        passage, = Passage.objects.all()
+        self.assertEqual(passage.questions.count(), 2)
+
+    def test_dry_run_writes_nothing(self):
+        self.write(*self.sample_rows())
+        before = list(Question.objects.values_list('id', 'correct_answer'))
+        output = self.run_import('--batch-size=4', '--dry-run')
+        self.assertIn('[dry-run] 新規作成: 3 件', output)
+        self.assertIn('[dry-run] 長文: 1 件', output)
+        self.assertEqual(list(Question.objects.values_list('id', 'correct_answer')), before)
+        self.assertFalse(Passage.objects.exists())
+
+    def test_failed_chunk_leaves_no_passages(self):
+        self.write(self.row('What is closed?', passage=('notice', 'Notice', 'The office will be closed.')))
+        with mock.patch('quiz.management.commands.import_questions.regroup_user_stats', side_effect=RuntimeError):
+            with self.assertRaises(CommandError):
+                self.run_import()
+        self.assertFalse(Passage.objects.exists())
+        self.assertEqual(Question.objects.count(), 2)
+
+    def test_dedupe(self):
+        self.write(
+            self.row('Question 0 ------- text!!'),  # 既存の問題と句読点だけ違う
+            self.row('A brand new ------- question.', options=('w', 'x', 'y', 'z')),
+            self.row('A brand-new ------- question', options=('w', 'x', 'y', 'z')),  # 先の行とほぼ同じ
+        )
+        output = self.run_import('--dedupe', '-v', '2')
+        self.assertIn('ほぼ同じ問題があるため除外: 2 件', output)
+        self.assertIn('2 行目はほぼ同じ問題があるため取り込みません', output)
+        self.assertEqual(
+            sorted(Question.objects.values_list('question_text', flat=True)),
+            ['A brand new ------- question.', 'Question 0 ------- text.', 'Question 2 ------- text.'],
+        )
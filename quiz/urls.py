@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views  
+from . import async_views, views  
 
 app_name = 'quiz'
 
@@ -11,8 +11,22 @@ urlpatterns = [
     # 変更後:
     path('api/quiz/', views.QuizAPIView.as_view(), name='quiz_api'),
     
+    # 復習クイズ取得API (GET)
+    path('api/quiz/review/', views.ReviewQuizAPIView.as_view(), name='quiz_review_api'),
+    # オフライン用の問題パック (GET)
+    path('api/quiz/pack/', views.QuizPackAPIView.as_view(), name='quiz_pack_api'),
+
     # 採点API (POST)
     path('api/quiz/submit/', views.QuizSubmitAPIView.as_view(), name='quiz_submit_api'),
     # 結果取得API (GET)
     path('api/results/', views.QuizResultAPIView.as_view(), name='quiz_result_api'),
+    # 成績集計API (GET)
+    path('api/stats/', views.UserStatsAPIView.as_view(), name='user_stats_api'),
+    # ランキングAPI (GET)
+    path('api/leaderboard/', views.LeaderboardAPIView.as_view(), name='leaderboard_api'),
+
+    # 非同期版 (ASGI: uvicorn で動かす場合に使う。レスポンスは上の API と同じ)
+    path('api/async/quiz/', async_views.AsyncQuizView.as_view(), name='async_quiz_api'),
+    path('api/async/quiz/submit/', async_views.AsyncQuizSubmitView.as_view(), name='async_quiz_submit_api'),
+    path('api/async/results/', async_views.AsyncQuizResultView.as_view(), name='async_quiz_result_api'),
 ]
\ No newline at end of file
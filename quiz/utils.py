@@ -0,0 +1,10 @@
+import itertools
+
+
+def chunked(iterable, size):
+    """
+    iterable を size 件ずつのリストに分けて返す (全件をメモリに載せない)
+    """
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
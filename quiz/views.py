@@ -1,14 +1,83 @@
+import json
+
 from django.views.generic import TemplateView, ListView
-from .models import Question, Result
+from .models import LeaderboardEntry, Question, Result, UserStats
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotModified, StreamingHttpResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
 from django.db.models import Case, When
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .serializers import QuestionSerializer, ResultSerializer
+from .serializers import UserStatsSerializer
+from .sampling import question_sampler
+from .grading import grade_answers, record_results
+from .adaptive import select_question_ids
+from .review import due_question_ids
+from .leaderboard import GLOBAL_BOARD, METRICS, accuracy, is_board, leaderboard, week_board
+from .payloads import json_array, questions_payload, results_payload
+from .packs import question_packs
+from .spool import spool_answers, spool_enabled
+from config.db_router import pin_to_primary, read_from_replica
+from .export import CONTENT_TYPES, EXPORTS, FORMATS, export_chunks, export_filename, parse_since
+
+# 1回のクイズで出題する問題数
+QUIZ_SIZE = 10
+
+# ランキングで返す上位の件数の上限
+LEADERBOARD_MAX_LIMIT = 100
+
+
+def _int_or_none(value):
+    """
+    クエリパラメータを整数に変換する (未指定・空文字なら None)
+    """
+    if value in (None, ''):
+        return None
+    return int(value)
+
+
+def parse_quiz_params(params):
+    """
+    クイズ取得APIのクエリパラメータを検証し、(mode, 絞り込み条件の dict) を返す
+    不正な値があればエラーメッセージ付きの ValueError を送出する
+    """
+    mode = params.get('mode', 'random')
+    if mode not in ('random', 'adaptive'):
+        raise ValueError("出題モードの指定が不正です。")
+
+    part = params.get('part') or None
+    if part is not None and part not in dict(Question.PART_CHOICES):
+        raise ValueError("パートの指定が不正です。")
+
+    try:
+        min_difficulty = _int_or_none(params.get('min_difficulty'))
+        max_difficulty = _int_or_none(params.get('max_difficulty'))
+    except ValueError:
+        raise ValueError("難易度の指定が不正です。")
+
+    return mode, {'part': part, 'min_difficulty': min_difficulty, 'max_difficulty': max_difficulty}
+
+
+def spooled_payload(submission_id, payload):
+    """
+    スプールに追記した解答送信の応答 ({"submission_id": ..., "results": [...]}。results の各 id は null)
+    payload は results_payload() で作成した採点結果の JSON 配列
+    """
+    head = json.dumps({'submission_id': submission_id and submission_id.hex}, separators=(',', ':')).encode()
+    return head[:-1] + b',"results":' + payload + b'}'
+
+
+def _is_truthy(value):
+    """
+    クエリパラメータのフラグ (1 / true / yes) を判定する
+    """
+    return (value or '').lower() in ('1', 'true', 'yes')
 
 
 class IndexView(TemplateView):
@@ -26,18 +95,33 @@ class QuizAPIView(APIView):
     # 認証: ログインしているユーザーのみアクセス許可
     permission_classes = [IsAuthenticated]
 
+    # 問題の読み込みはレプリカから (DATABASE_REPLICA_URLS が無ければ default)
+    @read_from_replica
     def get(self, request, *args, **kwargs):
         """
         GETリクエスト（クイズ取得）に応答する
+        任意のクエリパラメータ: mode, part, min_difficulty, max_difficulty, passages
+        例: /api/quiz/?part=PART5&min_difficulty=500&max_difficulty=700
+            /api/quiz/?mode=adaptive (能力値に合った未解答の問題を出題)
+            /api/quiz/?part=PART7&passages=1 ({"questions": [...], "passages": [...]}。長文は1回だけ返す)
         """
-        # ランダムに10件取得
-        questions = Question.objects.order_by('?')[:10]
+        try:
+            mode, filters = parse_quiz_params(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
-        # 1. で作成したシリアライザを使ってJSONに変換 (many=True で複数件対応)
-        serializer = QuestionSerializer(questions, many=True)
+        if mode == 'adaptive':
+            # ユーザーの能力値に対して最も情報量の多い未解答の問題を10件
+            question_ids = select_question_ids(request.user, QUIZ_SIZE, **filters)
+        else:
+            # ランダムに10件取得
+            # (ORDER BY RANDOM() はテーブル全体をソートするため、メモリ上のIDインデックスから抽出する)
+            question_ids = question_sampler.sample_ids(QUIZ_SIZE, **filters)
 
-        # JSONデータをレスポンスとして返す
-        return Response(serializer.data)
+        # QuestionSerializer(many=True) と同じ JSON を、問題ごとに作成済みの JSON を連結して返す
+        # (キャッシュに無い問題だけを取得・シリアライズする)
+        payload = questions_payload(question_ids, passages=_is_truthy(request.query_params.get('passages')))
+        return HttpResponse(payload, content_type='application/json')
 
     def post(self, request, *args, **kwargs):
         """
@@ -48,6 +132,53 @@ class QuizAPIView(APIView):
         return Response({"message": "採点APIはまだ実装されていません"}, status=400)
     
 
+class ReviewQuizAPIView(APIView):
+    """
+    復習期限が来た問題 (間違えた問題・間隔をあけて解き直す問題) を期限の古い順に10件返すAPIビュー
+    (レスポンスの形式は QuizAPIView と同じ (?passages=1 にも対応)。期限が来た問題が無ければ空のリスト)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        # (user, next_due) のインデックスの範囲検索1回で取得する
+        question_ids = due_question_ids(request.user, QUIZ_SIZE)
+        payload = questions_payload(question_ids, passages=_is_truthy(request.query_params.get('passages')))
+        return HttpResponse(payload, content_type='application/json')
+
+
+class QuizPackAPIView(APIView):
+    """
+    オフライン用の問題パック (問題バンク全体か ?part= のパート) を圧縮済みのJSONで返すAPIビュー
+    クライアントはパックから問題を抽出して解き、採点だけ /api/quiz/submit/ に送る
+
+    ETag (内容のハッシュ) を If-None-Match で送れば、変更が無い場合は 304 を返す。
+    ?since=<手元のバージョン> を付けると、追加・変更された問題と削除された問題IDだけを返す
+    (レスポンスに "base" が無ければ全件なので、手元のパックを置き換える)。
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        part = request.query_params.get('part') or None
+        if part is not None and part not in dict(Question.PART_CHOICES):
+            return Response({"error": "パートの指定が不正です。"}, status=400)
+
+        pack = question_packs.get(part, since=request.query_params.get('since') or None)
+        # 圧縮の有無で本文が変わるので弱い ETag にする (比較も W/ を除いて行う)
+        etag = 'W/' + quote_etag(pack.version)
+        if etag[2:] in [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]:
+            response = HttpResponseNotModified()
+        else:
+            body, encoding = pack.body(request.headers.get('Accept-Encoding', ''))
+            response = HttpResponse(body, content_type='application/json')
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        # 認証が必要なので共有キャッシュには置かせず、毎回 ETag で確認させる
+        patch_vary_headers(response, ['Accept-Encoding'])
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
 class QuizSubmitAPIView(APIView):
     """
     クイズの解答を受け取り、採点してResultを保存するAPIビュー
@@ -62,54 +193,42 @@ class QuizSubmitAPIView(APIView):
         #   {"question_id": 12, "selected_answer": "C"}, ...
         # ]
         answers_data = request.data 
+        passages = _is_truthy(request.query_params.get('passages'))
 
         if not isinstance(answers_data, list):
             return Response({"error": "不正なデータ形式です。"}, status=400)
 
-        result_ids = []
-        question_ids = [ans['question_id'] for ans in answers_data if 'question_id' in ans]
-
-        # 関連する Question を一括で取得 (効率化)
-        questions = Question.objects.filter(id__in=question_ids).in_bulk()
-
-        results_to_create_or_update = []
-        for answer_data in answers_data:
-            question_id = answer_data.get('question_id')
-            selected_answer = answer_data.get('selected_answer')
-            question = questions.get(question_id)
-
-            if not question or not selected_answer:
-                continue # 不正なデータはスキップ
-
-            is_correct = (selected_answer == question.correct_answer)
-            
-            # update_or_create を直接使うのではなく、後で一括処理する準備
-            results_to_create_or_update.append(
-                Result(
-                    user=user,
-                    question=question,
-                    selected_answer=selected_answer,
-                    is_correct=is_correct
-                )
-            )
+        # この後の /api/results/ などの読み取りを、しばらくプライマリに向ける (自分の解答が見えるように)
+        pin_to_primary(user)
 
-        # bulk_update または bulk_create でDBへの書き込みを効率化 (ここは少し複雑なので、単純化も可)
-        # ここでは単純化のため、１件ずつ update_or_create する
-        for result_obj in results_to_create_or_update:
-             result, created = Result.objects.update_or_create(
-                user=result_obj.user,
-                question=result_obj.question,
-                defaults={
-                    'selected_answer': result_obj.selected_answer,
-                    'is_correct': result_obj.is_correct
-                }
-            )
-             result_ids.append(result.id)
+        # 保存を遅らせるモード (SUBMIT_SPOOL_DIR): メモリ上の正解で採点してスプールに追記し、採点結果をすぐに返す
+        # (Result はまだ無いので result_ids は返さない。保存されると results の id 以外は /api/results/ と同じになる)
+        if spool_enabled():
+            submission_id, results = spool_answers(user, answers_data)
+            body = spooled_payload(submission_id, results_payload(results, passages=passages))
+            return HttpResponse(body, content_type='application/json', status=202)
+
+        # 採点 (関連する Question は in_bulk で一括取得)
+        results = grade_answers(user, answers_data)
 
+        # (user, question) をキーにした1回の一括 UPSERT で保存し、
+        # 能力値と成績集計も同じトランザクションで更新する
+        results = record_results(user, results)
+        result_ids = [result.id for result in results]
 
         # 採点した Result の ID リストをセッションに保存 (これはVue側で状態管理するため不要かも)
         # request.session['latest_result_ids'] = result_ids 
-        
+
+        # graded モード (/api/quiz/submit/?graded=1):
+        # /api/results/ を呼び直さなくて済むよう、採点結果をそのまま返す
+        # (Question は採点時に in_bulk で取得済みなので、追加のクエリは発生しない)
+        if _is_truthy(request.query_params.get('graded')):
+            payload = results_payload(
+                results, questions={result.question_id: result.question for result in results}, passages=passages,
+            )
+            body = b'{"result_ids":' + json_array(str(result_id).encode() for result_id in result_ids) + b',"results":' + payload + b'}'
+            return HttpResponse(body, content_type='application/json', status=201)
+
         # 代わりに、作成された Result の ID リストを返す
         return Response({"result_ids": result_ids}, status=201) # 201 Created
 
@@ -120,6 +239,8 @@ class QuizResultAPIView(APIView):
     """
     permission_classes = [IsAuthenticated]
 
+    # 直前に解答を送信したユーザーは、レプリカの遅延で結果が見えないことがないようプライマリから読む (pin_to_primary)
+    @read_from_replica
     def get(self, request, *args, **kwargs):
         # Vueから GET パラメータで result_ids を受け取る想定
         # 例: /api/results/?ids=10,15,22,...
@@ -140,11 +261,108 @@ class QuizResultAPIView(APIView):
         )
         
         # ログインユーザー自身の、指定されたIDの結果のみを取得し、順序を保持
+        # (問題の内容はキャッシュ済みの JSON を使うので JOIN しない)
         results = Result.objects.filter(
             id__in=result_ids, 
             user=user # 他のユーザーの結果を見せないように
-        ).select_related('question').order_by(preserved_order)
+        ).order_by(preserved_order).values(
+            'id', 'user_id', 'question_id', 'selected_answer', 'is_correct', 'answered_at'
+        )
 
-        # ResultSerializer を使ってJSONに変換
-        serializer = ResultSerializer(results, many=True)
+        # ResultSerializer(many=True) と同じ JSON を返す
+        # (?passages=1 なら {"results": [...], "passages": [...]}。長文は1回だけ返す)
+        payload = results_payload(results, passages=_is_truthy(request.query_params.get('passages')))
+        return HttpResponse(payload, content_type='application/json')
+
+
+class UserStatsAPIView(APIView):
+    """
+    ログインユーザーの成績集計 (正答率・連続学習日数など) を返すAPIビュー
+    (UserStats を主キー検索1回で取得するだけで、Result の集計は行わない)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        stats = UserStats.objects.filter(user=request.user).first() or UserStats(user=request.user)
+        serializer = UserStatsSerializer(stats)
         return Response(serializer.data)
+
+
+def _leaderboard_row(rank, correct, answered, user_id=None, username=None):
+    row = {
+        'rank': rank,
+        'correct': correct,
+        'answered': answered,
+        'accuracy': round(accuracy(correct, answered), 4),
+    }
+    if user_id is not None:
+        row = {'user_id': user_id, 'username': username, **row}
+    return row
+
+
+class LeaderboardAPIView(APIView):
+    """
+    ランキング (全期間・週間) の上位とログインユーザーの順位を返すAPIビュー
+    ?board=global|weekly (&week=2026-W42) &metric=correct|accuracy &limit=10
+    (上位と順位はプロセス内のスナップショットから求め、DBへの問い合わせは自分のスコアの1回だけ)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        board = request.query_params.get('board', GLOBAL_BOARD)
+        if board == 'weekly':
+            board = request.query_params.get('week') or week_board()
+        if not is_board(board):
+            return Response({"error": "ランキングの指定が不正です。"}, status=400)
+
+        metric = request.query_params.get('metric', 'correct')
+        if metric not in METRICS:
+            return Response({"error": "ランキングの指標の指定が不正です。"}, status=400)
+
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return Response({"error": "件数の指定が不正です。"}, status=400)
+        limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+
+        correct, answered = (
+            LeaderboardEntry.objects.filter(board=board, user=request.user)
+            .values_list('correct', 'answered').first()
+        ) or (0, 0)
+
+        return Response({
+            'board': board,
+            'metric': metric,
+            'total': leaderboard.total(board, metric),
+            'top': [
+                _leaderboard_row(rank, row_correct, row_answered, user_id, username)
+                for rank, (user_id, username, row_correct, row_answered) in leaderboard.top(board, metric, limit)
+            ],
+            'me': _leaderboard_row(leaderboard.rank(board, metric, correct, answered), correct, answered),
+        })
+
+
+@staff_member_required
+def export_view(request, kind):
+    """
+    問題・解答履歴を書き出しながら返すダウンロード (管理者のみ)
+    /admin/export/<questions|results>/?format=csv|jsonl&gzip=1&since=2026-10-01
+    (export_data コマンドと同じ内容。全件をメモリに載せずに少しずつ送る)
+    """
+    if kind not in EXPORTS:
+        raise Http404
+    format = request.GET.get('format', 'csv')
+    if format not in FORMATS:
+        return HttpResponseBadRequest("出力形式の指定が不正です。")
+    compress = _is_truthy(request.GET.get('gzip'))
+    try:
+        since = parse_since(request.GET['since']) if request.GET.get('since') else None
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(
+        export_chunks(kind, format, compress, since),
+        content_type='application/gzip' if compress else CONTENT_TYPES[format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(kind, format, compress)}"'
+    return response
@@ -0,0 +1,17 @@
+'use strict';
+{
+    // 絞り込みのオートコンプリートで選択したら、その値をクエリ文字列に入れて一覧を開き直す
+    // (ページ番号は引き継がない)
+    window.addEventListener('load', function() {
+        django.jQuery('.autocomplete-filter select').on('change', function() {
+            const params = new URLSearchParams(window.location.search);
+            params.delete('p');
+            if (this.value) {
+                params.set(this.dataset.lookup, this.value);
+            } else {
+                params.delete(this.dataset.lookup);
+            }
+            window.location.search = params.toString();
+        });
+    });
+}